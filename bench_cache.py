@@ -0,0 +1,94 @@
+"""
+Benchmark of dashboard loads with a cold versus warm lead cache.
+
+    python bench_cache.py --dataset 5000 --loads 200 --latency 0.01
+
+A dashboard load is what the app fires on open: /health, /stats,
+/pipeline and the first /leads page, side by side. The API runs in this
+process (ASGI transport) against the in-memory PostgREST stand-in, which
+adds --latency to every request. Three set-ups:
+
+    cold          every cache emptied before each load (lead cache, /stats, pipeline snapshot)
+    warm          caches left as they are
+    warm+writes   warm, with a one-lead /sync between loads (write-through keeps it warm)
+
+Reports latency per load, upstream requests per load and the lead cache's
+hit rate. Every load is also checked against a cold one: same leads, same order.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+from fake_postgrest import FakePostgREST, serve_in_thread
+
+DASHBOARD = ("/health", "/stats", "/pipeline", "/leads?limit=50")
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def main(args, fake: FakePostgREST):
+    from cache import stats_cache
+    from lead_cache import lead_cache
+    from main import app
+    from metrics import CACHE_REQUESTS
+    from pipeline import pipeline_snapshot
+
+    async def empty_caches():
+        lead_cache.clear()
+        lead_cache.checked_at = 0.0
+        await stats_cache.invalidate()
+        pipeline_snapshot.clear()
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://api") as client:
+        async def load() -> list:
+            responses = await asyncio.gather(*(client.get(path) for path in DASHBOARD))
+            for response in responses:
+                assert response.status_code == 200 and "error" not in response.text[:20], response.text[:200]
+            return [response.json() for response in responses]
+
+        print(f"{'setup':<12} {'mean ms':>8} {'p50 ms':>8} {'p99 ms':>8} {'upstream/load':>14} {'page hit rate':>14}")
+        for setup in ("cold", "warm", "warm+writes"):
+            await empty_caches()
+            await load()
+            latencies, upstream, hits, misses = [], 0, CACHE_REQUESTS.value("page", "hit"), CACHE_REQUESTS.value("page", "miss")
+            for i in range(args.loads):
+                if setup == "cold":
+                    await empty_caches()
+                elif setup == "warm+writes":
+                    response = await client.post("/sync", json={"leads": [{"name": f"Bench Lead {i}", "email": f"cache{i}@bench.dev"}]})
+                    assert response.json().get("new_records") == 1, response.text
+                    await asyncio.sleep(0)
+                before = fake.requests
+                started = time.perf_counter()
+                pages = await load()
+                latencies.append(time.perf_counter() - started)
+                upstream += fake.requests - before
+                if i % 50 == 0:
+                    await empty_caches()
+                    assert [lead["id"] for lead in (await load())[3]] == [lead["id"] for lead in pages[3]], "stale /leads page"
+            hits = CACHE_REQUESTS.value("page", "hit") - hits
+            misses = CACHE_REQUESTS.value("page", "miss") - misses
+            print(f"{setup:<12} {sum(latencies) / len(latencies) * 1000:>8.2f} {percentile(latencies, 50) * 1000:>8.2f} "
+                  f"{percentile(latencies, 99) * 1000:>8.2f} {upstream / args.loads:>14.2f} {hits / max(1, hits + misses):>14.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", type=int, default=5000)
+    parser.add_argument("--loads", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.01, help="Seconds added to every upstream request.")
+    args = parser.parse_args()
+
+    fake = FakePostgREST(latency=args.latency)
+    fake.seed(args.dataset)
+    _, upstream = serve_in_thread(fake.app)
+    os.environ["SUPABASE_URL"] = upstream
+    os.environ.setdefault("SUPABASE_KEY", "bench")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    asyncio.run(main(args, fake))
@@ -0,0 +1,83 @@
+"""
+Benchmarks duplicate matching cost as the leads table grows.
+
+    python bench_dedup.py --sizes 10000,100000,1000000
+
+For each table size the BlockingIndex is filled with synthetic leads (the
+in-memory equivalent of the dedup_candidates lookup) and a batch of
+incoming leads, a third of them near-duplicates (so expect about batch/3
+found), is matched against it. Per-lead cost should stay flat; a brute-force cdist over every name is
+shown for comparison where it is affordable.
+"""
+import argparse
+import random
+import time
+import uuid
+
+from rapidfuzz import fuzz, process
+
+from dedup import BlockingIndex, normalize_name
+
+FIRST = ["Rahul", "Priya", "Amit", "Sneha", "Vikram", "Anjali", "Rohan", "Neha", "Arjun", "Kavya",
+         "Rajesh", "Pooja", "Sanjay", "Divya", "Karan", "Meera", "Aditya", "Isha", "Nikhil", "Riya"]
+LAST = ["Sharma", "Patel", "Mehta", "Shah", "Gupta", "Iyer", "Reddy", "Jain", "Singh", "Nair",
+        "Kapoor", "Desai", "Joshi", "Bose", "Rao", "Malhotra", "Verma", "Agarwal", "Kulkarni", "Das"]
+DOMAINS = ["gmail.com"] * 6 + ["yahoo.co.in", "outlook.com", "hotmail.com", "rediffmail.com",
+                               "finideas.com", "tcs.com", "infosys.com", "icloud.com"]
+
+
+def make_lead(i: int) -> dict:
+    # A random middle token keeps the vocabulary from being unrealistically small.
+    middle = "".join(random.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(6))
+    name = f"{random.choice(FIRST)} {middle} {random.choice(LAST)}"
+    return {
+        "id": str(uuid.uuid4()),
+        "name": name,
+        "email": f"lead{i}@{random.choice(DOMAINS)}",
+        "phone": f"+91 9{random.randrange(10 ** 9):09d}",
+    }
+
+
+def near_duplicate(lead: dict) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "name": lead["name"].lower(),
+        "email": None,
+        "phone": lead["phone"].replace("+91 ", ""),
+    }
+
+
+def run(sizes: list[int], batch: int, brute_force_limit: int):
+    random.seed(7)
+    print(f"{'table':>9} {'build s':>8} {'match us/lead':>14} {'dupes found':>12} {'brute us/lead':>14}")
+    for size in sizes:
+        table = [make_lead(i) for i in range(size)]
+        index = BlockingIndex()
+        started = time.perf_counter()
+        index.add_many(table)
+        build = time.perf_counter() - started
+
+        incoming = [near_duplicate(random.choice(table)) if i % 3 == 0 else make_lead(size + i) for i in range(batch)]
+        started = time.perf_counter()
+        found = index.match(incoming)
+        per_lead = (time.perf_counter() - started) / batch * 1e6
+
+        brute = "-"
+        if size <= brute_force_limit:
+            sample = incoming[:50]
+            names = [normalize_name(lead["name"]) for lead in table]
+            started = time.perf_counter()
+            process.cdist([normalize_name(lead["name"]) for lead in sample], names, scorer=fuzz.token_sort_ratio)
+            brute = f"{(time.perf_counter() - started) / len(sample) * 1e6:.0f}"
+
+        print(f"{size:>9} {build:>8.2f} {per_lead:>14.1f} {sum(1 for f in found if f):>12} {brute:>14}")
+        del table, index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--batch", type=int, default=2000)
+    parser.add_argument("--brute-force-limit", type=int, default=100000)
+    args = parser.parse_args()
+    run([int(s) for s in args.sizes.split(",")], args.batch, args.brute_force_limit)
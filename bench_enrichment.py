@@ -0,0 +1,78 @@
+"""
+Benchmark for the enrichment pipeline, with per-stage throughput.
+
+    python bench_enrichment.py --leads 5000 --latency 0.01
+
+Runs the same leads through enrichment.EnrichmentPipeline against the
+in-memory PostgREST stand-in (each upstream request delayed by --latency)
+in four set-ups:
+
+    serial        one batch in flight per stage, no providers
+    staged        --concurrency batches per stage, no providers
+    providers     staged, with a fast mock provider
+    slow provider staged, with the fast provider and one taking --slow-delay per batch
+
+and prints how long it took until every batch was persisted (leads/sec
+from that), how long until deferred provider data was written as well,
+and each stage's throughput. Batches wait for the slow provider no longer
+than ENRICHMENT_PROVIDER_WAIT, so they are persisted well before its data
+arrives; that follows in separate writes.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from fake_postgrest import FakePostgREST, serve_in_thread
+
+
+def print_run(label: str, leads: int, seconds: float, summary: dict):
+    stages = "  ".join(f"{name} {stats['items_per_sec'] or 0:>9,.0f}/s" for name, stats in summary["stages"].items())
+    print(f"{label:<14} {summary['persisted_seconds']:>7.2f}s {leads / summary['persisted_seconds']:>9,.0f} leads/s  "
+          f"(all data {seconds:.2f}s)  {stages}")
+    for name, stats in summary["providers"].items():
+        print(f"{'':<14} provider {name}: {stats['batches']} batches, {stats['deferred']} deferred, {stats['timeouts']} timed out")
+    if summary["failures"]:
+        print(f"{'':<14} failures: {[failure['kind'] for failure in summary['failures']]}")
+
+
+async def main(args, fake: FakePostgREST):
+    from enrichment import EnrichmentPipeline, MockProvider
+    from rest import close_client
+
+    fast = MockProvider("fast", delay=args.latency)
+    slow = MockProvider("slow", delay=args.slow_delay, timeout=args.slow_delay * 10)
+    setups = (
+        ("serial", EnrichmentPipeline([], args.batch_size, 1)),
+        ("staged", EnrichmentPipeline([], args.batch_size, args.concurrency)),
+        ("providers", EnrichmentPipeline([fast], args.batch_size, args.concurrency)),
+        ("slow provider", EnrichmentPipeline([fast, slow], args.batch_size, args.concurrency)),
+    )
+    # The stand-in builds its blocking index on the first dedupe lookup; keep that out of the numbers.
+    await EnrichmentPipeline([], args.batch_size, args.concurrency).run([dict(lead) for lead in fake.leads.values()])
+    for label, pipeline in setups:
+        leads = [dict(lead, meta_data=dict(lead.get("meta_data") or {})) for lead in fake.leads.values()]
+        started = time.perf_counter()
+        summary = await pipeline.run(leads)
+        print_run(label, len(leads), time.perf_counter() - started, summary)
+    for name in ("fast", "slow"):
+        enriched = sum(1 for lead in fake.leads.values() if name in (lead.get("meta_data") or {}).get("enrichment", {}))
+        print(f"{enriched} of {len(fake.leads)} leads carry the {name} provider's data")
+    await close_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.01, help="Seconds added to every upstream request.")
+    parser.add_argument("--slow-delay", type=float, default=0.5, help="How long the slow provider takes per batch.")
+    args = parser.parse_args()
+
+    fake = FakePostgREST(latency=args.latency)
+    fake.seed(args.leads, interactions_per_lead=0)
+    _, upstream = serve_in_thread(fake.app)
+    os.environ["SUPABASE_URL"] = upstream
+    os.environ.setdefault("SUPABASE_KEY", "bench")
+    asyncio.run(main(args, fake))
@@ -0,0 +1,106 @@
+"""
+Benchmarks fan-out of server-sent events.
+
+    python bench_events.py --subscribers 5000 --events 200
+    python bench_events.py --http 500
+
+The first form measures the broker alone: N in-process subscribers, a
+burst of events, and the time until every subscriber has drained them.
+Some subscribers never read, to show that slow clients are cut back to a
+single resync instead of growing without bound.
+
+--http opens N real /events connections to the API (started locally
+against fake_postgrest.py), sends one /sync and reports how long it takes
+until every connection has seen the lead.created event.
+"""
+import argparse
+import asyncio
+import os
+import time
+import tracemalloc
+
+import httpx
+
+
+async def bench_broker(subscribers: int, events: int, stalled_every: int):
+    from events import EventBroker
+
+    broker = EventBroker()
+    tracemalloc.start()
+    subs = [broker.subscribe() for _ in range(subscribers)]
+    readers = [s for i, s in enumerate(subs) if not stalled_every or i % stalled_every]
+
+    published = received = 0
+    started = time.perf_counter()
+    for n in range(events):
+        before = time.perf_counter()
+        broker.publish("lead.created", {"leads": [{"id": str(n), "name": f"Lead {n}", "status": "New"}]})
+        published += time.perf_counter() - before
+        # Readers keep up; stalled subscribers fill their buffer and get cut back to a resync.
+        for subscriber in readers:
+            while not subscriber.queue.empty():
+                subscriber.queue.get_nowait()
+                received += 1
+    drained = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{subscribers} subscribers ({subscribers - len(readers)} stalled), {events} events")
+    print(f"  publish            {published * 1000:>9.1f} ms  ({published / events * 1e6:.0f} us/event)")
+    print(f"  publish + drain    {drained * 1000:>9.1f} ms  ({received} frames delivered)")
+    print(f"  peak memory        {peak / 2**20:>9.1f} MiB")
+    print(f"  resyncs            {sum(s.dropped for s in subs):>9}")
+
+
+async def bench_http(connections: int, latency: float):
+    from fake_postgrest import FakePostgREST, serve_in_thread
+
+    _, upstream = serve_in_thread(FakePostgREST(latency=latency).app)
+    os.environ["SUPABASE_URL"] = upstream
+    os.environ.setdefault("SUPABASE_KEY", "bench")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    from main import app
+    _, base_url = serve_in_thread(app)
+
+    seen = asyncio.Event()
+    arrived = []
+
+    async def listen(client: httpx.AsyncClient, ready: asyncio.Event):
+        async with client.stream("GET", f"{base_url}/events", params={"types": "lead.created"}) as response:
+            ready.set()
+            async for line in response.aiter_lines():
+                if line == "event: lead.created":
+                    arrived.append(time.perf_counter())
+                    if len(arrived) == connections:
+                        seen.set()
+                    return
+
+    limits = httpx.Limits(max_connections=connections + 10)
+    async with httpx.AsyncClient(timeout=None, limits=limits) as client:
+        readies = [asyncio.Event() for _ in range(connections)]
+        tasks = [asyncio.create_task(listen(client, ready)) for ready in readies]
+        await asyncio.gather(*(ready.wait() for ready in readies))
+        info = (await client.get(f"{base_url}/events/info")).json()
+        print(f"{info['subscribers']} connections open")
+
+        started = time.perf_counter()
+        await client.post(f"{base_url}/sync", json={"leads": [{"name": "Push Test", "email": "push@example.com"}]})
+        await asyncio.wait_for(seen.wait(), 60)
+        arrived.sort()
+        print(f"  first delivery     {(arrived[0] - started) * 1000:>9.1f} ms")
+        print(f"  all delivered      {(arrived[-1] - started) * 1000:>9.1f} ms")
+        await asyncio.gather(*tasks)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, default=5000)
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--stalled-every", type=int, default=10, help="Every Nth subscriber never reads.")
+    parser.add_argument("--http", type=int, default=0, help="Open this many real /events connections instead.")
+    parser.add_argument("--latency", type=float, default=0.002)
+    args = parser.parse_args()
+    if args.http:
+        asyncio.run(bench_http(args.http, args.latency))
+    else:
+        asyncio.run(bench_broker(args.subscribers, args.events, args.stalled_every))
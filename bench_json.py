@@ -0,0 +1,78 @@
+"""
+Microbenchmark for the /leads and /pipeline response path.
+
+    python bench_json.py --rows 1000,10000,50000
+
+For a PostgREST body of --rows leads, compares the previous path
+(response.json(), timestamps rewritten in place, jsonable_encoder and
+JSONResponse) with fastjson (orjson decode, the same rewrite, bytes
+straight into JSONBytesResponse). Reports time and tracemalloc peak; both
+paths must produce the same JSON.
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import fastjson
+from fake_postgrest import FakePostgREST
+from fastjson import JSONBytesResponse
+from main import localize
+from timefmt import to_ist
+
+
+def upstream_body(rows: int) -> bytes:
+    fake = FakePostgREST()
+    fake.seed(rows)
+    return json.dumps(list(fake.leads.values())).encode()
+
+
+def previous_path(body: bytes) -> bytes:
+    # httpx's response.json() decodes the body to str, then json.loads().
+    leads = json.loads(body.decode("utf-8"))
+    localize(leads, in_sql=False)
+    return JSONResponse(jsonable_encoder(leads)).body
+
+
+def fast_path(body: bytes) -> bytes:
+    leads = fastjson.loads(body)
+    localize(leads, in_sql=False)
+    return JSONBytesResponse(leads).body
+
+
+def measure(fn, body: bytes, repeat: int) -> tuple:
+    best = float("inf")
+    for _ in range(repeat):
+        to_ist.cache_clear()
+        started = time.perf_counter()
+        fn(body)
+        best = min(best, time.perf_counter() - started)
+    to_ist.cache_clear()
+    tracemalloc.start()
+    out = fn(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="1000,10000,50000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'rows':>7} {'path':<9} {'ms':>9} {'peak MiB':>9}")
+    for rows in [int(r) for r in args.rows.split(",")]:
+        body = upstream_body(rows)
+        baseline = None
+        outputs = []
+        for label, fn in (("previous", previous_path), ("fastjson", fast_path)):
+            seconds, peak, out = measure(fn, body, args.repeat)
+            outputs.append(json.loads(out))
+            speedup = f"  {baseline / seconds:.1f}x" if baseline else ""
+            baseline = baseline or seconds
+            print(f"{rows:>7} {label:<9} {seconds * 1000:>9.1f} {peak / 2**20:>9.1f}{speedup}")
+        assert outputs[0] == outputs[1], "paths disagree"
@@ -0,0 +1,254 @@
+"""
+Load test for the API: p50/p99 latency and requests/sec per endpoint.
+
+Against a running server (e.g. the previous release, for a before/after):
+    python bench_load.py --url http://127.0.0.1:8000 --endpoints /health,/stats
+
+Without --url the API and a local PostgREST stand-in are started in-process,
+seeded with --dataset leads. --no-keepalive then disables upstream
+connection reuse, which approximates the old client-per-request behaviour.
+
+/sync is exercised with POSTs of --sync-batch generated leads, a tenth of
+which reuse an email already sent so the duplicate path is hit. Every other
+endpoint is a GET and may carry a query string (e.g. "/leads?limit=500").
+
+    python bench_load.py --dataset 20000 --concurrency 16,64 --json results.json
+
+--json writes the run configuration and one record per endpoint and
+concurrency level, for tracking regressions between commits.
+
+--workers runs the API as that many processes (`uvicorn --workers`, the
+same model as gunicorn.conf.py) sharing a SQLite cache, once per count,
+to show how throughput scales with cores:
+
+    python bench_load.py --workers 1,2,4 --endpoints /stats,/leads,/sync
+
+The stand-in then runs in its own process and is itself single-core, so
+keep its --latency realistic or it becomes the ceiling.
+"""
+import argparse
+import asyncio
+import json
+import os
+import itertools
+import platform
+import statistics
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def sync_payloads(batch: int):
+    """Endless /sync bodies; every tenth lead repeats an earlier email."""
+    for n in itertools.count():
+        leads = []
+        for i in range(batch):
+            k = n * batch + i
+            email = f"load_{k - 1 if k and k % 10 == 0 else k}@example.com"
+            leads.append({"name": f"Load Lead {k}", "email": email, "phone": f"96{k:08d}",
+                          "notes": "HNI, immediate" if k % 3 == 0 else "call later"})
+        yield {"leads": leads}
+
+
+async def hammer(base_url: str, path: str, total: int, concurrency: int, sync_batch: int = 50) -> dict:
+    latencies, errors = [], 0
+    queue = iter(range(total))
+    bodies = sync_payloads(sync_batch) if path.startswith("/sync") else None
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal errors
+        for _ in queue:
+            started = time.perf_counter()
+            try:
+                if bodies is not None:
+                    response = await client.post(f"{base_url}{path}", json=next(bodies))
+                else:
+                    response = await client.get(f"{base_url}{path}")
+                # Handlers report upstream failures as 200 {"error": ...}.
+                if response.status_code >= 400 or (response.headers.get("content-type", "").startswith("application/json")
+                                                   and isinstance(response.json(), dict) and "error" in response.json()):
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(timeout=60.0, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    result = {
+        "endpoint": path,
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p90_ms": round(percentile(latencies, 90) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+    }
+    if bodies is not None:
+        result["leads_per_sec"] = round(total * sync_batch / elapsed, 1)
+    return result
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def start_local_stack(args) -> tuple:
+    from fake_postgrest import FakePostgREST, serve_in_thread
+
+    fake = FakePostgREST(latency=args.latency, jitter=args.jitter)
+    fake.seed(args.dataset)
+    _, upstream = serve_in_thread(fake.app)
+    os.environ["SUPABASE_URL"] = upstream
+    os.environ.setdefault("SUPABASE_KEY", "bench")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    if args.no_keepalive:
+        os.environ["HTTP_MAX_KEEPALIVE"] = "0"
+
+    from main import app
+    _, base_url = serve_in_thread(app)
+    return base_url, fake
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url: str, process: subprocess.Popen):
+    while True:
+        if process.poll() is not None:
+            raise SystemExit(f"{process.args[:4]} exited with {process.returncode}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+
+
+def start_upstream_process(args) -> tuple:
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "fake_postgrest.py", "--port", str(port), "--latency", str(args.latency),
+         "--jitter", str(args.jitter), "--seed", str(args.dataset)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    upstream = f"http://127.0.0.1:{port}"
+    wait_until_up(f"{upstream}/rest/v1/leads?limit=1", process)
+    return upstream, process
+
+
+def start_api_processes(upstream: str, workers: int, cache_dir: str) -> tuple:
+    port = free_port()
+    env = {
+        **os.environ,
+        "SUPABASE_URL": upstream,
+        "SUPABASE_KEY": os.environ.get("SUPABASE_KEY", "bench"),
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+        "CACHE_BACKEND": "sqlite",
+        "CACHE_PATH": os.path.join(cache_dir, f"cache_{workers}.db"),
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning", "--no-access-log"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    wait_until_up(f"{base_url}/health", process)
+    return base_url, process
+
+
+async def run_levels(base_url: str, args, fake=None, workers=None) -> list:
+    results = []
+    for concurrency in [int(c) for c in str(args.concurrency).split(",")]:
+        for path in args.endpoints.split(","):
+            upstream_before = fake.requests if fake else 0
+            result = await hammer(base_url, path, args.requests, concurrency, args.sync_batch)
+            if fake:
+                result["upstream_requests"] = fake.requests - upstream_before
+            if workers:
+                result["workers"] = workers
+            results.append(result)
+            label = f"w={workers:<3} " if workers else ""
+            print(f"{path:<16} {label}c={concurrency:<4} {result['rps']:>9.1f} req/s  p50 {result['p50_ms']:>8.2f} ms  "
+                  f"p99 {result['p99_ms']:>8.2f} ms  errors {result['errors']}")
+    return results
+
+
+async def main(args):
+    results = []
+    if args.workers:
+        upstream, upstream_process = start_upstream_process(args)
+        cache_dir = tempfile.mkdtemp()
+        try:
+            for workers in [int(w) for w in args.workers.split(",")]:
+                base_url, api = start_api_processes(upstream, workers, cache_dir)
+                try:
+                    results += await run_levels(base_url, args, workers=workers)
+                finally:
+                    api.terminate()
+                    api.wait()
+        finally:
+            upstream_process.terminate()
+    elif args.url:
+        results = await run_levels(args.url, args)
+    else:
+        base_url, fake = start_local_stack(args)
+        results = await run_levels(base_url, args, fake)
+
+    if args.json:
+        report = {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "target": args.url or "local",
+            "cpus": os.cpu_count(),
+            "config": {
+                "dataset": None if args.url else args.dataset,
+                "latency": None if args.url else args.latency,
+                "jitter": None if args.url else args.jitter,
+                "keepalive": not args.no_keepalive,
+                "workers": args.workers,
+                "requests": args.requests,
+                "sync_batch": args.sync_batch,
+            },
+            "results": results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Base URL of a running API. Omit to start one locally.")
+    parser.add_argument("--endpoints", default="/health,/stats,/leads,/pipeline,/sync")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per endpoint and concurrency level.")
+    parser.add_argument("--concurrency", default="32", help="One level, or several separated by commas.")
+    parser.add_argument("--dataset", type=int, default=5000, help="Leads seeded into the stand-in (local mode).")
+    parser.add_argument("--sync-batch", type=int, default=50, help="Leads per /sync request.")
+    parser.add_argument("--latency", type=float, default=0.002, help="Injected upstream latency (local mode).")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random upstream latency, up to this (local mode).")
+    parser.add_argument("--workers", help="Run the API as this many processes, e.g. 1,2,4 (local mode).")
+    parser.add_argument("--no-keepalive", action="store_true", help="Disable upstream keep-alive (local mode).")
+    parser.add_argument("--json", help="Write results to this file.")
+    asyncio.run(main(parser.parse_args()))
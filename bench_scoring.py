@@ -0,0 +1,109 @@
+"""
+Benchmarks batch lead scoring.
+
+    python bench_scoring.py --leads 100000 --extra-rules 300
+
+Scores the same synthetic leads with the shipped rules (checked against
+the original hard-coded scorer), with a few hundred generated keyword,
+pattern and location rules on top, and with ten times as many again.
+
+Exits non-zero if the large rule set takes longer than --budget seconds
+per 100k leads, or if ten times the extra rules costs more than
+--max-growth times as much.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+from scoring import DEFAULT_RULES_PATH, ScoringEngine
+
+WORDS = ["portfolio", "mutual", "fund", "equity", "sip", "retirement", "insurance", "tax", "loan",
+         "property", "gold", "bonds", "startup", "family", "office", "nri", "pension", "crypto"]
+CITIES = ["Mumbai", "Pune", "Delhi", "Bengaluru", "Chennai", "Hyderabad", "Ahmedabad", "Surat"]
+
+
+def legacy_score(lead: dict) -> int:
+    score = 0
+    if lead.get("email"): score += 10
+    if lead.get("phone"): score += 10
+    notes = (lead.get("notes") or "").lower()
+    high_intent = ["hni", "investment", "portfolio", "jito", "immediate"]
+    if any(word in notes for word in high_intent):
+        score += 30
+    return score
+
+
+def make_leads(count: int) -> list[dict]:
+    random.seed(11)
+    return [{
+        "email": f"lead{i}@example.com" if i % 3 else None,
+        "phone": f"98{i:08d}" if i % 4 else None,
+        "role": random.choice(["Founder & CEO", "Analyst", "VP Finance", "Student", "Doctor"]),
+        "notes": " ".join(random.choice(WORDS + ["hni", "immediate", "call", "later"]) for _ in range(12)),
+        "meta_data": {"location": random.choice(CITIES)},
+    } for i in range(count)]
+
+
+def extra_rules(count: int) -> list[dict]:
+    rules = [{"name": f"kw_{i}", "type": "keywords", "field": "notes",
+              "keywords": [f"{random.choice(WORDS)}{i}", random.choice(WORDS) + " " + random.choice(WORDS)],
+              "weight": 1} for i in range(count)]
+    rules.append({"name": "decision_maker", "type": "pattern", "field": "role", "pattern": r"founder|ceo|vp|director", "weight": 15})
+    rules.append({"name": "finance_role", "type": "pattern", "field": "role", "pattern": r"\bfinance\b|cfo", "weight": 5})
+    rules.append({"name": "sip_plan", "type": "pattern", "field": "notes", "pattern": r"sip\s+\w+", "weight": 5})
+    rules.append({"name": "metro", "type": "equals", "field": "meta_data.location", "values": CITIES[:4], "weight": 5})
+    return rules
+
+
+def timed(label: str, fn, repeat: int = 1) -> tuple:
+    """Best of repeat runs: (result, seconds)."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"  {label:<34} {best:>7.3f} s {best / len(result) * 1e6:>7.2f} us/lead")
+    return result, best
+
+
+def run(count: int, extra: int, repeat: int, budget: float, max_growth: float) -> list:
+    """Times each engine; returns the targets it missed."""
+    leads = make_leads(count)
+    with open(DEFAULT_RULES_PATH) as f:
+        config = json.load(f)
+    shipped = ScoringEngine(config["rules"], config["qualify_score"])
+    big = ScoringEngine(config["rules"] + extra_rules(extra), config["qualify_score"])
+    huge = ScoringEngine(config["rules"] + extra_rules(extra * 10), config["qualify_score"])
+
+    print(f"{count} leads, best of {repeat}")
+    legacy, _ = timed("legacy per-lead scorer", lambda: [legacy_score(lead) for lead in leads], repeat)
+    results, _ = timed(f"engine, {len(shipped.rules)} rules", lambda: shipped.score_batch(leads), repeat)
+    assert legacy == [r.score for r in results], "shipped rules must match the legacy scorer"
+    _, big_time = timed(f"engine, {len(big.rules)} rules", lambda: big.score_batch(leads), repeat)
+    _, huge_time = timed(f"engine, {len(huge.rules)} rules", lambda: huge.score_batch(leads), repeat)
+
+    missed = []
+    allowed = budget * count / 100000
+    if big_time > allowed:
+        missed.append(f"{len(big.rules)} rules took {big_time:.3f} s, budget {allowed:.3f} s")
+    if huge_time > big_time * max_growth:
+        missed.append(f"{len(huge.rules)} rules took {huge_time / big_time:.2f}x the {len(big.rules)}-rule time, "
+                      f"allowed {max_growth:.2f}x")
+    return missed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--leads", type=int, default=100000)
+    parser.add_argument("--extra-rules", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--budget", type=float, default=1.0, help="seconds per 100k leads with the extra rules")
+    parser.add_argument("--max-growth", type=float, default=1.5, help="allowed slowdown for ten times the extra rules")
+    args = parser.parse_args()
+    missed = run(args.leads, args.extra_rules, args.repeat, args.budget, args.max_growth)
+    for miss in missed:
+        print(f"MISSED: {miss}", file=sys.stderr)
+    sys.exit(1 if missed else 0)
@@ -0,0 +1,76 @@
+"""
+Benchmark for GET /leads/search against growing tables.
+
+    python bench_search.py --sizes 10000,50000,100000
+
+For each table size, compares what scripts did before (download every
+lead and filter client-side, as test_httpx.py does) with /leads/search,
+and times the API's own share of a search (scoring and paging the
+SEARCH_CANDIDATES candidates), which is what stays constant.
+
+The local stand-in finds candidates with a scan, so its part of the
+/leads/search time grows with the table; in Postgres the same lookups are
+index scans capped at SEARCH_CANDIDATES rows (see search_leads in schema.sql).
+"""
+import argparse
+import os
+import statistics
+import time
+
+import httpx
+
+QUERIES = ["seed lead 4242", "lead 77", "acme", "globex portfolio", "9700012345", "sed led 12"]
+
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,50000,100000")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    from fake_postgrest import FakePostgREST, serve_in_thread
+
+    fake = FakePostgREST()
+    _, upstream = serve_in_thread(fake.app)
+    os.environ["SUPABASE_URL"] = upstream
+    os.environ.setdefault("SUPABASE_KEY", "bench")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    from main import app
+    import search
+    _, base_url = serve_in_thread(app)
+
+    print(f"{'leads':>7} {'download+filter':>16} {'/leads/search':>14} {'of which API':>13}")
+    with httpx.Client(timeout=300.0) as client:
+        for size in [int(s) for s in args.sizes.split(",")]:
+            fake.reset()
+            fake.seed(size)
+
+            def download_and_filter():
+                for query in QUERIES:
+                    leads = client.get(f"{upstream}/rest/v1/leads", params={"select": "*"}).json()
+                    [lead for lead in leads if query in (lead.get("name") or "").lower()]
+
+            def search_endpoint():
+                for query in QUERIES:
+                    response = client.get(f"{base_url}/leads/search", params={"q": query})
+                    assert isinstance(response.json(), list), response.text
+
+            candidates = {query: fake.rpc_search_leads(query, search.SEARCH_CANDIDATES) for query in QUERIES}
+
+            def api_share():
+                for query in QUERIES:
+                    search.paginate(search.rank(query, candidates[query]), 20)
+
+            per_query = len(QUERIES)
+            print(f"{size:>7} {timed(download_and_filter, args.repeat) / per_query:>13.1f} ms"
+                  f" {timed(search_endpoint, args.repeat) / per_query:>11.1f} ms"
+                  f" {timed(api_share, args.repeat) / per_query:>10.2f} ms")
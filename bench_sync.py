@@ -0,0 +1,134 @@
+"""
+Benchmarks the /sync insert path against the local PostgREST stand-in.
+
+    python bench_sync.py --leads 5000 --latency 0.002
+
+Batch size 1 is equivalent to the old one-request-per-lead behaviour.
+
+    python bench_sync.py --leads 50000 --compare-stream
+
+runs the whole API instead and compares peak Python memory (tracemalloc) of
+one /sync request against /sync/stream with the same leads as NDJSON.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+import httpx
+
+from fake_postgrest import FakePostgREST, serve_in_thread
+from main import insert_leads_batched
+
+
+def make_rows(count: int, duplicate_every: int = 10) -> list[dict]:
+    rows = []
+    for i in range(count):
+        # Every Nth lead reuses an earlier email so the duplicate path is exercised.
+        n = i - 1 if duplicate_every and i and i % duplicate_every == 0 else i
+        rows.append({
+            "id": str(uuid.uuid4()),
+            "name": f"Bench Lead {i}",
+            "email": f"bench_{n}@example.com",
+            "phone": f"98{i:08d}",
+            "status": "New",
+            "meta_data": {"source": "bench_sync"},
+        })
+    return rows
+
+
+async def run(batch_sizes: list[int], count: int, latency: float):
+    fake = FakePostgREST(latency=latency)
+    server, base_url = serve_in_thread(fake.app)
+    rest_url = f"{base_url}/rest/v1/leads"
+    headers = {"Content-Type": "application/json", "Prefer": "return=representation"}
+
+    print(f"{count} leads, {latency * 1000:.1f} ms injected latency per request")
+    print(f"{'batch':>6} {'seconds':>9} {'leads/sec':>10} {'requests':>9} {'new':>6} {'skipped':>8}")
+    try:
+        for batch_size in batch_sizes:
+            fake.reset()
+            rows = make_rows(count)
+            async with httpx.AsyncClient(timeout=120.0) as client:
+                started = time.perf_counter()
+                saved, skipped = await insert_leads_batched(client, rest_url, headers, rows, batch_size)
+                elapsed = time.perf_counter() - started
+            print(f"{batch_size:>6} {elapsed:>9.2f} {count / elapsed:>10.0f} {fake.requests:>9} {len(saved):>6} {skipped:>8}")
+    finally:
+        server.should_exit = True
+
+
+def lead_payloads(count: int, prefix: str = ""):
+    prefix = prefix.strip("/").replace("/", "_")
+    return ({"name": f"Stream Lead {i}", "email": f"{prefix}_{i}@example.com", "phone": f"95{i:08d}",
+             "notes": "HNI, immediate" if i % 3 == 0 else "call later"} for i in range(count))
+
+
+def compare_stream(count: int, latency: float):
+    # The stand-in runs in its own process so its tables don't count towards the API's memory.
+    port = 54329
+    upstream = subprocess.Popen([sys.executable, "fake_postgrest.py", "--port", str(port), "--latency", str(latency)],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.environ["SUPABASE_URL"] = f"http://127.0.0.1:{port}"
+    os.environ.setdefault("SUPABASE_KEY", "bench")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # Enrichment goes to a throwaway queue so one run's background scoring doesn't overlap the next.
+    os.environ["ENRICHMENT_QUEUE"] = "sqlite"
+    os.environ["JOB_QUEUE_PATH"] = os.path.join(tempfile.mkdtemp(), "bench_jobs.db")
+    from main import app
+    _, base_url = serve_in_thread(app)
+
+    def whole_body(prefix: str):
+        return json.dumps({"leads": list(lead_payloads(count, prefix))}).encode()
+
+    def ndjson_body(prefix: str):
+        # Sent in 64 KiB pieces, as a client writing from a file would.
+        block = []
+        for lead in lead_payloads(count, prefix):
+            block.append(json.dumps(lead) + "\n")
+            if len(block) == 256:
+                yield "".join(block).encode()
+                block = []
+        yield "".join(block).encode()
+
+    try:
+        while True:
+            try:
+                httpx.get(f"http://127.0.0.1:{port}/rest/v1/leads", params={"limit": 1})
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+
+        print(f"{count} leads, {latency * 1000:.1f} ms injected latency per request")
+        print(f"{'endpoint':<14} {'seconds':>9} {'peak MiB':>9} {'new':>7}")
+        with httpx.Client(timeout=600.0) as client:
+            for path, body, content_type in (("/sync", whole_body, "application/json"),
+                                             ("/sync/stream", ndjson_body, "application/x-ndjson")):
+                tracemalloc.start()
+                started = time.perf_counter()
+                response = client.post(f"{base_url}{path}", content=body(path), headers={"Content-Type": content_type})
+                elapsed = time.perf_counter() - started
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                print(f"{path:<14} {elapsed:>9.2f} {peak / 2**20:>9.1f} {response.json().get('new_records'):>7}")
+    finally:
+        upstream.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--leads", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.002)
+    parser.add_argument("--batch-sizes", default="1,50,500,5000")
+    parser.add_argument("--compare-stream", action="store_true", help="Compare /sync with /sync/stream memory.")
+    args = parser.parse_args()
+    if args.compare_stream:
+        compare_stream(args.leads, args.latency)
+    else:
+        asyncio.run(run([int(b) for b in args.batch_sizes.split(",")], args.leads, args.latency))
@@ -0,0 +1,58 @@
+"""
+Microbenchmark for IST timestamp formatting.
+
+    python bench_timefmt.py --count 100000
+
+Compares the original per-value ZoneInfo conversion with timefmt.to_ist and
+the column-at-a-time timefmt.to_ist_many, on all-distinct timestamps and on
+a realistic column where bulk syncs share timestamps.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from timefmt import to_ist, to_ist_many
+
+
+def legacy_to_ist(utc_str: str) -> str:
+    if not utc_str: return utc_str
+    try:
+        dt = datetime.fromisoformat(utc_str.replace("Z", "+00:00"))
+        ist_dt = dt.astimezone(ZoneInfo("Asia/Kolkata"))
+        return ist_dt.strftime("%Y-%m-%d %H:%M:%S IST")
+    except:
+        return utc_str
+
+
+def make_column(count: int, distinct: int) -> list[str]:
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    pool = [(start + timedelta(seconds=i * 37, microseconds=i)).isoformat() for i in range(distinct)]
+    return [random.choice(pool) for _ in range(count)] if distinct < count else pool
+
+
+def timed(label: str, fn, values: list[str], baseline: float = None) -> float:
+    to_ist.cache_clear()
+    started = time.perf_counter()
+    fn(values)
+    elapsed = time.perf_counter() - started
+    speedup = f"{baseline / elapsed:6.1f}x" if baseline else "      -"
+    print(f"  {label:<22} {elapsed * 1000:>9.1f} ms  {speedup}")
+    return elapsed
+
+
+def run(count: int):
+    for title, distinct in (("all distinct", count), ("bulk-synced (1% distinct)", max(count // 100, 1))):
+        values = make_column(count, distinct)
+        assert [legacy_to_ist(v) for v in values[:1000]] == to_ist_many(values[:1000])
+        print(f"{count} timestamps, {title}")
+        base = timed("legacy ZoneInfo", lambda vs: [legacy_to_ist(v) for v in vs], values)
+        timed("to_ist", lambda vs: [to_ist(v) for v in vs], values, base)
+        timed("to_ist_many", to_ist_many, values, base)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=100000)
+    run(parser.parse_args().count)
@@ -0,0 +1,89 @@
+"""
+Benchmark for bulk status changes: one Kanban column of leads moved at once.
+
+    python bench_transitions.py --leads 5000 --latency 0.005 --concurrency 20
+
+Puts --leads leads in Qualified on the in-memory PostgREST stand-in (each
+request delayed by --latency) and moves them all to Meeting twice:
+
+    per lead   a status PATCH and an interactions POST for every lead,
+               --concurrency at a time (what a client had to do before)
+    bulk       one POST /leads/status, which is one transition_leads RPC
+
+Reports wall time and upstream requests for each, and checks that every
+lead moved and got exactly one "Status changed" interaction.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+from fake_postgrest import FakePostgREST, serve_in_thread
+
+
+def reset(fake: FakePostgREST, lead_ids: list):
+    for lead_id in lead_ids:
+        fake.leads[lead_id]["status"] = "Qualified"
+    fake.interactions.clear()
+
+
+def check(fake: FakePostgREST, lead_ids: list):
+    assert all(fake.leads[lead_id]["status"] == "Meeting" for lead_id in lead_ids), "not every lead moved"
+    logged = [interaction["lead_id"] for interaction in fake.interactions.values()]
+    assert sorted(logged) == sorted(lead_ids), "interactions don't match the moved leads"
+
+
+async def per_lead(lead_ids: list, concurrency: int):
+    import rest
+
+    headers = rest.auth_headers(**{"Content-Type": "application/json"})
+    slots = asyncio.Semaphore(concurrency)
+
+    async def move(lead_id: str):
+        async with slots:
+            await rest.get_client().patch(rest.rest_url("leads"), params={"id": f"eq.{lead_id}"},
+                                          headers=headers, json={"status": "Meeting"})
+            await rest.get_client().post(rest.rest_url("interactions"), headers=headers, json={
+                "lead_id": lead_id, "type": "Note", "summary": "Status changed from Qualified to Meeting",
+            })
+
+    await asyncio.gather(*(move(lead_id) for lead_id in lead_ids))
+
+
+async def main(args, fake: FakePostgREST):
+    from main import app
+    from rest import close_client
+
+    lead_ids = list(fake.leads)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://api", timeout=None) as client:
+        async def bulk():
+            body = (await client.post("/leads/status", json={"lead_ids": lead_ids, "status": "Meeting"})).json()
+            assert body.get("updated") == len(lead_ids), body
+
+        for label, run in (("per lead", lambda: per_lead(lead_ids, args.concurrency)), ("bulk", bulk)):
+            reset(fake, lead_ids)
+            before = fake.requests
+            started = time.perf_counter()
+            await run()
+            seconds = time.perf_counter() - started
+            check(fake, lead_ids)
+            print(f"{label:<9} {len(lead_ids)} leads in {seconds:>7.2f}s  {fake.requests - before:>6} upstream requests")
+    await close_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.005, help="Seconds added to every upstream request.")
+    parser.add_argument("--concurrency", type=int, default=20, help="Requests in flight for the per-lead path.")
+    args = parser.parse_args()
+
+    fake = FakePostgREST(latency=args.latency)
+    fake.seed(args.leads, interactions_per_lead=0)
+    _, upstream = serve_in_thread(fake.app)
+    os.environ["SUPABASE_URL"] = upstream
+    os.environ.setdefault("SUPABASE_KEY", "bench")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    asyncio.run(main(args, fake))
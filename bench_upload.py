@@ -0,0 +1,140 @@
+"""
+Benchmark for recording uploads: throughput and API worker memory.
+
+    python bench_upload.py --size-mb 100 --chunk-kb 1024
+
+Starts the PostgREST stand-in in-process and the API as a uvicorn
+subprocess with the local storage backend in a temp directory, opens an
+upload for a seeded interaction and streams --size-mb of audio-shaped
+bytes to PATCH /uploads/{id}. Reports MB/s and the worker's resident
+memory (VmRSS, and the VmHWM high-water mark) before and after, read from
+/proc. A second upload is cut off part way, resumed from GET /uploads/{id}
+and checked byte for byte against what was sent.
+"""
+import argparse
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench_load import free_port, wait_until_up
+from fake_postgrest import FakePostgREST, serve_in_thread
+
+
+def memory_kib(pid: int) -> dict:
+    fields = {}
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "VmHWM"):
+                fields[key] = int(value.split()[0])
+    return fields
+
+
+def payload(size: int, chunk: int, seed: int = 0):
+    """Deterministic, incompressible-ish chunks; the same seed yields the same bytes."""
+    block = hashlib.sha256(str(seed).encode()).digest() * (chunk // 32 + 1)
+    sent = 0
+    while sent < size:
+        piece = block[: min(chunk, size - sent)]
+        sent += len(piece)
+        yield piece
+
+
+def start_api(upstream: str, directory: str) -> tuple:
+    port = free_port()
+    env = {
+        **os.environ,
+        "SUPABASE_URL": upstream,
+        "SUPABASE_KEY": os.environ.get("SUPABASE_KEY", "bench"),
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+        "STORAGE_BACKEND": "local",
+        "STORAGE_LOCAL_PATH": os.path.join(directory, "storage"),
+        "UPLOAD_STATE_PATH": os.path.join(directory, "uploads.db"),
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning", "--no-access-log"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    wait_until_up(f"{base_url}/health", process)
+    return base_url, process
+
+
+def open_upload(client: httpx.Client, interaction_id: str, size: int) -> dict:
+    response = client.post(f"/interactions/{interaction_id}/recording", json={"size": size, "content_type": "audio/mpeg"})
+    body = response.json()
+    assert response.status_code == 201 and "upload_id" in body, body
+    return body
+
+
+def send(client: httpx.Client, upload_id: str, offset: int, chunks) -> dict:
+    response = client.patch(f"/uploads/{upload_id}", headers={"Upload-Offset": str(offset)}, content=chunks)
+    return response.json()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=100)
+    parser.add_argument("--chunk-kb", type=int, default=1024, help="Size of each piece the client writes.")
+    args = parser.parse_args()
+    size, chunk = args.size_mb * 2**20, args.chunk_kb * 1024
+
+    fake = FakePostgREST()
+    fake.seed(2)
+    _, upstream = serve_in_thread(fake.app)
+    interaction_ids = list(fake.interactions)
+
+    with tempfile.TemporaryDirectory() as directory:
+        base_url, process = start_api(upstream, directory)
+        try:
+            with httpx.Client(base_url=base_url, timeout=None) as client:
+                before = memory_kib(process.pid)
+                upload = open_upload(client, interaction_ids[0], size)
+                started = time.perf_counter()
+                result = send(client, upload["upload_id"], 0, payload(size, chunk))
+                seconds = time.perf_counter() - started
+                after = memory_kib(process.pid)
+                assert result["complete"], result
+                stored = os.path.join(directory, "storage", "audio-notes", result["recording_url"].split("/audio-notes/", 1)[1])
+                assert os.path.getsize(stored) == size
+                assert fake.interactions[interaction_ids[0]]["recording_url"] == result["recording_url"]
+                print(f"upload    {args.size_mb} MB in {seconds:.2f}s  {args.size_mb / seconds:,.1f} MB/s  "
+                      f"part {upload['part_size'] // 1024} KiB")
+                print(f"worker    RSS {before['VmRSS'] / 1024:.1f} -> {after['VmRSS'] / 1024:.1f} MiB  "
+                      f"peak {before['VmHWM'] / 1024:.1f} -> {after['VmHWM'] / 1024:.1f} MiB")
+
+                # Cut the second upload off about halfway, then resume from the committed offset.
+                upload = open_upload(client, interaction_ids[1], size)
+                with httpx.Client(base_url=base_url, timeout=None) as broken:
+                    def cut_short():
+                        for sent, piece in enumerate(payload(size, chunk, seed=1)):
+                            if sent * chunk >= size // 2:
+                                raise RuntimeError("connection dropped")
+                            yield piece
+                    try:
+                        send(broken, upload["upload_id"], 0, cut_short())
+                    except (RuntimeError, httpx.HTTPError):
+                        pass
+                # The server notices the dropped request a moment later and releases the upload;
+                # until then an empty PATCH is refused as busy.
+                for _ in range(50):
+                    offset = client.get(f"/uploads/{upload['upload_id']}").json()["offset"]
+                    if "error" not in send(client, upload["upload_id"], offset, b""):
+                        break
+                    time.sleep(0.1)
+                rest_of_file = b"".join(payload(size, chunk, seed=1))[offset:]
+                result = send(client, upload["upload_id"], offset, (rest_of_file[i:i + chunk] for i in range(0, len(rest_of_file), chunk)))
+                assert result["complete"], result
+                stored = os.path.join(directory, "storage", "audio-notes", result["recording_url"].split("/audio-notes/", 1)[1])
+                with open(stored, "rb") as stored_file:
+                    digest = hashlib.sha256(stored_file.read()).hexdigest()
+                assert digest == hashlib.sha256(b"".join(payload(size, chunk, seed=1))).hexdigest(), "resumed file differs"
+                print(f"resume    committed {offset / 2**20:.1f} MiB before the drop, rest sent, file matches")
+        finally:
+            process.terminate()
+            process.wait()
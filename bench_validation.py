@@ -0,0 +1,111 @@
+"""
+Benchmark for /sync request validation, in leads/sec.
+
+    python bench_validation.py --batch 10000 --rounds 5
+
+Times the previous path (EmailStr, model_dump per lead, then the status
+and meta_data fix-ups in Python) against models.lead_rows, from the raw
+JSON body to the rows sent to PostgREST, on a batch whose emails share a
+realistic handful of domains. Both paths must produce identical rows.
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, EmailStr, Field
+
+from models import SyncRequest, _email_domain, lead_rows
+
+DOMAINS = ["gmail.com", "yahoo.co.in", "outlook.com", "hotmail.com", "rediffmail.com", "icloud.com",
+           "acme.in", "globex.com", "initech.co", "Example.ORG"]
+STATUSES = ["New", "Contacted", "Qualified", "hot", None, "Meeting", "Won", "unknown"]
+
+
+class LegacyLead(BaseModel):
+    id: Optional[str] = None
+    name: str
+    email: Optional[EmailStr] = None
+    phone: Optional[str] = None
+    company: Optional[str] = None
+    role: Optional[str] = None
+    notes: Optional[str] = None
+    location: Optional[str] = None
+    intent: Optional[str] = None
+    status: Optional[str] = "New"
+    captured_at: Optional[datetime] = None
+    social_media: Optional[Dict[str, str]] = Field(default_factory=dict)
+    meta_data: Optional[Dict[str, Any]] = Field(default_factory=dict)
+
+
+class LegacySyncRequest(BaseModel):
+    leads: List[LegacyLead]
+
+
+def legacy_rows(body: bytes) -> List[dict]:
+    rows = []
+    for lead in LegacySyncRequest.model_validate_json(body).leads:
+        lead_dump = lead.model_dump(mode="json", exclude_none=True)
+        valid_statuses = ["New", "Contacted", "Qualified", "Lost", "Meeting", "Won"]
+        original_status = lead_dump.get("status", "New")
+        if original_status not in valid_statuses:
+            lead_dump["status"] = "New"
+        meta = lead_dump.get("meta_data", {})
+        meta["original_status"] = original_status
+        for field in ["location", "intent", "social_media"]:
+            if value := lead_dump.pop(field, None):
+                meta[field] = value
+        lead_dump["meta_data"] = meta
+        rows.append(lead_dump)
+    return rows
+
+
+def current_rows(body: bytes) -> List[dict]:
+    return lead_rows(SyncRequest.model_validate_json(body).leads)
+
+
+def make_body(count: int, seed: int = 7) -> bytes:
+    rng = random.Random(seed)
+    leads = []
+    for i in range(count):
+        lead = {
+            "name": f"Bench Lead {i}",
+            "email": f"lead.{i}+{rng.randint(0, 99)}@{rng.choice(DOMAINS)}",
+            "phone": f"+91 98{i:08d}",
+            "company": rng.choice(["Acme", "Globex", None]),
+            "notes": "HNI, immediate" if i % 3 == 0 else "call later",
+            "location": rng.choice(["Mumbai", "Pune", None]),
+            "intent": rng.choice(["invest", None]),
+            "social_media": {"linkedin": f"in/lead{i}"} if i % 4 == 0 else {},
+            "captured_at": "2025-01-15T10:30:00Z",
+            "meta_data": {"source": "app"},
+        }
+        status = rng.choice(STATUSES)
+        if status is not None:
+            lead["status"] = status
+        leads.append(lead)
+    return json.dumps({"leads": leads}).encode()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    bodies = [make_body(args.batch, seed) for seed in range(args.rounds)]
+    expected = legacy_rows(bodies[0])
+    assert current_rows(bodies[0]) == expected, "paths disagree"
+
+    baseline = None
+    for label, fn in (("previous", legacy_rows), ("lead_rows", current_rows)):
+        _email_domain.cache_clear()
+        started = time.perf_counter()
+        for body in bodies:
+            fn(body)
+        rate = args.batch * args.rounds / (time.perf_counter() - started)
+        speedup = f"  {rate / baseline:.1f}x" if baseline else ""
+        baseline = baseline or rate
+        print(f"{label:<10} {rate:>10,.0f} leads/sec{speedup}")
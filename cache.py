@@ -0,0 +1,350 @@
+"""
+Caches for read-heavy endpoints, and the shared store web workers use to
+coordinate.
+
+Values live in a backend chosen with CACHE_BACKEND:
+    memory              this process only (default; one worker)
+    sqlite              a local SQLite file at CACHE_PATH (default cache.db),
+                        shared by every worker on the host
+    redis://host:port   a Redis server shared by several hosts (needs the
+                        `redis` package)
+    package.module:Cls  any CacheBackend subclass, constructed without arguments
+
+With a shared backend, a write in one worker invalidates /stats for all of
+them, and LeadClaims makes sure a lead is scored by only one of them.
+"""
+import asyncio
+import importlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class CacheBackend:
+    """Interface every cache backend implements. Values must be JSON-serialisable."""
+
+    # Whether calls may block on I/O; TTLCache then runs them in a thread.
+    blocking = True
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: float):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def add_many(self, keys: List[str], value: Any, ttl: float) -> List[str]:
+        """Sets each key that is absent (or expired) and returns the ones it set."""
+        raise NotImplementedError
+
+    def set_many(self, keys: List[str], value: Any, ttl: float):
+        raise NotImplementedError
+
+    def delete_many(self, keys: List[str]):
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """A dict in this process."""
+
+    blocking = False
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[float, Any]] = {}
+        # Worker threads (asyncio.to_thread) may share the backend with the event loop.
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._values.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    def set(self, key: str, value: Any, ttl: float):
+        self._values[key] = (time.monotonic() + ttl, value)
+
+    def delete(self, key: str):
+        self._values.pop(key, None)
+
+    def add_many(self, keys: List[str], value: Any, ttl: float) -> List[str]:
+        now = time.monotonic()
+        added = []
+        with self._lock:
+            for key in keys:
+                entry = self._values.get(key)
+                if entry is None or entry[0] <= now:
+                    self._values[key] = (now + ttl, value)
+                    added.append(key)
+            if len(self._values) > 100_000:
+                self._values = {k: v for k, v in self._values.items() if v[0] > now}
+        return added
+
+    def set_many(self, keys: List[str], value: Any, ttl: float):
+        expires = time.monotonic() + ttl
+        with self._lock:
+            for key in keys:
+                self._values[key] = (expires, value)
+
+    def delete_many(self, keys: List[str]):
+        with self._lock:
+            for key in keys:
+                self._values.pop(key, None)
+
+
+class SQLiteBackend(CacheBackend):
+    """Entries in a local SQLite file (WAL mode), shared by every worker on the host."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.environ.get("CACHE_PATH", "cache.db")
+        with self._connect() as db:
+            db.execute("pragma journal_mode=wal")
+            db.execute("""
+                create table if not exists cache (
+                    key text primary key,
+                    value text not null,
+                    expires_at real not null
+                ) without rowid
+            """)
+
+    @contextmanager
+    def _connect(self):
+        # A connection per call keeps this usable from worker threads and other processes.
+        db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._connect() as db:
+            row = db.execute("select value from cache where key = ? and expires_at > ?", (key, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any, ttl: float):
+        self.set_many([key], value, ttl)
+
+    def delete(self, key: str):
+        self.delete_many([key])
+
+    def add_many(self, keys: List[str], value: Any, ttl: float) -> List[str]:
+        now = time.time()
+        encoded = json.dumps(value)
+        added = []
+        with self._connect() as db:
+            db.execute("begin immediate")
+            try:
+                db.execute("delete from cache where expires_at <= ?", (now,))
+                for key in keys:
+                    cursor = db.execute("insert or ignore into cache values (?, ?, ?)", (key, encoded, now + ttl))
+                    if cursor.rowcount:
+                        added.append(key)
+                db.execute("commit")
+            except Exception:
+                db.execute("rollback")
+                raise
+        return added
+
+    def set_many(self, keys: List[str], value: Any, ttl: float):
+        encoded = json.dumps(value)
+        expires = time.time() + ttl
+        with self._connect() as db:
+            db.executemany("insert or replace into cache values (?, ?, ?)", [(key, encoded, expires) for key in keys])
+
+    def delete_many(self, keys: List[str]):
+        with self._connect() as db:
+            db.executemany("delete from cache where key = ?", [(key,) for key in keys])
+
+
+class RedisBackend(CacheBackend):
+    """Entries in Redis (or anything speaking its protocol), shared across hosts."""
+
+    def __init__(self, url: str):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.client.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key: str, value: Any, ttl: float):
+        self.client.set(key, json.dumps(value), px=int(ttl * 1000))
+
+    def delete(self, key: str):
+        self.client.delete(key)
+
+    def add_many(self, keys: List[str], value: Any, ttl: float) -> List[str]:
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.set(key, json.dumps(value), px=int(ttl * 1000), nx=True)
+        return [key for key, added in zip(keys, pipe.execute()) if added]
+
+    def set_many(self, keys: List[str], value: Any, ttl: float):
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.set(key, json.dumps(value), px=int(ttl * 1000))
+        pipe.execute()
+
+    def delete_many(self, keys: List[str]):
+        if keys:
+            self.client.delete(*keys)
+
+
+_backend: Optional[CacheBackend] = None
+
+
+def get_backend() -> CacheBackend:
+    """The configured backend, created on first use."""
+    global _backend
+    if _backend is None:
+        name = os.environ.get("CACHE_BACKEND", "memory")
+        if name == "memory":
+            _backend = MemoryBackend()
+        elif name == "sqlite":
+            _backend = SQLiteBackend()
+        elif name.startswith(("redis://", "rediss://", "unix://")):
+            _backend = RedisBackend(name)
+        else:
+            module, _, cls = name.partition(":")
+            _backend = getattr(importlib.import_module(module), cls)()
+    return _backend
+
+
+async def _call(backend: CacheBackend, method: Callable, *args):
+    if backend.blocking:
+        return await asyncio.to_thread(method, *args)
+    return method(*args)
+
+
+class TTLCache:
+    """
+    Small async cache with per-key expiry, stored in the configured backend.
+
+    Concurrent callers in this process that miss the same key share a single
+    load instead of each going upstream. invalidate() bumps a generation
+    counter so a load that was already in flight when a write happened is
+    not stored.
+    """
+
+    def __init__(self, ttl: float, namespace: str = "cache", backend: Optional[CacheBackend] = None):
+        self.ttl = ttl
+        self.namespace = namespace
+        self._backend = backend
+        self._keys: set = set()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._generation = 0
+
+    @property
+    def backend(self) -> CacheBackend:
+        # Resolved on first use, so CACHE_BACKEND can be set after import.
+        if self._backend is None:
+            self._backend = get_backend()
+        return self._backend
+
+    def _name(self, key: Hashable) -> str:
+        return f"{self.namespace}:{key}"
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        backend = self.backend
+        self._keys.add(key)
+        value = await _call(backend, backend.get, self._name(key))
+        if value is not None:
+            return value
+
+        if key in self._inflight:
+            return await asyncio.shield(self._inflight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        generation = self._generation
+        try:
+            value = await loader()
+            if generation == self._generation and self.ttl > 0:
+                await _call(backend, backend.set, self._name(key), value, self.ttl)
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark retrieved so an unawaited failure doesn't log a warning.
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    async def invalidate(self, key: Optional[Hashable] = None):
+        """
+        Drops `key`, or every key this process has used. The delete reaches
+        other workers through a shared backend; it is a single small write,
+        run in a thread like every other call to a blocking backend.
+        """
+        # Bumped before the delete, so a load finishing meanwhile isn't stored.
+        self._generation += 1
+        keys = [key] if key is not None else list(self._keys)
+        await _call(self.backend, self.backend.delete_many, [self._name(k) for k in keys])
+
+
+class LeadClaims:
+    """
+    Makes per-lead work run once across workers and hosts.
+
+    acquire() claims the leads nobody else holds, for `lease` seconds. The
+    caller then marks them complete() (kept for `keep` seconds, so a
+    redelivered job skips them) or release()s them to be retried. A worker
+    that dies mid-way loses its claims when the lease runs out.
+    """
+
+    def __init__(self, namespace: str, lease: float, keep: float, backend: Optional[CacheBackend] = None):
+        self.namespace = namespace
+        self.lease = lease
+        self.keep = keep
+        self._backend = backend
+
+    @property
+    def backend(self) -> CacheBackend:
+        if self._backend is None:
+            self._backend = get_backend()
+        return self._backend
+
+    def _names(self, lead_ids: List[str]) -> List[str]:
+        return [f"{self.namespace}:{lead_id}" for lead_id in lead_ids]
+
+    async def acquire(self, lead_ids: List[str]) -> set:
+        """The subset of lead_ids this caller now owns."""
+        if not lead_ids:
+            return set()
+        added = await _call(self.backend, self.backend.add_many, self._names(lead_ids), "running", self.lease)
+        prefix = len(self.namespace) + 1
+        return {name[prefix:] for name in added}
+
+    async def running(self, lead_ids: List[str]) -> set:
+        """The subset of lead_ids another caller holds and hasn't completed yet."""
+        if not lead_ids:
+            return set()
+        backend = self.backend
+        values = await _call(backend, lambda names: [backend.get(name) for name in names], self._names(lead_ids))
+        return {lead_id for lead_id, value in zip(lead_ids, values) if value == "running"}
+
+    async def complete(self, lead_ids: List[str]):
+        if lead_ids:
+            await _call(self.backend, self.backend.set_many, self._names(lead_ids), "done", self.keep)
+
+    async def release(self, lead_ids: List[str]):
+        if lead_ids:
+            await _call(self.backend, self.backend.delete_many, self._names(lead_ids))
+
+
+# Dashboard tabs poll /stats every few seconds; writes invalidate it.
+stats_cache = TTLCache(ttl=float(os.environ.get("STATS_CACHE_TTL", "5")))
+# Background scoring of a lead, whether it runs in a web worker or worker.py.
+scoring_claims = LeadClaims(
+    "scoring",
+    lease=float(os.environ.get("SCORING_CLAIM_LEASE", "300")),
+    keep=float(os.environ.get("SCORING_CLAIM_KEEP", "86400")),
+)
@@ -0,0 +1,175 @@
+"""
+Fuzzy duplicate-lead detection for /sync.
+
+The leads_email_unique constraint only catches exact email repeats, so
+"Rahul Sharma / +91 98xxx" and "rahul sharma / 98xxx" both get in. Here
+each incoming lead is compared only against the leads that share a
+blocking key with it:
+
+    phone block   last 10 digits of the normalized phone
+    name block    email domain + first 4 letters of the name
+
+Both keys are also generated columns in schema.sql, so the database finds
+the candidates with an index lookup and every block is capped at
+DEDUP_BLOCK_LIMIT rows. Per-lead cost therefore depends on block size,
+not table size. Names within a block are scored in one batch with
+rapidfuzz.process.cdist; likely duplicates are tagged in meta_data, not
+merged, so no captured data is lost.
+"""
+import os
+import re
+import uuid
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from rapidfuzz import fuzz, process
+
+from utils import normalize_phone
+import rest
+
+DEDUP_ENABLED = os.environ.get("DEDUP_ENABLED", "1") == "1"
+DEDUP_THRESHOLD = float(os.environ.get("DEDUP_THRESHOLD", "85"))
+DEDUP_BLOCK_LIMIT = int(os.environ.get("DEDUP_BLOCK_LIMIT", "50"))
+# Sharing a phone number is strong evidence on its own; a looser name match is enough.
+PHONE_BONUS = 20
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]")
+
+
+def phone_key(phone: Optional[str]) -> Optional[str]:
+    """Last 10 digits, so +91 98765 43210 and 9876543210 share a block."""
+    digits = normalize_phone(phone or "")
+    return digits[-10:] if len(digits) >= 7 else None
+
+
+def name_block(name: Optional[str], email: Optional[str]) -> Optional[str]:
+    """Email domain plus the first four letters of the name, e.g. "gmail.com:rahu"."""
+    if not email or "@" not in email:
+        return None
+    prefix = _NON_ALNUM.sub("", (name or "").lower())[:4]
+    if not prefix:
+        return None
+    return f"{email.rsplit('@', 1)[1].lower()}:{prefix}"
+
+
+def normalize_name(name: Optional[str]) -> str:
+    return " ".join((name or "").lower().split())
+
+
+def blocking_keys(lead: dict) -> List[str]:
+    keys = []
+    if key := phone_key(lead.get("phone")):
+        keys.append(f"p:{key}")
+    if key := name_block(lead.get("name"), lead.get("email")):
+        keys.append(f"n:{key}")
+    return keys
+
+
+class BlockingIndex:
+    """
+    Candidate records grouped by blocking key. Each record is an
+    (id, normalized name, sequence) triple; blocks stop growing at
+    block_limit. Records are told apart by sequence, so a lead without an
+    id is still indexed (and matched as None). A record already tagged as a
+    duplicate of some lead is never offered back to that lead as a match,
+    so two leads don't end up pointing at each other.
+    """
+
+    def __init__(self, block_limit: int = DEDUP_BLOCK_LIMIT):
+        self.block_limit = block_limit
+        self.blocks: Dict[str, List[Tuple[Optional[str], str, int]]] = defaultdict(list)
+        # sequence -> id of the lead that record is already tagged a duplicate of
+        self.duplicate_of: Dict[int, str] = {}
+        self.size = 0
+
+    def add(self, lead: dict) -> int:
+        """Indexes a lead and returns its sequence number."""
+        seq = self.size
+        self.size += 1
+        record = (str(lead["id"]) if lead.get("id") else None, normalize_name(lead.get("name")), seq)
+        if pointer := lead.get("duplicate_of") or (lead.get("meta_data") or {}).get("possible_duplicate_of"):
+            self.duplicate_of[seq] = str(pointer)
+        for key in blocking_keys(lead):
+            block = self.blocks[key]
+            if len(block) < self.block_limit:
+                block.append(record)
+        return seq
+
+    def add_many(self, leads: Iterable[dict]) -> List[int]:
+        return [self.add(lead) for lead in leads]
+
+    def match(self, leads: List[dict], threshold: float = DEDUP_THRESHOLD,
+              before: Optional[List[int]] = None) -> List[Optional[Tuple[Optional[str], float]]]:
+        """
+        Best (lead_id, score) at or above threshold for each lead, or None.
+        With `before`, lead i only matches records indexed before before[i].
+        Leads are grouped by block so each block is scored with one cdist call.
+        """
+        by_key: Dict[str, List[int]] = defaultdict(list)
+        for i, lead in enumerate(leads):
+            for key in blocking_keys(lead):
+                if key in self.blocks:
+                    by_key[key].append(i)
+
+        best: List[Optional[Tuple[Optional[str], float]]] = [None] * len(leads)
+        for key, positions in by_key.items():
+            block = self.blocks[key]
+            scores = process.cdist(
+                [normalize_name(leads[i].get("name")) for i in positions],
+                [name for _, name, _ in block],
+                scorer=fuzz.token_sort_ratio,
+            )
+            bonus = PHONE_BONUS if key.startswith("p:") else 0
+            for row, i in enumerate(positions):
+                limit = before[i] if before is not None else self.size
+                own_id = str(leads[i]["id"]) if leads[i].get("id") else None
+                for col, (candidate_id, _, seq) in enumerate(block):
+                    if seq >= limit or (own_id is not None and own_id in (candidate_id, self.duplicate_of.get(seq))):
+                        continue
+                    score = min(100.0, float(scores[row][col]) + bonus)
+                    if score >= threshold and (best[i] is None or score > best[i][1]):
+                        best[i] = (candidate_id, score)
+        return best
+
+
+async def fetch_candidates(rows: List[dict], block_limit: int = DEDUP_BLOCK_LIMIT) -> List[dict]:
+    """
+    Existing leads sharing a blocking key with any row, via the
+    dedup_candidates RPC, with the lead each is already tagged a duplicate
+    of (duplicate_of).
+    """
+    phone_keys = sorted({k for row in rows if (k := phone_key(row.get("phone")))})
+    name_blocks = sorted({k for row in rows if (k := name_block(row.get("name"), row.get("email")))})
+    if not phone_keys and not name_blocks:
+        return []
+    response = await rest.get_client().post(
+        rest.rest_url("rpc/dedup_candidates"),
+        headers=rest.auth_headers(),
+        json={"phone_keys": phone_keys, "name_blocks": name_blocks, "block_limit": block_limit},
+    )
+    if response.status_code != 200:
+        raise Exception(response.text)
+    return response.json()
+
+
+async def tag_duplicates(rows: List[dict], threshold: float = DEDUP_THRESHOLD) -> int:
+    """
+    Marks rows that look like an existing lead (or an earlier row in the
+    same batch) with meta_data.possible_duplicate_of / duplicate_score.
+    Rows without an id get one here, as the database would, so a later row
+    can point at them. Returns the number of rows tagged.
+    """
+    for row in rows:
+        if not row.get("id"):
+            row["id"] = str(uuid.uuid4())
+    index = BlockingIndex()
+    index.add_many(await fetch_candidates(rows))
+    sequence = index.add_many(rows)
+
+    tagged = 0
+    for row, found in zip(rows, index.match(rows, threshold, before=sequence)):
+        if found:
+            meta = row.setdefault("meta_data", {})
+            meta["possible_duplicate_of"], meta["duplicate_score"] = found[0], round(found[1], 1)
+            tagged += 1
+    return tagged
@@ -0,0 +1,459 @@
+"""
+Staged enrichment for freshly synced leads (the "Intelligence Engine").
+
+process_leads_background hands its leads to EnrichmentPipeline.run, which
+cuts them into batches of ENRICHMENT_BATCH_SIZE and passes each batch
+through
+
+    normalize   phone digits and blocking keys, in memory
+    dedupe      look for leads created alongside this batch (dedup_candidates)
+    enrich      every configured provider, side by side
+    score       the scoring engine, one batch at a time
+    persist     qualified statuses, score interactions, changed meta_data
+
+Stages are joined by bounded queues and each runs ENRICHMENT_CONCURRENCY
+batches at once, so a slow upstream call in one stage doesn't stop the
+others from working on the next batch, and a stage that falls behind holds
+back the ones feeding it instead of piling up leads in memory.
+
+Providers are pluggable (ENRICHMENT_PROVIDERS, comma separated):
+
+    mock                MockProvider, canned data after ENRICHMENT_MOCK_DELAY seconds
+    package.module:Cls  any EnrichmentProvider subclass, constructed without arguments
+
+Each provider has its own concurrency slots, so a backed-up provider
+doesn't take turns from the others. A batch waits at most
+ENRICHMENT_PROVIDER_WAIT seconds for its providers: whatever has arrived
+by then goes into scoring, and slower providers carry on in the background
+(counted as deferred) and write their data once the batch is persisted.
+A provider's own timeout, slot wait included, is where it is given up on.
+What a provider returns is kept in meta_data.enrichment.<name>.
+
+Throughput, errors and time spent are counted per stage and per provider,
+for each run and in total for the process (GET /queue/metrics).
+"""
+import asyncio
+import importlib
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import rest
+import transitions
+from dedup import DEDUP_ENABLED, DEDUP_THRESHOLD, BlockingIndex, fetch_candidates, phone_key
+from lead_cache import lead_cache
+from metrics import span
+from models import LeadStatus
+from scoring import get_engine
+from utils import normalize_phone
+
+ENRICHMENT_BATCH_SIZE = int(os.environ.get("ENRICHMENT_BATCH_SIZE", os.environ.get("BACKGROUND_CHUNK_SIZE", "200")))
+ENRICHMENT_CONCURRENCY = int(os.environ.get("ENRICHMENT_CONCURRENCY", "4"))
+ENRICHMENT_PROVIDER_WAIT = float(os.environ.get("ENRICHMENT_PROVIDER_WAIT", "0.2"))
+ENRICHMENT_MOCK_DELAY = float(os.environ.get("ENRICHMENT_MOCK_DELAY", "0.05"))
+STAGES = ("normalize", "dedupe", "enrich", "score", "persist")
+# The scorer qualifies leads nobody has worked past Contacted; anything further along is left to people.
+SCORER_PROMOTES_FROM = (LeadStatus.NEW, LeadStatus.CONTACTED)
+# The meta_data keys this pipeline writes; write_meta_data sends only these.
+ENRICHMENT_KEYS = ("possible_duplicate_of", "duplicate_score", "enrichment")
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StageStats:
+    batches: int = 0
+    items: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    deferred: int = 0
+    busy_seconds: float = 0.0
+
+    def add(self, other: "StageStats"):
+        self.batches += other.batches
+        self.items += other.items
+        self.errors += other.errors
+        self.timeouts += other.timeouts
+        self.deferred += other.deferred
+        self.busy_seconds += other.busy_seconds
+
+    def report(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "deferred": self.deferred,
+            "busy_seconds": round(self.busy_seconds, 4),
+            # Per busy second, so a stage that waits on its neighbours isn't penalised for it.
+            "items_per_sec": round(self.items / self.busy_seconds, 1) if self.busy_seconds else None,
+        }
+
+
+class EnrichmentProvider:
+    """
+    Adds data about leads from somewhere else. Subclasses set name,
+    concurrency (batches in flight) and timeout (seconds, including the
+    wait for a slot) and implement enrich().
+    """
+    name = "provider"
+    concurrency = 4
+    timeout = 5.0
+
+    async def enrich(self, leads: List[dict]) -> Dict[str, dict]:
+        """{lead_id: fields} for the leads this provider knows something about."""
+        raise NotImplementedError
+
+
+class MockProvider(EnrichmentProvider):
+    """Stand-in for local runs and benchmarks: derives a few fields after a fixed delay."""
+    name = "mock"
+
+    def __init__(self, name: str = "mock", delay: float = ENRICHMENT_MOCK_DELAY, timeout: float = 5.0):
+        self.name = name
+        self.delay = delay
+        self.timeout = timeout
+
+    async def enrich(self, leads: List[dict]) -> Dict[str, dict]:
+        await asyncio.sleep(self.delay)
+        found = {}
+        for lead in leads:
+            email = lead.get("email") or ""
+            fields = {"email_domain": email.rsplit("@", 1)[1].lower()} if "@" in email else {}
+            if lead.get("phone_digits"):
+                fields["phone_country"] = "IN" if len(lead["phone_digits"]) == 10 or lead["phone_digits"].startswith("91") else "other"
+            if fields:
+                found[lead["id"]] = fields
+        return found
+
+
+def get_providers() -> List[EnrichmentProvider]:
+    providers = []
+    for entry in filter(None, (part.strip() for part in os.environ.get("ENRICHMENT_PROVIDERS", "").split(","))):
+        if entry == "mock":
+            providers.append(MockProvider())
+        else:
+            module, _, name = entry.partition(":")
+            providers.append(getattr(importlib.import_module(module), name)())
+    return providers
+
+
+def score_interaction_id(lead_id: str) -> str:
+    """Fixed id of the score interaction /sync writes for a lead."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"finsync-score:{lead_id}"))
+
+
+def score_summary(result) -> str:
+    """Interaction text recording the score and which rules produced it."""
+    summary = f"Lead initially captured with score: {result.score}"
+    if result.contributions:
+        summary += " (" + ", ".join(f"{name} +{weight}" for name, weight in result.contributions.items()) + ")"
+    return summary
+
+
+class Batch:
+    """Leads moving through the stages together, with what each stage found out about them."""
+
+    def __init__(self, leads: List[dict]):
+        self.leads = leads
+        self.ids = [lead["id"] for lead in leads]
+        # Leads whose meta_data changed and has to be written back.
+        self.changed: set = set()
+        self.results: list = []
+        self.persisted = asyncio.Event()
+        self.write_lock = asyncio.Lock()
+
+
+class EnrichmentPipeline:
+    def __init__(self, providers: Optional[List[EnrichmentProvider]] = None,
+                 batch_size: int = ENRICHMENT_BATCH_SIZE, concurrency: int = ENRICHMENT_CONCURRENCY):
+        self._providers = providers
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.totals = {stage: StageStats() for stage in STAGES}
+        self.provider_totals: Dict[str, StageStats] = {}
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+
+    @property
+    def providers(self) -> List[EnrichmentProvider]:
+        if self._providers is None:
+            self._providers = get_providers()
+        return self._providers
+
+    def stats(self) -> dict:
+        """Totals for this process since it started."""
+        return {
+            "stages": {stage: stats.report() for stage, stats in self.totals.items()},
+            "providers": {name: stats.report() for name, stats in self.provider_totals.items()},
+        }
+
+    async def run(self, leads: List[dict]) -> dict:
+        """
+        Runs leads through every stage. Batches that fail in a stage are left
+        out of the later ones and reported in `failures` with their lead IDs.
+        """
+        run = _Run(self)
+        started = time.perf_counter()
+        handlers = {
+            "normalize": self._normalize, "dedupe": self._dedupe, "enrich": run.enrich,
+            "score": self._score, "persist": run.persist,
+        }
+        queues = [asyncio.Queue(maxsize=self.concurrency) for _ in STAGES]
+
+        async def feed():
+            for start in range(0, len(leads), self.batch_size):
+                await queues[0].put(Batch(leads[start:start + self.batch_size]))
+            for _ in range(self.concurrency):
+                await queues[0].put(None)
+
+        async def work(position: int, stage: str):
+            inbox = queues[position]
+            outbox = queues[position + 1] if position + 1 < len(STAGES) else None
+            while (batch := await inbox.get()) is not None:
+                stats = run.stages[stage]
+                began = time.perf_counter()
+                try:
+                    with span(f"enrichment.{stage}"):
+                        await handlers[stage](batch)
+                except Exception as e:
+                    stats.errors += 1
+                    logger.warning("%s failed for %d leads: %s", stage, len(batch.ids), e)
+                    run.failures.append({"kind": stage, "lead_ids": batch.ids, "error": str(e)})
+                    run.dropped.append(batch)
+                    continue
+                finally:
+                    stats.busy_seconds += time.perf_counter() - began
+                stats.batches += 1
+                stats.items += len(batch.ids)
+                if outbox is not None:
+                    await outbox.put(batch)
+
+        async def stage(position: int, name: str):
+            await asyncio.gather(*(work(position, name) for _ in range(self.concurrency)))
+            if position + 1 < len(STAGES):
+                for _ in range(self.concurrency):
+                    await queues[position + 1].put(None)
+
+        await asyncio.gather(feed(), *(stage(position, name) for position, name in enumerate(STAGES)))
+        persisted = time.perf_counter() - started
+        for batch in run.dropped:
+            batch.persisted.set()
+        await asyncio.gather(*run.late)
+        seconds = time.perf_counter() - started
+
+        for name, stats in run.stages.items():
+            self.totals[name].add(stats)
+        for name, stats in run.providers.items():
+            self.provider_totals.setdefault(name, StageStats()).add(stats)
+        logger.info("Enriched %d leads in %.2fs, %d qualified: %s", run.scored, seconds,
+                    run.qualified, ", ".join(f"{name} {stats.report()['items_per_sec']}/s" for name, stats in run.stages.items()))
+        return {
+            "scored": run.scored,
+            "qualified": run.qualified,
+            "failures": run.failures,
+            # Until the last batch was persisted, and until deferred provider data was written too.
+            "persisted_seconds": round(persisted, 4),
+            "seconds": round(seconds, 4),
+            "stages": {name: stats.report() for name, stats in run.stages.items()},
+            "providers": {name: stats.report() for name, stats in run.providers.items()},
+        }
+
+    async def _normalize(self, batch: Batch):
+        for lead in batch.leads:
+            lead["phone_digits"] = normalize_phone(lead.get("phone") or "")
+            lead["phone_key"] = phone_key(lead["phone_digits"])
+
+    async def _dedupe(self, batch: Batch):
+        """
+        /sync already compared each lead with what existed before it was
+        inserted; this catches leads synced at the same time from another
+        device. Of two such leads, the one with the larger id is tagged,
+        unless /sync already tagged the other one; either way they never
+        point at each other.
+        """
+        pending = [lead for lead in batch.leads if not (lead.get("meta_data") or {}).get("possible_duplicate_of")]
+        if not DEDUP_ENABLED or not pending:
+            return
+        # The batch's own leads are in the table by now, but a capped block may have left some out.
+        known = {str(candidate["id"]): candidate for candidate in await fetch_candidates(pending)}
+        known.update((str(lead["id"]), lead) for lead in pending)
+        index = BlockingIndex()
+        ordered = sorted(known)
+        sequence = dict(zip(ordered, index.add_many(known[lead_id] for lead_id in ordered)))
+        before = [sequence[str(lead["id"])] for lead in pending]
+        for lead, found in zip(pending, index.match(pending, DEDUP_THRESHOLD, before=before)):
+            if found:
+                meta = lead["meta_data"] = lead.get("meta_data") or {}
+                meta["possible_duplicate_of"], meta["duplicate_score"] = found[0], round(found[1], 1)
+                batch.changed.add(lead["id"])
+
+    async def _score(self, batch: Batch):
+        with span("scoring"):
+            batch.results = get_engine().score_batch(batch.leads)
+
+    def provider_slots(self, provider: EnrichmentProvider) -> asyncio.Semaphore:
+        if provider.name not in self._slots:
+            self._slots[provider.name] = asyncio.Semaphore(provider.concurrency)
+        return self._slots[provider.name]
+
+
+class _Run:
+    """Counters and outcomes of one EnrichmentPipeline.run."""
+
+    def __init__(self, pipeline: EnrichmentPipeline):
+        self.pipeline = pipeline
+        self.stages = {stage: StageStats() for stage in STAGES}
+        self.providers = {provider.name: StageStats() for provider in pipeline.providers}
+        self.failures: List[dict] = []
+        self.late: List[asyncio.Future] = []
+        # Batches a stage failed on; late provider data for them is still written.
+        self.dropped: List[Batch] = []
+        self.scored = 0
+        self.qualified = 0
+
+    async def enrich(self, batch: Batch):
+        """
+        Asks every provider at once and waits up to ENRICHMENT_PROVIDER_WAIT
+        for them. What has arrived by then is scored and persisted with the
+        batch; providers still working finish in the background and write
+        their data on their own once the batch has been persisted.
+        """
+        asked = {asyncio.ensure_future(self._ask(provider, batch)): provider for provider in self.pipeline.providers}
+        if not asked:
+            return
+        done, pending = await asyncio.wait(asked, timeout=ENRICHMENT_PROVIDER_WAIT)
+        for task in done:
+            self._merge(batch, asked[task], task.result())
+        for task in pending:
+            self.providers[asked[task].name].deferred += 1
+            self.late.append(asyncio.ensure_future(self._late(batch, asked[task], task)))
+
+    def _merge(self, batch: Batch, provider: EnrichmentProvider, results: Dict[str, dict]) -> List[dict]:
+        merged = []
+        for lead in batch.leads:
+            if fields := results.get(lead["id"]):
+                meta = lead["meta_data"] = lead.get("meta_data") or {}
+                meta.setdefault("enrichment", {})[provider.name] = fields
+                batch.changed.add(lead["id"])
+                merged.append(lead)
+        return merged
+
+    async def _late(self, batch: Batch, provider: EnrichmentProvider, task: asyncio.Future):
+        results = await task
+        await batch.persisted.wait()
+        if merged := self._merge(batch, provider, results):
+            try:
+                await write_meta_data(merged, batch.write_lock)
+            except Exception as e:
+                self.providers[provider.name].errors += 1
+                logger.warning("Writing late %s data failed for %d leads: %s", provider.name, len(merged), e)
+
+    async def _ask(self, provider: EnrichmentProvider, batch: Batch) -> Dict[str, dict]:
+        stats = self.providers[provider.name]
+        began = time.perf_counter()
+
+        async def call():
+            async with self.pipeline.provider_slots(provider):
+                return await provider.enrich(batch.leads)
+
+        try:
+            results = await asyncio.wait_for(call(), provider.timeout)
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+            logger.warning("Provider %s timed out on %d leads", provider.name, len(batch.ids))
+            return {}
+        except Exception as e:
+            stats.errors += 1
+            logger.warning("Provider %s failed on %d leads: %s", provider.name, len(batch.ids), e)
+            return {}
+        finally:
+            stats.busy_seconds += time.perf_counter() - began
+        stats.batches += 1
+        stats.items += len(batch.ids)
+        return results or {}
+
+    async def persist(self, batch: Batch):
+        """
+        One status update, one interactions insert and (if any meta_data
+        changed) one meta_data merge for the batch. A failed write fails only its
+        own leads; the batch's other writes still go out.
+        """
+        headers = rest.auth_headers(**{"Content-Type": "application/json"})
+        engine = get_engine()
+        qualified = [lead["id"] for lead, result in zip(batch.leads, batch.results) if result.score >= engine.qualify_score]
+        failed = []
+
+        async def send(kind: str, lead_ids: list, method: str, url: str, **kwargs) -> bool:
+            try:
+                response = await rest.request_with_retry(method, url, **{"headers": headers, **kwargs})
+                if response.status_code >= 300:
+                    raise Exception(f"{response.status_code}: {response.text}")
+                return True
+            except Exception as e:
+                logger.warning("%s failed for %d leads: %s", kind, len(lead_ids), e)
+                failed.append({"kind": kind, "lead_ids": lead_ids, "error": str(e)})
+                return False
+
+        if qualified:
+            # Only promotes New and Contacted leads: one already past Qualified (say, synced as Meeting)
+            # stays put, even though the state machine lets a person move Meeting back to Qualified.
+            # The score interaction below already says why, so the move isn't logged separately.
+            try:
+                outcome = await transitions.transition(qualified, LeadStatus.QUALIFIED, log=False,
+                                                       allowed_from=SCORER_PROMOTES_FROM)
+                await transitions.publish(outcome["applied"], LeadStatus.QUALIFIED)
+                self.qualified += len(outcome["moved"])
+            except Exception as e:
+                logger.warning("status_update failed for %d leads: %s", len(qualified), e)
+                failed.append({"kind": "status_update", "lead_ids": qualified, "error": str(e)})
+
+        # One score interaction per lead, with an id derived from it, so a
+        # retried insert that already landed adds nothing.
+        interactions = [
+            {"id": score_interaction_id(lead["id"]), "lead_id": lead["id"], "type": "Sync", "summary": score_summary(result)}
+            for lead, result in zip(batch.leads, batch.results)
+        ]
+        await send("interactions", batch.ids, "POST", rest.rest_url("interactions"), json=interactions,
+                   params={"on_conflict": "id"}, idempotent=True,
+                   headers={**headers, "Prefer": "resolution=ignore-duplicates,return=minimal"})
+
+        changed = [lead for lead in batch.leads if lead["id"] in batch.changed]
+        try:
+            if changed:
+                await write_meta_data(changed, batch.write_lock)
+        except Exception as e:
+            logger.warning("meta_data failed for %d leads: %s", len(changed), e)
+            failed.append({"kind": "meta_data", "lead_ids": [lead["id"] for lead in changed], "error": str(e)})
+        finally:
+            batch.persisted.set()
+
+        self.scored += len(batch.ids)
+        self.failures.extend(failed)
+
+
+async def write_meta_data(leads: List[dict], lock: asyncio.Lock):
+    """
+    Writes the meta_data keys enrichment owns for many leads with one call
+    to merge_lead_meta_data (schema.sql). It merges them into each row's
+    current meta_data, so changes made elsewhere are kept, and skips leads
+    that were deleted meanwhile. The batch's lock keeps its writes in order,
+    so the last one to land carries everything merged so far.
+    """
+    patches = [
+        {"id": lead["id"], "meta_data": {key: lead["meta_data"][key] for key in ENRICHMENT_KEYS if key in lead["meta_data"]}}
+        for lead in leads
+    ]
+    async with lock:
+        response = await rest.request_with_retry(
+            "POST", rest.rest_url("rpc/merge_lead_meta_data"), idempotent=True,
+            headers=rest.auth_headers(**{"Content-Type": "application/json"}),
+            json={"patches": patches},
+        )
+    if response.status_code != 200:
+        raise Exception(f"{response.status_code}: {response.text}")
+    lead_cache.write(response.json())
+
+
+enrichment_pipeline = EnrichmentPipeline()
@@ -0,0 +1,153 @@
+"""
+Server-sent events for the dashboard, served at GET /events.
+
+    lead.created          {"leads": [{id, name, status, created_at}, ...], "pipeline_version"}
+    lead.status_changed   {"ids": [...], "status": "Qualified", "pipeline_version"}
+    stats.changed         the /stats body, recomputed once per burst of writes
+    resync                this client missed events; refetch /stats and /pipeline
+
+Each event is encoded once and the same bytes are queued for every
+subscriber. A subscriber's queue holds at most EVENTS_BUFFER frames. When
+it is full, the client is too slow: its backlog is dropped and it gets a
+single `resync`, so one stalled browser never holds memory or slows the
+others. Idle connections cost a queue and a parked coroutine each, plus a
+comment line every EVENTS_HEARTBEAT seconds.
+
+Event ids look like "<epoch>-<n>": a random epoch per process and a
+counter, as pipeline.py builds its versions. Reconnecting clients send
+Last-Event-ID (EventSource does this on its own). The last EVENTS_REPLAY
+events are replayed, or a `resync` is sent if the client fell further
+behind, or if its id comes from another epoch (the process restarted, or
+the client was connected to another worker).
+
+Events fan out within one process. With several web workers, each
+browser gets the events of the worker it is connected to, and the
+periodic refetch after `resync` covers the rest.
+"""
+import asyncio
+import json
+import logging
+import os
+import uuid
+from collections import deque
+from typing import Awaitable, Callable, Optional, Set
+
+EVENTS_BUFFER = int(os.environ.get("EVENTS_BUFFER", "100"))
+EVENTS_HEARTBEAT = float(os.environ.get("EVENTS_HEARTBEAT", "15"))
+EVENTS_REPLAY = int(os.environ.get("EVENTS_REPLAY", "1000"))
+STATS_DEBOUNCE = float(os.environ.get("EVENTS_STATS_DEBOUNCE", "1.0"))
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    def __init__(self, types: Optional[Set[str]], buffer: int):
+        self.types = types
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer)
+        self.dropped = 0
+
+
+class EventBroker:
+    def __init__(self, buffer: int = EVENTS_BUFFER, replay: int = EVENTS_REPLAY):
+        self.buffer = buffer
+        self.subscribers: Set[Subscriber] = set()
+        self.epoch = uuid.uuid4().hex[:8]
+        self.last_id = 0
+        # (id, type, frame) of recent events, for Last-Event-ID replay.
+        self.recent: deque = deque(maxlen=replay)
+        self.stats_loader: Optional[Callable[[], Awaitable[dict]]] = None
+        self._stats_task: Optional[asyncio.Task] = None
+
+    @property
+    def token(self) -> str:
+        """Id of the latest event, as sent to clients."""
+        return f"{self.epoch}-{self.last_id}"
+
+    def _frame(self, event_id: int, event_type: str, data) -> bytes:
+        return f"id: {self.epoch}-{event_id}\nevent: {event_type}\ndata: {json.dumps(data, default=str)}\n\n".encode()
+
+    def publish(self, event_type: str, data):
+        """Queues an event for every subscriber. Never blocks."""
+        self.last_id += 1
+        frame = self._frame(self.last_id, event_type, data)
+        self.recent.append((self.last_id, event_type, frame))
+        for subscriber in self.subscribers:
+            if subscriber.types is None or event_type in subscriber.types:
+                self._offer(subscriber, frame)
+
+    def _offer(self, subscriber: Subscriber, frame: bytes):
+        try:
+            subscriber.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            # Backpressure: drop this client's backlog and tell it to refetch.
+            subscriber.dropped += 1
+            while not subscriber.queue.empty():
+                subscriber.queue.get_nowait()
+            subscriber.queue.put_nowait(self._frame(self.last_id, "resync", {"reason": "slow consumer"}))
+
+    def subscribe(self, types: Optional[Set[str]] = None, last_event_id: Optional[str] = None) -> Subscriber:
+        subscriber = Subscriber(types, self.buffer)
+        if last_event_id is not None:
+            epoch, _, number = last_event_id.partition("-")
+            since = int(number) if number.isdigit() else None
+            if epoch != self.epoch or since is None or since > self.last_id:
+                # Ids from an earlier run or another worker say nothing about what was missed here.
+                self._offer(subscriber, self._frame(self.last_id, "resync", {"reason": "unknown event id"}))
+            elif since < self.last_id:
+                oldest = self.recent[0][0] if self.recent else self.last_id + 1
+                if since + 1 < oldest:
+                    self._offer(subscriber, self._frame(self.last_id, "resync", {"reason": "missed events"}))
+                else:
+                    for event_id, event_type, frame in self.recent:
+                        if event_id > since and (types is None or event_type in types):
+                            self._offer(subscriber, frame)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    async def stream(self, subscriber: Subscriber, heartbeat: float = EVENTS_HEARTBEAT):
+        """SSE body for one subscriber. Unsubscribes when the client goes away."""
+        try:
+            yield f"retry: 3000\n: connected, last event {self.token}\n\n".encode()
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscriber.queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats_changed(self):
+        """
+        Schedules one stats.changed event for a burst of writes: the stats are
+        recomputed once, STATS_DEBOUNCE seconds after the first write.
+        """
+        if not self.subscribers or self.stats_loader is None:
+            return
+        if self._stats_task is not None and not self._stats_task.done():
+            return
+        try:
+            self._stats_task = asyncio.get_running_loop().create_task(self._publish_stats())
+        except RuntimeError:
+            # Called outside an event loop (scripts); nobody is listening there.
+            pass
+
+    async def _publish_stats(self):
+        await asyncio.sleep(STATS_DEBOUNCE)
+        try:
+            self.publish("stats.changed", await self.stats_loader())
+        except Exception as e:
+            logger.warning("Could not publish stats: %s", e)
+
+    def info(self) -> dict:
+        return {
+            "subscribers": len(self.subscribers),
+            "last_event_id": self.token,
+            "queued": sum(s.queue.qsize() for s in self.subscribers),
+            "slow_consumer_resyncs": sum(s.dropped for s in self.subscribers),
+        }
+
+
+broker = EventBroker()
@@ -0,0 +1,603 @@
+"""
+Local PostgREST stand-in for benchmarks and offline runs.
+
+Implements just enough of the Supabase REST surface used by this service
+(the `leads` and `interactions` tables, their constraints, the filter and
+ordering syntax and the Prefer headers we send) to exercise the API
+without a live project.
+
+Run standalone with:
+    python fake_postgrest.py --port 54321 --latency 0.002 --seed 10000
+then point SUPABASE_URL at http://127.0.0.1:54321.
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Optional
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+LEAD_STATUSES = ("New", "Contacted", "Qualified", "Lost", "Meeting", "Won", "Met")
+INTERACTION_TYPES = ("Call", "Email", "Meeting", "Note", "Sync")
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "columns", "on_conflict"}
+
+
+def _now() -> str:
+    # Fixed-width so timestamps compare correctly as strings.
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+
+
+def _error(status: int, code: str, message: str) -> Response:
+    body = {"code": code, "details": None, "hint": None, "message": message}
+    return Response(json.dumps(body), status_code=status, media_type="application/json")
+
+
+def _json(body, status: int = 200, headers: Optional[dict] = None) -> Response:
+    return Response(json.dumps(body), status_code=status, media_type="application/json", headers=headers)
+
+
+def _prefer(request: Request) -> set[str]:
+    header = request.headers.get("prefer", "")
+    return {part.strip() for part in header.split(",") if part.strip()}
+
+
+def _split_top(text: str) -> List[str]:
+    """Splits on commas that are not inside parentheses or double quotes."""
+    parts, depth, quoted, current = [], 0, False, []
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and char == ",":
+            parts.append("".join(current))
+            current = []
+            continue
+        current.append(char)
+    if current:
+        parts.append("".join(current))
+    return parts
+
+
+def _unquote(value: str) -> str:
+    return value[1:-1] if len(value) >= 2 and value[0] == value[-1] == '"' else value
+
+
+def _negated(test: Callable[[dict], bool]) -> Callable[[dict], bool]:
+    return lambda row: not test(row)
+
+
+def _compare(op: str, actual, expected: str) -> bool:
+    if actual is None:
+        return False
+    if isinstance(actual, bool):
+        actual = str(actual).lower()
+    elif isinstance(actual, (int, float)):
+        expected = type(actual)(expected)
+    else:
+        actual = str(actual)
+    if op == "eq":
+        return actual == expected
+    if op == "neq":
+        return actual != expected
+    if op == "lt":
+        return actual < expected
+    if op == "lte":
+        return actual <= expected
+    if op == "gt":
+        return actual > expected
+    if op == "gte":
+        return actual >= expected
+    raise ValueError(f"unsupported operator {op}")
+
+
+def _like(actual, pattern: str, insensitive: bool) -> bool:
+    if actual is None:
+        return False
+    regex = "^" + ".*".join(re.escape(part) for part in pattern.split("%")) + "$"
+    return re.match(regex, str(actual), re.IGNORECASE if insensitive else 0) is not None
+
+
+def parse_filter(column: str, expression: str) -> Callable[[dict], bool]:
+    """Parses `op.value` (optionally `not.op.value`) for one column."""
+    negate = expression.startswith("not.")
+    if negate:
+        expression = expression[4:]
+    op, _, value = expression.partition(".")
+
+    if op == "in":
+        options = {_unquote(v) for v in _split_top(value[1:-1])}
+        test = lambda row: row.get(column) is not None and str(row.get(column)) in options
+    elif op == "is":
+        target = {"null": None, "true": True, "false": False}[value]
+        test = lambda row: row.get(column) is target
+    elif op in ("like", "ilike"):
+        pattern = _unquote(value).replace("*", "%")
+        test = lambda row: _like(row.get(column), pattern, op == "ilike")
+    else:
+        value = _unquote(value)
+        test = lambda row: _compare(op, row.get(column), value)
+
+    return _negated(test) if negate else test
+
+
+def parse_logic(kind: str, body: str) -> Callable[[dict], bool]:
+    """Parses the inside of or=(...) / and=(...), including nested groups."""
+    tests = []
+    for part in _split_top(body):
+        negate = part.startswith("not.")
+        if negate:
+            part = part[4:]
+        if part.startswith(("or(", "and(")):
+            inner_kind, _, rest = part.partition("(")
+            test = parse_logic(inner_kind, rest[:-1])
+        else:
+            column, _, expression = part.partition(".")
+            test = parse_filter(column, expression)
+        tests.append(_negated(test) if negate else test)
+    combine = any if kind == "or" else all
+    return lambda row: combine(t(row) for t in tests)
+
+
+def row_filters(request: Request) -> List[Callable[[dict], bool]]:
+    filters = []
+    for key, value in request.query_params.multi_items():
+        if key in RESERVED_PARAMS or "." in key.removeprefix("not."):
+            continue
+        if key in ("or", "and", "not.or", "not.and"):
+            test = parse_logic(key.removeprefix("not."), value.strip()[1:-1])
+            filters.append(_negated(test) if key.startswith("not.") else test)
+        else:
+            filters.append(parse_filter(key, value))
+    return filters
+
+
+def apply_order(rows: List[dict], order: Optional[str]) -> List[dict]:
+    if not order:
+        return rows
+    for term in reversed(order.split(",")):
+        column, _, direction = term.partition(".")
+        descending = direction.startswith("desc")
+        present = [r for r in rows if r.get(column) is not None]
+        missing = [r for r in rows if r.get(column) is None]
+        present.sort(key=lambda r: r[column], reverse=descending)
+        # Postgres puts NULLs first when descending, last when ascending.
+        rows = missing + present if descending else present + missing
+    return rows
+
+
+def _computed(row: dict, column: str):
+    """Computed columns defined in schema.sql (functions taking a leads row)."""
+    if column in ("created_at_ist", "captured_at_ist"):
+        from timefmt import to_ist
+
+        return to_ist(row.get(column[:-4]))
+    return row.get(column)
+
+
+def project(row: dict, select: Optional[str]) -> dict:
+    if not select or select == "*":
+        return dict(row)
+    out = {}
+    for field in _split_top(select):
+        if field == "*":
+            out.update(row)
+            continue
+        alias, _, column = field.rpartition(":")
+        out[alias or column] = row[column] if column in row else _computed(row, column)
+    return out
+
+
+class FakePostgREST:
+    """In-memory `leads`/`interactions` tables served over a PostgREST-shaped HTTP API."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tables: dict[str, dict[str, dict]] = {"leads": {}, "interactions": {}}
+        # Index behind leads_email_unique, so inserts don't scan the table.
+        self.emails: set[str] = set()
+        # Index behind the dedup_candidates RPC: "p"/"n" + blocking key -> lead ids, oldest first.
+        # Dropped on update/delete and rebuilt on the next call.
+        self._blocks: Optional[dict[str, list]] = None
+        self.requests = 0
+        self.app = Starlette(routes=[
+            Route("/rest/v1/rpc/{function}", self.rpc_endpoint, methods=["GET", "POST"]),
+            Route("/rest/v1/{table}", self.table_endpoint, methods=["GET", "POST", "PATCH", "DELETE"]),
+        ])
+
+    @property
+    def leads(self) -> dict[str, dict]:
+        return self.tables["leads"]
+
+    @property
+    def interactions(self) -> dict[str, dict]:
+        return self.tables["interactions"]
+
+    def reset(self):
+        for rows in self.tables.values():
+            rows.clear()
+        self.emails.clear()
+        self._blocks = None
+        self.requests = 0
+
+    def seed(self, count: int, interactions_per_lead: int = 1, seed: int = 7):
+        """Fills the tables with `count` synthetic leads spread over every status, oldest first."""
+        rng = random.Random(seed)
+        started = datetime.now(timezone.utc) - timedelta(seconds=count)
+        for i in range(count):
+            at = (started + timedelta(seconds=i)).strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+            lead = self._defaults("leads", at)
+            lead.update({
+                "name": f"Seed Lead {i}",
+                "email": f"seed_{i}@example.com",
+                "phone": f"97{i:08d}",
+                "company": rng.choice(["Acme", "Globex", "Initech", None]),
+                "notes": rng.choice(["HNI, wants portfolio review", "call later", "", "immediate investment"]),
+                "status": rng.choice(LEAD_STATUSES + (None,)),
+                "meta_data": {"location": rng.choice(["Mumbai", "Pune", "Delhi"])},
+            })
+            self.leads[lead["id"]] = lead
+            self.emails.add(lead["email"])
+            for _ in range(interactions_per_lead):
+                interaction = self._defaults("interactions", at)
+                interaction.update({"lead_id": lead["id"], "type": "Sync", "summary": "Seeded"})
+                self.interactions[interaction["id"]] = interaction
+        self._blocks = None
+
+    def _defaults(self, table: str, now: str) -> dict:
+        if table == "leads":
+            return {
+                "id": str(uuid.uuid4()),
+                "name": None, "email": None, "phone": None, "company": None,
+                "role": None, "notes": None, "status": "New",
+                "captured_at": now, "created_at": now, "updated_at": now,
+                "social_media_json": {}, "meta_data": {},
+            }
+        return {
+            "id": str(uuid.uuid4()), "lead_id": None, "type": None, "summary": None,
+            "date": now, "recording_url": None, "created_at": now,
+        }
+
+    def _check(self, table: str, row: dict) -> Optional[Response]:
+        """Column constraints from schema.sql. Returns an error response or None."""
+        if table == "leads":
+            if not row.get("name"):
+                return _error(400, "23502", 'null value in column "name" violates not-null constraint')
+            if row.get("status") is not None and row["status"] not in LEAD_STATUSES:
+                return _error(400, "23514", 'new row violates check constraint "leads_status_check"')
+        else:
+            if row.get("type") is not None and row["type"] not in INTERACTION_TYPES:
+                return _error(400, "23514", 'new row violates check constraint "interactions_type_check"')
+            if row.get("lead_id") is not None and row["lead_id"] not in self.leads:
+                return _error(409, "23503", 'insert or update violates foreign key constraint "interactions_lead_id_fkey"')
+        return None
+
+    async def _tick(self):
+        self.requests += 1
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+
+    async def table_endpoint(self, request: Request) -> Response:
+        table = request.path_params["table"]
+        if table not in self.tables:
+            return _error(404, "42P01", f'relation "public.{table}" does not exist')
+        await self._tick()
+        if request.method == "GET":
+            return self._select(table, request)
+        if request.method == "POST":
+            return await self._insert(table, request)
+        if request.method == "PATCH":
+            return await self._update(table, request)
+        return self._delete(table, request)
+
+    def _matching(self, table: str, request: Request) -> List[dict]:
+        filters = row_filters(request)
+        rows = self.tables[table]
+        # Primary key lookups (id=eq.x, id=in.(...)) go straight to the rows.
+        by_id = request.query_params.get("id", "")
+        if by_id.startswith("eq."):
+            candidates = [rows[key] for key in [by_id[3:]] if key in rows]
+        elif by_id.startswith("in.(") and by_id.endswith(")"):
+            candidates = [rows[key] for key in dict.fromkeys(_unquote(k) for k in _split_top(by_id[4:-1])) if key in rows]
+        else:
+            candidates = rows.values()
+        return [row for row in candidates if all(f(row) for f in filters)]
+
+    def _select(self, table: str, request: Request) -> Response:
+        params = request.query_params
+        rows = apply_order(self._matching(table, request), params.get("order"))
+        total = len(rows)
+        offset = int(params.get("offset", 0))
+        limit = params.get("limit")
+        rows = rows[offset:offset + int(limit)] if limit is not None else rows[offset:]
+        body = [project(row, params.get("select")) for row in rows]
+
+        headers = {}
+        if "count=exact" in _prefer(request):
+            shown = f"{offset}-{offset + len(body) - 1}" if body else "*"
+            headers["Content-Range"] = f"{shown}/{total}"
+        return _json(body, headers=headers)
+
+    def _represent(self, request: Request, rows: List[dict], status: int) -> Response:
+        if "return=representation" not in _prefer(request):
+            return Response(status_code=204 if status == 200 else status)
+        select = request.query_params.get("select")
+        return _json([project(row, select) for row in rows], status=status)
+
+    async def _insert(self, table: str, request: Request) -> Response:
+        prefer = _prefer(request)
+        payload = json.loads(await request.body())
+        rows_in = payload if isinstance(payload, list) else [payload]
+        columns = request.query_params.get("columns")
+        columns = columns.split(",") if columns else None
+        conflict = request.query_params.get("on_conflict")
+        ignore_duplicates = "resolution=ignore-duplicates" in prefer and conflict in ("email", "id")
+        if "resolution=merge-duplicates" in prefer and request.query_params.get("on_conflict", "id") == "id":
+            return await self._upsert(table, request, rows_in, columns)
+
+        # Validate the whole statement first so a failure inserts nothing.
+        # Like now() in Postgres, every row of one statement shares a timestamp.
+        now = _now()
+        existing = self.tables[table]
+        emails = self.emails if table == "leads" else set()
+        inserted, seen_ids, seen_emails = [], set(), set()
+        for item in rows_in:
+            row = self._defaults(table, now)
+            for key in (columns if columns is not None else item.keys()):
+                if key in item:
+                    row[key] = item[key]
+            if error := self._check(table, row):
+                return error
+            if row["id"] in existing or row["id"] in seen_ids:
+                if ignore_duplicates and conflict == "id":
+                    continue
+                return _error(409, "23505", f'duplicate key value violates unique constraint "{table}_pkey"')
+            email = row.get("email") if table == "leads" else None
+            if email is not None and (email in emails or email in seen_emails):
+                if ignore_duplicates and conflict == "email":
+                    continue
+                return _error(409, "23505", 'duplicate key value violates unique constraint "leads_email_unique"')
+            seen_ids.add(row["id"])
+            if email is not None:
+                seen_emails.add(email)
+            inserted.append(row)
+
+        for row in inserted:
+            existing[row["id"]] = row
+        emails |= seen_emails
+        if table == "leads" and self._blocks is not None:
+            self._index_blocks(inserted)
+        return self._represent(request, inserted, 201)
+
+    async def _upsert(self, table: str, request: Request, rows_in: List[dict], columns: Optional[List[str]]) -> Response:
+        """ON CONFLICT (id) DO UPDATE: existing rows get the sent columns, new ones are inserted."""
+        now = _now()
+        existing = self.tables[table]
+        written = []
+        for item in rows_in:
+            changes = {key: item[key] for key in (columns if columns is not None else item.keys()) if key in item}
+            row = {**existing[item["id"]], **changes} if item.get("id") in existing else {**self._defaults(table, now), **changes}
+            if error := self._check(table, row):
+                return error
+            written.append(row)
+        for row in written:
+            if table == "leads" and row["id"] in existing:
+                row["updated_at"] = now
+            existing.setdefault(row["id"], row).update(row)
+        if table == "leads":
+            self._blocks = None
+        return self._represent(request, written, 201)
+
+    async def _update(self, table: str, request: Request) -> Response:
+        changes = json.loads(await request.body())
+        rows = self._matching(table, request)
+        for row in rows:
+            if error := self._check(table, {**row, **changes}):
+                return error
+        if table == "leads" and {"name", "email", "phone"} & changes.keys():
+            self._blocks = None
+        for row in rows:
+            if table == "leads" and "email" in changes:
+                self.emails.discard(row.get("email"))
+                if changes["email"] is not None:
+                    self.emails.add(changes["email"])
+            row.update(changes)
+            if table == "leads" and "updated_at" not in changes:
+                row["updated_at"] = _now()
+        return self._represent(request, rows, 200)
+
+    def _delete(self, table: str, request: Request) -> Response:
+        rows = self._matching(table, request)
+        for row in rows:
+            del self.tables[table][row["id"]]
+            if table == "leads":
+                self.emails.discard(row.get("email"))
+                self._blocks = None
+        return self._represent(request, rows, 200)
+
+    async def rpc_endpoint(self, request: Request) -> Response:
+        handler = getattr(self, f"rpc_{request.path_params['function']}", None)
+        if handler is None:
+            return _error(404, "PGRST202", f"Could not find the function public.{request.path_params['function']}")
+        await self._tick()
+        body = await request.body()
+        args = json.loads(body) if body else {k: v for k, v in request.query_params.items() if k != "select"}
+        result = handler(**args)
+        # Functions returning rows of a table accept select= like the table itself.
+        if select := request.query_params.get("select"):
+            result = [project(row, select) for row in result]
+        return _json(result)
+
+    def rpc_transition_leads(self, lead_ids: list, to_status: str, allowed_from: list,
+                             note: Optional[str] = None, log: bool = True) -> list:
+        now = _now()
+        out = []
+        for lead_id in dict.fromkeys(lead_ids):
+            lead = self.leads.get(lead_id)
+            if lead is None:
+                continue
+            current = lead.get("status") or "New"
+            if current == to_status:
+                outcome = "unchanged"
+            elif current in allowed_from:
+                outcome = "moved"
+                lead["status"], lead["updated_at"] = to_status, now
+                if log:
+                    interaction = self._defaults("interactions", now)
+                    summary = f"Status changed from {current} to {to_status}"
+                    interaction.update(lead_id=lead_id, type="Note", summary=f"{summary}: {note}" if note else summary)
+                    self.interactions[interaction["id"]] = interaction
+            else:
+                outcome = "rejected"
+            out.append({"id": lead_id, "from_status": current, "outcome": outcome})
+        return out
+
+    def rpc_lead_status_counts(self) -> list:
+        counts: dict[str, int] = {}
+        for row in self.leads.values():
+            counts[row["status"]] = counts.get(row["status"], 0) + 1
+        return [{"status": status, "total": total} for status, total in counts.items()]
+
+    def _index_blocks(self, rows: List[dict]):
+        from dedup import name_block, phone_key
+
+        for row in rows:
+            for key in ("p" + (phone_key(row.get("phone")) or ""), "n" + (name_block(row.get("name"), row.get("email")) or "")):
+                if len(key) > 1:
+                    self._blocks.setdefault(key, []).append(row["id"])
+
+    def rpc_dedup_candidates(self, phone_keys: list, name_blocks: list, block_limit: int = 50) -> list:
+        if self._blocks is None:
+            self._blocks = {}
+            self._index_blocks(apply_order(list(self.leads.values()), "created_at.asc"))
+        found = {}
+        for key in ["p" + k for k in phone_keys or ()] + ["n" + k for k in name_blocks or ()]:
+            for lead_id in self._blocks.get(key, [])[:block_limit]:
+                row = self.leads[lead_id]
+                found[lead_id] = {k: row.get(k) for k in ("id", "name", "email", "phone")}
+                found[lead_id]["duplicate_of"] = (row.get("meta_data") or {}).get("possible_duplicate_of")
+        return list(found.values())
+
+    def rpc_search_leads(self, query: str, max_candidates: int = 100) -> list:
+        # A scan standing in for the three index lookups in schema.sql; same candidates, roughly.
+        from rapidfuzz import fuzz, process
+
+        text = " ".join(query.lower().split())
+        digits = re.sub(r"[^0-9]", "", query)
+        words = [w for w in re.sub(r"[^0-9a-z ]", " ", text).split()]
+        leads = list(self.leads.values())
+        found = {}
+        if len(digits) >= 4:
+            for row in leads:
+                if digits in (row.get("phone") and re.sub(r"[^0-9]", "", row["phone"])[-10:] or ""):
+                    found[row["id"]] = row
+                    if len(found) >= max_candidates:
+                        break
+        if words:
+            matched = 0
+            for row in leads:
+                document = " ".join(row.get(f) or "" for f in ("name", "company", "notes")).lower()
+                tokens = re.sub(r"[^0-9a-z ]", " ", document).split()
+                if all(any(token.startswith(w) for token in tokens) for w in words):
+                    found[row["id"]] = row
+                    matched += 1
+                    if matched >= max_candidates:
+                        break
+        search_text = [f"{row.get('name') or ''} {row.get('company') or ''}".lower() for row in leads]
+        for _, _, i in process.extract(text, search_text, scorer=fuzz.partial_ratio, limit=max_candidates):
+            found[leads[i]["id"]] = leads[i]
+        return list(found.values())
+
+    def _interactions_by_lead(self, lead_ids: list) -> dict:
+        wanted = {str(lead_id) for lead_id in lead_ids}
+        grouped: dict[str, list] = {lead_id: [] for lead_id in wanted}
+        for row in self.interactions.values():
+            if row.get("lead_id") in wanted:
+                grouped[row["lead_id"]].append(row)
+        for rows in grouped.values():
+            rows.sort(key=lambda row: (row["date"], row["id"]), reverse=True)
+        return grouped
+
+    def rpc_interaction_timelines(self, lead_ids: list, per_lead: int = 20, cursors: Optional[dict] = None) -> list:
+        grouped = self._interactions_by_lead(lead_ids)
+        out = []
+        for lead_id in dict.fromkeys(str(lead_id) for lead_id in lead_ids):
+            rows = grouped[lead_id]
+            if cursor := (cursors or {}).get(lead_id):
+                rows = [row for row in rows if (row["date"], row["id"]) < tuple(cursor)]
+            out.extend(rows[:per_lead])
+        return out
+
+    def rpc_interaction_summaries(self, lead_ids: list) -> list:
+        grouped = self._interactions_by_lead(lead_ids)
+        out = []
+        for lead_id in dict.fromkeys(str(lead_id) for lead_id in lead_ids):
+            rows = grouped[lead_id]
+            last = rows[0] if rows else {}
+            out.append({"lead_id": lead_id, "total": len(rows), "last_type": last.get("type"),
+                        "last_date": last.get("date"), "last_summary": last.get("summary")})
+        return out
+
+
+    def rpc_merge_lead_meta_data(self, patches: list) -> list:
+        now = _now()
+        out = []
+        for patch in patches:
+            lead = self.leads.get(patch["id"])
+            if lead is None:
+                continue
+            meta = dict(lead.get("meta_data") or {})
+            if "enrichment" in patch["meta_data"]:
+                enrichment = {**(meta.get("enrichment") or {}), **patch["meta_data"]["enrichment"]}
+                meta.update(patch["meta_data"], enrichment=enrichment)
+            else:
+                meta.update(patch["meta_data"])
+            lead["meta_data"], lead["updated_at"] = meta, now
+            out.append({"id": lead["id"], "meta_data": meta})
+        return out
+
+
+def serve_in_thread(app, port: int = 0):
+    """Serves an ASGI app (usually FakePostgREST().app) on a background uvicorn server. Returns (server, base_url)."""
+    import socket
+    import uvicorn
+
+    sock = socket.socket()
+    # Accepted sockets inherit this; without it Nagle + delayed ACK adds ~40ms per response.
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.bind(("127.0.0.1", port))
+    port = sock.getsockname()[1]
+    config = uvicorn.Config(app, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f"http://127.0.0.1:{port}"
+
+
+if __name__ == "__main__":
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the local PostgREST stand-in.")
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many extra seconds, uniformly random.")
+    parser.add_argument("--seed", type=int, default=0, help="Start with this many synthetic leads.")
+    args = parser.parse_args()
+    fake = FakePostgREST(latency=args.latency, jitter=args.jitter)
+    fake.seed(args.seed)
+    uvicorn.run(fake.app, host="127.0.0.1", port=args.port)
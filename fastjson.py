@@ -0,0 +1,45 @@
+"""
+JSON in and out of the hot read paths without the generic machinery.
+
+Upstream bodies are parsed straight from bytes with orjson (not httpx's
+response.json(), which decodes to str first), and handlers return the
+encoded bytes in a JSONBytesResponse. FastAPI passes a Response through
+untouched, so the jsonable_encoder walk over every row and the stdlib
+encoder are both skipped. orjson also reuses one str object for repeated
+short keys, so a page of leads carries a single copy of "created_at".
+
+Without orjson installed the stdlib json module is used, with the same
+output as FastAPI's JSONResponse.
+"""
+import json
+from typing import Any
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+
+def loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, default=str)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str).encode()
+
+
+class JSONBytesResponse(Response):
+    """A JSON response whose body is encoded once, by dumps(), or passed in already encoded."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, (bytes, bytearray, memoryview)):
+            return bytes(content)
+        return dumps(content)
@@ -0,0 +1,37 @@
+"""
+Gunicorn settings for running the API on several cores:
+
+    gunicorn main:app -c gunicorn.conf.py
+
+    WEB_CONCURRENCY     worker processes (default: one per CPU)
+    PORT                listen port (default 8000)
+
+Each worker is a separate uvicorn event loop with its own HTTP pool,
+pipeline snapshot and event subscribers. Anything the workers must agree
+on goes through the shared cache backend, so with more than one worker
+CACHE_BACKEND defaults to `sqlite` (cache.db next to the app); set it to a
+redis:// URL when workers run on several hosts.
+"""
+import multiprocessing
+import os
+
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+# /sync of a large batch and /leads/export can run for a while.
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then so slow leaks can't accumulate; jitter keeps
+# them from all restarting at once.
+max_requests = 10000
+max_requests_jitter = 1000
+
+# The app is imported in each worker, not the master: the HTTP pool and the
+# asyncio state it creates can't be shared across fork.
+preload_app = False
+
+if workers > 1:
+    os.environ.setdefault("CACHE_BACKEND", "sqlite")
@@ -0,0 +1,187 @@
+"""
+Durable job queue for post-sync enrichment.
+
+/sync enqueues the IDs of newly inserted leads and `python worker.py`
+drains them in a separate process, so queued scoring survives a restart
+and heavy syncs don't compete with request serving.
+
+Backends are chosen with ENRICHMENT_QUEUE:
+    inline              no queue; FastAPI BackgroundTasks (default)
+    sqlite              SQLiteJobQueue at JOB_QUEUE_PATH (default jobs.db)
+    package.module:Cls  any JobQueue subclass, constructed without arguments
+"""
+import importlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, List, Optional
+
+MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "5"))
+
+
+@dataclass
+class Job:
+    id: int
+    payload: Any
+    attempts: int
+    enqueued_at: float
+
+
+class JobQueue:
+    """Interface every queue backend implements."""
+
+    def enqueue(self, payloads: List[Any]) -> int:
+        raise NotImplementedError
+
+    def lease(self, limit: int, visibility_timeout: float) -> List[Job]:
+        """
+        Claims up to `limit` ready jobs. A leased job is invisible to other
+        workers until it is acked, failed, or its visibility timeout passes.
+        """
+        raise NotImplementedError
+
+    def ack(self, job_ids: List[int]):
+        raise NotImplementedError
+
+    def fail(self, job_ids: List[int], error: str, retry_delay: float = 30.0):
+        """Makes jobs available again after retry_delay, or dead-letters them after MAX_ATTEMPTS."""
+        raise NotImplementedError
+
+    def delay(self, job_ids: List[int], delay: float):
+        """Makes leased jobs available again after `delay` without using up an attempt."""
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        """Queue depth and lag, for scaling workers."""
+        raise NotImplementedError
+
+
+class SQLiteJobQueue(JobQueue):
+    """Queue in a local SQLite file (WAL mode), safe to share between processes on one host."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.environ.get("JOB_QUEUE_PATH", "jobs.db")
+        with self._connect() as db:
+            db.execute("pragma journal_mode=wal")
+            db.execute("""
+                create table if not exists jobs (
+                    id integer primary key autoincrement,
+                    payload text not null,
+                    attempts integer not null default 0,
+                    enqueued_at real not null,
+                    available_at real not null,
+                    leased_until real,
+                    last_error text,
+                    dead integer not null default 0
+                )
+            """)
+            db.execute("create index if not exists jobs_ready_idx on jobs(dead, available_at)")
+
+    @contextmanager
+    def _connect(self):
+        # A connection per call keeps this usable from worker threads and other processes.
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def enqueue(self, payloads: List[Any]) -> int:
+        now = time.time()
+        with self._connect() as db:
+            db.execute("begin immediate")
+            db.executemany(
+                "insert into jobs (payload, enqueued_at, available_at) values (?, ?, ?)",
+                [(json.dumps(payload), now, now) for payload in payloads],
+            )
+            db.execute("commit")
+        return len(payloads)
+
+    def lease(self, limit: int, visibility_timeout: float) -> List[Job]:
+        now = time.time()
+        with self._connect() as db:
+            db.execute("begin immediate")
+            rows = db.execute(
+                """
+                select id, payload, attempts, enqueued_at from jobs
+                where dead = 0 and available_at <= ? and (leased_until is null or leased_until < ?)
+                order by id limit ?
+                """,
+                (now, now, limit),
+            ).fetchall()
+            db.executemany(
+                "update jobs set leased_until = ?, attempts = attempts + 1 where id = ?",
+                [(now + visibility_timeout, row[0]) for row in rows],
+            )
+            db.execute("commit")
+        return [Job(id=row[0], payload=json.loads(row[1]), attempts=row[2] + 1, enqueued_at=row[3]) for row in rows]
+
+    def ack(self, job_ids: List[int]):
+        with self._connect() as db:
+            db.executemany("delete from jobs where id = ?", [(job_id,) for job_id in job_ids])
+
+    def fail(self, job_ids: List[int], error: str, retry_delay: float = 30.0):
+        now = time.time()
+        with self._connect() as db:
+            db.execute("begin immediate")
+            db.executemany(
+                """
+                update jobs set leased_until = null, last_error = ?, available_at = ?,
+                                dead = case when attempts >= ? then 1 else 0 end
+                where id = ?
+                """,
+                [(error, now + retry_delay, MAX_ATTEMPTS, job_id) for job_id in job_ids],
+            )
+            db.execute("commit")
+
+    def delay(self, job_ids: List[int], delay: float):
+        with self._connect() as db:
+            db.executemany(
+                "update jobs set leased_until = null, available_at = ?, attempts = max(attempts - 1, 0) where id = ?",
+                [(time.time() + delay, job_id) for job_id in job_ids],
+            )
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self._connect() as db:
+            ready, in_flight, delayed, dead, oldest = db.execute(
+                """
+                select
+                    coalesce(sum(dead = 0 and available_at <= ? and (leased_until is null or leased_until < ?)), 0),
+                    coalesce(sum(dead = 0 and leased_until >= ?), 0),
+                    coalesce(sum(dead = 0 and available_at > ? and leased_until is null), 0),
+                    coalesce(sum(dead = 1), 0),
+                    min(case when dead = 0 then enqueued_at end)
+                from jobs
+                """,
+                (now, now, now, now),
+            ).fetchone()
+        return {
+            "backend": "sqlite",
+            "depth": ready,
+            "in_flight": in_flight,
+            "delayed": delayed,
+            "dead": dead,
+            "lag_seconds": round(now - oldest, 3) if oldest else 0.0,
+        }
+
+
+_queue: Optional[JobQueue] = None
+
+
+def get_queue() -> Optional[JobQueue]:
+    """The configured queue, or None when enrichment runs inline."""
+    global _queue
+    backend = os.environ.get("ENRICHMENT_QUEUE", "inline")
+    if backend == "inline":
+        return None
+    if _queue is None:
+        if backend == "sqlite":
+            _queue = SQLiteJobQueue()
+        else:
+            module, _, name = backend.partition(":")
+            _queue = getattr(importlib.import_module(module), name)()
+    return _queue
@@ -0,0 +1,290 @@
+"""
+Read-through cache of lead rows and pages for /leads, /pipeline, /stats
+and /health.
+
+Leads only change through /sync and background enrichment, and both run
+here, so they write through to the cache instead of waiting for it to
+expire:
+
+    rows    lead id -> row, LRU-bounded at LEAD_CACHE_SIZE rows
+    pages   query shape (filters, limit, cursor) -> lead ids and next cursor,
+            LRU-bounded at LEAD_CACHE_PAGES, each kept LEAD_CACHE_TTL seconds
+
+Pages hold ids and are read through the rows, so a row updated in place
+shows on every page that lists it. A new lead is newer than every cursor,
+so an insert only touches first pages, and is merged into them rather than
+dropping them. A status change drops the pages filtered on status (the
+/pipeline columns).
+
+Writes made elsewhere (other workers, worker.py, the dashboard, SQL) are
+caught with a high-water mark on updated_at. At most every
+LEAD_CACHE_CHECK_INTERVAL seconds one indexed query fetches the leads
+updated since the newest updated_at seen. LEAD_CACHE_CHECK_OVERLAP seconds
+are re-read each time, for transactions that committed out of order. The
+rows it finds are applied like local writes, and also refresh /stats and
+the pipeline snapshot. More than LEAD_CACHE_REFRESH_LIMIT of them empties
+the cache instead. Needs the updated_at trigger and index in schema.sql.
+Deletes don't move updated_at; deleted leads leave with their pages'
+TTL. The same query is /health's database probe.
+
+Lookups are counted as hits and misses per kind (cache_requests_total
+in /metrics, and GET /cache/info).
+
+    LEAD_CACHE          "1" (default) to serve /leads and /pipeline pages from the cache
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import fastjson
+import rest
+from cache import stats_cache
+from metrics import CACHE_REQUESTS
+from pagination import LEAD_KEYS, LEAD_SELECT, encode_cursor
+from pipeline import pipeline_snapshot
+
+LEAD_CACHE_ENABLED = os.environ.get("LEAD_CACHE", "1") == "1"
+LEAD_CACHE_SIZE = int(os.environ.get("LEAD_CACHE_SIZE", "10000"))
+LEAD_CACHE_PAGES = int(os.environ.get("LEAD_CACHE_PAGES", "500"))
+LEAD_CACHE_TTL = float(os.environ.get("LEAD_CACHE_TTL", "30"))
+LEAD_CACHE_CHECK_INTERVAL = float(os.environ.get("LEAD_CACHE_CHECK_INTERVAL", "2"))
+LEAD_CACHE_CHECK_OVERLAP = float(os.environ.get("LEAD_CACHE_CHECK_OVERLAP", "5"))
+LEAD_CACHE_REFRESH_LIMIT = int(os.environ.get("LEAD_CACHE_REFRESH_LIMIT", "500"))
+
+PageKey = Tuple[Tuple[str, ...], int, Optional[str]]
+Loader = Callable[[], Awaitable[Tuple[List[dict], Optional[str]]]]
+
+
+def _matches(conditions: Tuple[str, ...], row: dict) -> Optional[bool]:
+    """Whether a row passes a page's filters; None for filters this can't evaluate."""
+    for condition in conditions:
+        if not condition.startswith("status.eq."):
+            return None
+        if row.get("status") != condition[len("status.eq."):]:
+            return False
+    return True
+
+
+def _overlap_start(updated_at: str, overlap: float) -> str:
+    # PostgREST sends UTC (+00:00); second precision is plenty for a window of seconds.
+    start = datetime.fromisoformat(updated_at[:19]) - timedelta(seconds=overlap)
+    return start.strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+
+
+class LeadCache:
+    def __init__(self, size: int = LEAD_CACHE_SIZE, pages: int = LEAD_CACHE_PAGES, ttl: float = LEAD_CACHE_TTL,
+                 check_interval: float = LEAD_CACHE_CHECK_INTERVAL, overlap: float = LEAD_CACHE_CHECK_OVERLAP,
+                 refresh_limit: int = LEAD_CACHE_REFRESH_LIMIT):
+        self.size = size
+        self.max_pages = pages
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.overlap = overlap
+        self.refresh_limit = refresh_limit
+        self.rows: "OrderedDict[str, dict]" = OrderedDict()
+        # key -> (stored at, lead ids, next cursor)
+        self.pages: "OrderedDict[PageKey, Tuple[float, List[str], Optional[str]]]" = OrderedDict()
+        self.high_water: Optional[str] = None
+        # updated_at of the rows inside the overlap window, so re-reading them isn't mistaken for a change.
+        self._seen: Dict[str, str] = {}
+        self.checked_at = 0.0
+        self.check_error: Optional[str] = None
+        self.refreshed = 0
+        self.evictions = 0
+        self._check_lock = asyncio.Lock()
+        self._inflight: Dict[PageKey, asyncio.Future] = {}
+        # Bumped by every write, so a page loaded across one isn't stored.
+        self._generation = 0
+
+    def _count(self, kind: str, hit: bool):
+        CACHE_REQUESTS.inc(kind, "hit" if hit else "miss")
+
+    async def page(self, conditions: Tuple[str, ...], limit: int, cursor: Optional[str], loader: Loader) -> Tuple[List[dict], Optional[str]]:
+        """One page of full rows, from the cache or `loader`. The rows are copies the caller may modify."""
+        await self.ensure_fresh()
+        key = (conditions, limit, cursor)
+        entry = self.pages.get(key)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl:
+            rows = [self.rows.get(lead_id) for lead_id in entry[1]]
+            if None not in rows:
+                self._count("page", True)
+                self.pages.move_to_end(key)
+                for lead_id in entry[1]:
+                    self.rows.move_to_end(lead_id)
+                return [dict(row) for row in rows], entry[2]
+        self._count("page", False)
+
+        if key in self._inflight:
+            rows, next_cursor = await asyncio.shield(self._inflight[key])
+            return [dict(row) for row in rows], next_cursor
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        generation = self._generation
+        try:
+            rows, next_cursor = await loader()
+            if generation == self._generation:
+                self._store_rows(rows)
+                self._store_page(key, [row["id"] for row in rows], next_cursor)
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        else:
+            future.set_result((rows, next_cursor))
+            return [dict(row) for row in rows], next_cursor
+        finally:
+            self._inflight.pop(key, None)
+
+    def _store_rows(self, rows: List[dict]):
+        for row in rows:
+            self.rows[row["id"]] = dict(row)
+            self.rows.move_to_end(row["id"])
+        while len(self.rows) > self.size:
+            self.rows.popitem(last=False)
+            self.evictions += 1
+
+    def _store_page(self, key: PageKey, ids: List[str], next_cursor: Optional[str]):
+        self.pages[key] = (time.monotonic(), ids, next_cursor)
+        self.pages.move_to_end(key)
+        while len(self.pages) > self.max_pages:
+            self.pages.popitem(last=False)
+            self.evictions += 1
+
+    def _merge_first_pages(self, leads: List[dict]):
+        """Adds leads to the first pages whose filters they pass, keeping order, limit and next cursor right."""
+        for key in [key for key in self.pages if key[2] is None]:
+            conditions, limit, _ = key
+            stored_at, ids, next_cursor = self.pages[key]
+            fits = [lead for lead in leads if lead["id"] not in ids and _matches(conditions, lead)]
+            if any(_matches(conditions, lead) is None for lead in leads) or any(lead_id not in self.rows for lead_id in ids):
+                del self.pages[key]
+                continue
+            if not fits:
+                continue
+            rows = sorted([self.rows[lead_id] for lead_id in ids] + fits,
+                          key=lambda row: (row["created_at"], row["id"]), reverse=True)
+            if len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = encode_cursor(rows[-1], LEAD_KEYS)
+            self.pages[key] = (stored_at, [row["id"] for row in rows], next_cursor)
+
+    def _drop_pages(self, first: bool = False, filtered: bool = False):
+        for key in [key for key in self.pages if (first and key[2] is None) or (filtered and key[0])]:
+            del self.pages[key]
+
+    def write(self, leads: List[dict], inserted: bool = False):
+        """
+        Applies leads written by this process. Inserted rows are cached and
+        merged into the first pages; other rows update cached ones in place
+        (e.g. {"id": ..., "meta_data": ...}).
+        """
+        self._generation += 1
+        if inserted:
+            self._store_rows(leads)
+            self._merge_first_pages(leads)
+            return
+        for lead in leads:
+            if (row := self.rows.get(lead["id"])) is not None:
+                row.update(lead)
+
+    def set_status(self, lead_ids: List[str], status: str):
+        self._generation += 1
+        for lead_id in lead_ids:
+            if (row := self.rows.get(lead_id)) is not None:
+                row["status"] = status
+        self._drop_pages(filtered=True)
+
+    def clear(self):
+        self._generation += 1
+        self.rows.clear()
+        self.pages.clear()
+
+    async def ensure_fresh(self) -> bool:
+        """Runs the high-water-mark check if the last one is older than the interval. True if it ran."""
+        if time.monotonic() - self.checked_at < self.check_interval:
+            return False
+        async with self._check_lock:
+            if time.monotonic() - self.checked_at < self.check_interval:
+                return False
+            try:
+                await self._check()
+                self.check_error = None
+            except Exception as e:
+                self.check_error = str(e)
+            self.checked_at = time.monotonic()
+            return True
+
+    async def _check(self):
+        params = {"select": LEAD_SELECT, "order": "updated_at.desc,id.desc", "limit": str(self.refresh_limit + 1)}
+        if self.high_water is None:
+            params["limit"] = "1"
+        else:
+            params["updated_at"] = f"gt.{_overlap_start(self.high_water, self.overlap)}"
+        response = await rest.get_client().get(rest.rest_url("leads"), params=params, headers=rest.auth_headers())
+        if response.status_code != 200:
+            raise Exception(response.text)
+        rows = fastjson.loads(response.content)
+        if self.high_water is None:
+            # First check: nothing cached yet, only the mark to set.
+            self.high_water = rows[0]["updated_at"] if rows else "1970-01-01T00:00:00+00:00"
+            return
+        if len(rows) > self.refresh_limit:
+            self.clear()
+            await stats_cache.invalidate("stats")
+            pipeline_snapshot.expire()
+        else:
+            await self._apply([row for row in rows if self._seen.get(row["id"]) != row["updated_at"]])
+        self._seen = {row["id"]: row["updated_at"] for row in rows}
+        if rows and rows[0]["updated_at"] > self.high_water:
+            self.high_water = rows[0]["updated_at"]
+
+    async def _apply(self, rows: List[dict]):
+        """Brings in rows changed elsewhere. Rows this process wrote already match and change nothing."""
+        if not rows:
+            return
+        self._generation += 1
+        unknown, moved = [], False
+        for row in rows:
+            cached = self.rows.get(row["id"])
+            if cached is None:
+                unknown.append(row)
+            elif cached.get("status") != row.get("status"):
+                moved = True
+            if cached is not None and cached != row:
+                cached.clear()
+                cached.update(row)
+        self.refreshed += len(rows)
+        # An unknown row is new or one we don't hold; either way it may have entered a status filter.
+        self._drop_pages(filtered=moved or bool(unknown))
+        if unknown:
+            self._store_rows(unknown)
+            self._merge_first_pages(unknown)
+        if unknown or moved:
+            await stats_cache.invalidate("stats")
+        pipeline_snapshot.upsert(rows)
+
+    async def health(self) -> Optional[str]:
+        """None if the database answered the latest check, else why not; checks again when due."""
+        self._count("health", not await self.ensure_fresh())
+        return self.check_error
+
+    def info(self) -> dict:
+        return {
+            "enabled": LEAD_CACHE_ENABLED,
+            "rows": len(self.rows),
+            "pages": len(self.pages),
+            "evictions": self.evictions,
+            "refreshed": self.refreshed,
+            "high_water": self.high_water,
+            "check_error": self.check_error,
+            "requests": {
+                kind: {"hit": CACHE_REQUESTS.value(kind, "hit"), "miss": CACHE_REQUESTS.value(kind, "miss")}
+                for kind in ("page", "health")
+            },
+        }
+
+
+lead_cache = LeadCache()
@@ -0,0 +1,34 @@
+"""
+Logging setup.
+
+    LOG_LEVEL         root level (default INFO)
+    LOG_SAMPLE_RATE   fraction of per-lead DEBUG/INFO messages kept (default 0.01)
+
+Per-lead messages go through log_sampled(), which returns before doing any
+work when their level is disabled, so high-volume syncs pay nothing for them.
+Warnings and errors are never sampled away.
+"""
+import logging
+import os
+import random
+
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "0.01"))
+
+
+def configure():
+    """Installs a stderr handler at LOG_LEVEL unless logging is already configured."""
+    logging.basicConfig(
+        level=os.environ.get("LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+    # httpx logs every request at INFO; the upstream histogram covers that.
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def log_sampled(logger: logging.Logger, level: int, msg: str, *args):
+    """
+    Logs roughly LOG_SAMPLE_RATE of the DEBUG/INFO calls and every WARNING
+    and above. Arguments are formatted only for kept messages.
+    """
+    if logger.isEnabledFor(level) and (level >= logging.WARNING or random.random() < LOG_SAMPLE_RATE):
+        logger.log(level, msg, *args)
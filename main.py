@@ -1,15 +1,55 @@
-from fastapi import FastAPI, BackgroundTasks
+from fastapi import FastAPI, BackgroundTasks, Query, Request, Response
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
+from typing import Optional
+import asyncio
+import csv
+import io
+import json
+import logging
+import mimetypes
 import os
-from models import SyncRequest
-from database import supabase
+import uuid
+from models import LeadCreate, RecordingUploadCreate, StatusUpdateRequest, SyncRequest, TimelineRequest, lead_rows
 from utils import process_leads_background
+from enrichment import enrichment_pipeline
+from jobs import get_queue
+from sessions import SessionBusy, assign_lead_ids, get_session_store, request_hash
+import rest
+from cache import stats_cache
+from events import broker
+from dedup import DEDUP_ENABLED, tag_duplicates
+from pagination import LEAD_SELECT, page_params, select_fields, split_page
+import search
+import timelines
+import transitions
+import storage
+from storage import UPLOAD_MAX_BYTES, UploadBusy, UploadOffsetMismatch
+from search import MIN_QUERY_LENGTH, SEARCH_FIELDS
+from pipeline import PIPELINE_COLUMNS, PIPELINE_FIELDS, PIPELINE_SELECT, SNAPSHOT_ENABLED, pipeline_snapshot
+from lead_cache import LEAD_CACHE_ENABLED, lead_cache
+import metrics
+import fastjson
+from fastjson import JSONBytesResponse
+from metrics import span
+from logs import configure as configure_logging, log_sampled
 
 
 load_dotenv()
+configure_logging()
+logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Lead Management API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    rest.get_client()
+    yield
+    await rest.close_client()
+
+app = FastAPI(title="Lead Management API", version="1.0.0", lifespan=lifespan)
 
 
 origins = ["*"]  
@@ -20,219 +60,838 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Next-Cursors", "X-Pipeline-Version", "Upload-Offset"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
 
-from zoneinfo import ZoneInfo
-from datetime import datetime
+from timefmt import to_ist_many
 
-def to_ist(utc_str: str) -> str:
-    """Converts a UTC ISO string to an IST string."""
-    if not utc_str: return utc_str
-    try:
-        # Supabase returns strings like 2024-02-14T12:00:00+00:00
-        dt = datetime.fromisoformat(utc_str.replace("Z", "+00:00"))
-        ist_dt = dt.astimezone(ZoneInfo("Asia/Kolkata"))
-        return ist_dt.strftime("%Y-%m-%d %H:%M:%S IST")
-    except:
-        return utc_str
+# IST_IN_SQL=1 has Postgres format the timestamps (computed columns
+# created_at_ist/captured_at_ist in schema.sql) instead of this process.
+IST_IN_SQL = os.environ.get("IST_IN_SQL", "0") == "1"
+IST_FIELDS = ("captured_at", "created_at")
+INTERACTION_IST_FIELDS = ("date", "created_at")
+
+def localize(leads: list[dict], in_sql: bool = IST_IN_SQL, fields=IST_FIELDS):
+    """
+    Rewrites the timestamp fields of each lead (when selected) to IST in place.
+    in_sql=False forces conversion here, for rows that didn't come with the SQL-side columns.
+    """
+    with span("to_ist"):
+        _localize(leads, in_sql, fields)
+
+def _localize(leads: list[dict], in_sql: bool, fields=IST_FIELDS):
+    for field in fields:
+        if in_sql:
+            computed = f"{field}_ist"
+            for lead in leads:
+                if computed in lead:
+                    lead[field] = lead.pop(computed)
+            continue
+        selected = [lead for lead in leads if field in lead]
+        for lead, value in zip(selected, to_ist_many(lead[field] for lead in selected)):
+            lead[field] = value
+
+def ist_select(select: str) -> str:
+    """Adds the SQL-side IST columns for the selected timestamp fields when IST_IN_SQL is on."""
+    if not IST_IN_SQL:
+        return select
+    columns = select.split(",")
+    extra = [f"{field}_ist" for field in IST_FIELDS if field in columns]
+    return ",".join(columns + extra)
 
 @app.get("/")
 def root():
     return {"message": "Lead Management API is running"}
 
+@app.get("/metrics")
+def get_metrics():
+    """
+    Latency histograms for this process in Prometheus text format.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
-def health_check():
+async def health_check():
     """
     Health check endpoint for the dashboard to verify DB connection.
+    Answered from the lead cache's latest updated_at check, which reaches
+    the database at most every LEAD_CACHE_CHECK_INTERVAL seconds.
+    """
+    error = await lead_cache.health()
+    if error is None:
+        return {"status": "ok", "db": "connected"}
+    return {"status": "error", "db": "disconnected", "details": error}
+
+@app.get("/cache/info")
+def cache_info():
+    """
+    Lead cache size, hit/miss counts and high-water mark for this process.
+    """
+    return lead_cache.info()
+
+SYNC_BATCH_SIZE = int(os.environ.get("SYNC_BATCH_SIZE", "500"))
+# Returned for each inserted lead: background scoring and the pipeline snapshot use them without a re-read.
+SAVED_LEAD_FIELDS = LEAD_SELECT
+
+async def insert_lead(client, rest_url: str, headers: dict, row: dict):
+    """
+    Inserts a single row. Returns the saved lead (SAVED_LEAD_FIELDS) or None
+    if it was rejected (duplicate or otherwise).
     """
-    SUPABASE_URL = os.environ.get("SUPABASE_URL")
-    SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
-    URL = f"{SUPABASE_URL}/rest/v1/leads?select=id&limit=1"
-    headers = {"apikey": SUPABASE_KEY, "Authorization": f"Bearer {SUPABASE_KEY}"}
     try:
-        with httpx.Client(timeout=10.0) as client:
-            response = client.get(URL, headers=headers)
-            if response.status_code == 200:
-                return {"status": "ok", "db": "connected"}
-            return {"status": "error", "db": "disconnected", "details": response.text}
+        response = await client.post(rest_url, headers=headers, params={"select": SAVED_LEAD_FIELDS}, json=row)
+        if response.status_code in [201, 200]:
+            data = response.json()
+            if data:
+                return data[0]
+            log_sampled(logger, logging.WARNING, "Insert returned no data for %s", row.get("name"))
+        elif response.status_code == 409:
+            log_sampled(logger, logging.DEBUG, "Duplicate conflict (409) for %s: %s", row.get("name"), response.text)
+        else:
+            log_sampled(logger, logging.WARNING, "Insert rejected (%s): %s", response.status_code, response.text)
     except Exception as e:
-        return {"status": "error", "db": "disconnected", "details": str(e)}
+        log_sampled(logger, logging.WARNING, "Insert failed for %s: %s", row.get("name"), e)
+    return None
+
+async def insert_leads_batched(client, rest_url: str, headers: dict, rows: list[dict], batch_size: int = SYNC_BATCH_SIZE,
+                               on_chunk=None):
+    """
+    Inserts rows in chunks, one PostgREST request per chunk.
+
+    Email conflicts are skipped by the database (ON CONFLICT (email) DO NOTHING),
+    so the representation only contains rows that were really inserted. Any
+    chunk that fails as a whole (e.g. a primary key clash or a bad row) is
+    retried row-by-row so one bad lead cannot sink its neighbours.
+
+    `on_chunk(committed_ids, saved, skipped)` is awaited after each chunk
+    with the IDs of rows that are final: all of them when the bulk insert
+    succeeded, only the inserted ones after a row-by-row fallback.
+
+    Returns (saved_leads, skipped_count).
+    """
+    saved, skipped = [], 0
+    bulk_headers = {
+        **headers,
+        "Prefer": "return=representation,resolution=ignore-duplicates,missing=default",
+    }
+
+    for start in range(0, len(rows), max(batch_size, 1)):
+        chunk = rows[start:start + batch_size]
+        # PostgREST takes the column list from the first object unless told
+        # otherwise, and our rows drop None fields, so send the union.
+        columns = sorted({key for row in chunk for key in row})
+        params = {"on_conflict": "email", "columns": ",".join(columns), "select": SAVED_LEAD_FIELDS}
+        try:
+            response = await client.post(rest_url, headers=bulk_headers, params=params, json=chunk)
+        except Exception as e:
+            logger.warning("Batch of %d failed (%s), falling back to row-by-row", len(chunk), e)
+            response = None
+
+        if response is not None and response.status_code in [201, 200]:
+            data = response.json()
+            saved.extend(data)
+            skipped += len(chunk) - len(data)
+            if on_chunk:
+                await on_chunk([row["id"] for row in chunk if "id" in row], data, len(chunk) - len(data))
+            continue
+
+        if response is not None:
+            logger.warning("Batch of %d rejected (%s), falling back to row-by-row", len(chunk), response.status_code)
+        chunk_saved = []
+        for row in chunk:
+            saved_lead = await insert_lead(client, rest_url, headers, row)
+            if saved_lead:
+                chunk_saved.append(saved_lead)
+            else:
+                skipped += 1
+        saved.extend(chunk_saved)
+        if on_chunk:
+            await on_chunk([lead["id"] for lead in chunk_saved], chunk_saved, len(chunk) - len(chunk_saved))
 
-import httpx
+    return saved, skipped
 
-@app.post("/sync")
-def sync_leads(request: SyncRequest, background_tasks: BackgroundTasks):
+async def schedule_enrichment(new_leads: list[dict], background_tasks: BackgroundTasks):
+    """
+    Hands new leads to the durable queue when one is configured (drained by
+    worker.py), otherwise scores them in this process after the response.
+    """
+    queue = get_queue()
+    if queue is not None:
+        try:
+            await asyncio.to_thread(queue.enqueue, [lead["id"] for lead in new_leads])
+            return
+        except Exception as e:
+            logger.warning("Enqueue failed, scoring in-process instead: %s", e)
+    background_tasks.add_task(process_leads_background, new_leads)
+
+async def parse_sync_request(http_request: Request) -> SyncRequest:
+    """
+    Validates the /sync body straight from JSON bytes, timed as the
+    sync.validate span. Errors come back as FastAPI reports them for a
+    declared body: locations start with "body", and unparseable JSON is a
+    json_invalid error at its character offset.
+    """
+    body = await http_request.body()
+    if not body:
+        raise RequestValidationError([{"type": "missing", "loc": ("body",), "msg": "Field required", "input": None}])
+    with span("sync.validate"):
+        try:
+            return SyncRequest.model_validate_json(body)
+        except ValidationError:
+            pass
+    # Only invalid bodies get here. They are parsed again the way FastAPI
+    # parses them, since pydantic words some errors differently in JSON mode.
+    try:
+        data = json.loads(body)
+    except json.JSONDecodeError as e:
+        raise RequestValidationError([{
+            "type": "json_invalid", "loc": ("body", e.pos), "msg": "JSON decode error",
+            "input": {}, "ctx": {"error": e.msg},
+        }], body=e.doc)
+    try:
+        return SyncRequest.model_validate(data)
+    except ValidationError as e:
+        errors = e.errors(include_url=False)
+    raise RequestValidationError([{**error, "loc": ("body", *error["loc"])} for error in errors], body=data)
+
+# Validation is done by parse_sync_request rather than FastAPI so it can be
+# timed; the schema is still published for the docs.
+SYNC_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": {"$ref": "#/components/schemas/SyncRequest"}}},
+    }
+}
+
+_default_openapi = app.openapi
+
+def openapi():
+    """FastAPI's schema plus the SyncRequest models referenced by SYNC_REQUEST_BODY."""
+    if app.openapi_schema is None:
+        schema = _default_openapi()
+        sync_schema = SyncRequest.model_json_schema(ref_template="#/components/schemas/{model}")
+        components = schema.setdefault("components", {}).setdefault("schemas", {})
+        components.update(sync_schema.pop("$defs", {}))
+        components["SyncRequest"] = sync_schema
+    return app.openapi_schema
+
+app.openapi = openapi
+
+@app.post("/sync", openapi_extra=SYNC_REQUEST_BODY)
+async def sync_leads(http_request: Request, response: Response, background_tasks: BackgroundTasks):
     """
     Receives a batch of leads and performs a First-Come-First-Served insert.
+    Send an Idempotency-Key header to make retries safe and resumable.
     """
-    print(f"🚀 [Sync Request] Received {len(request.leads)} leads.")
-    
-    
-    SUPABASE_URL = os.environ.get("SUPABASE_URL")
-    SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
-    REST_URL = f"{SUPABASE_URL}/rest/v1/leads"
-    
-    headers = {
-        "apikey": SUPABASE_KEY,
-        "Authorization": f"Bearer {SUPABASE_KEY}",
+    request = await parse_sync_request(http_request)
+    logger.debug("Sync request with %d leads", len(request.leads))
+
+    with span("sync.rows"):
+        rows = lead_rows(request.leads)
+    if key := http_request.headers.get("Idempotency-Key"):
+        return await sync_session(key, await http_request.body(), rows, response, background_tasks)
+    new_records, skipped, possible_duplicates = await save_leads(rows, background_tasks)
+
+    return {
+        "status": "success", 
+        "new_records": new_records, 
+        "ignored_duplicates": skipped,
+        "possible_duplicates": possible_duplicates
+    }
+
+async def sync_session(key: str, body: bytes, rows: list[dict], response: Response, background_tasks: BackgroundTasks):
+    """
+    /sync under an Idempotency-Key (see sessions.py). Identical retries of a
+    finished session are replayed from the stored result; anything else
+    inserts only the leads the session has not committed yet. Counts in the
+    result cover every attempt in the session.
+    """
+    store = get_session_store()
+    body_hash = request_hash(body)
+    try:
+        session = await asyncio.to_thread(store.claim, key, body_hash)
+    except SessionBusy as e:
+        response.status_code = 409
+        return {"error": str(e)}
+    if session.result is not None:
+        response.headers["Idempotent-Replayed"] = "true"
+        return session.result
+
+    lead_ids = assign_lead_ids(key, rows)
+    pending = [row for row, lead_id in zip(rows, lead_ids) if lead_id not in session.committed]
+
+    async def record(committed_ids: list, saved: list, skipped: int):
+        tagged = sum(1 for row in saved if "possible_duplicate_of" in (row.get("meta_data") or {}))
+        await asyncio.to_thread(store.commit, key, committed_ids, len(saved), skipped, tagged)
+
+    try:
+        if pending:
+            await save_leads(pending, background_tasks, on_chunk=record)
+        session = await asyncio.to_thread(store.get, key)
+    except Exception:
+        await asyncio.to_thread(store.release, key)
+        raise
+
+    result = {
+        "status": "success",
+        "new_records": session.new_records,
+        "ignored_duplicates": session.ignored_duplicates,
+        "possible_duplicates": session.possible_duplicates,
+        "already_committed": len(rows) - len(pending),
+    }
+    await asyncio.to_thread(store.finish, key, body_hash, result)
+    return result
+
+@app.get("/sync/sessions/{key}")
+async def get_sync_session(key: str):
+    """
+    Progress of an Idempotency-Key sync session: the lead IDs already
+    committed (so a client can resend only the rest) and the stored result
+    once the session has finished.
+    """
+    session = await asyncio.to_thread(get_session_store().get, key)
+    if session is None:
+        return {"error": f"Unknown or expired sync session: {key}"}
+    return {
+        "key": session.key,
+        "complete": session.result is not None,
+        "committed_lead_ids": sorted(session.committed),
+        "new_records": session.new_records,
+        "ignored_duplicates": session.ignored_duplicates,
+        "possible_duplicates": session.possible_duplicates,
+        "expires_at": session.expires_at,
+        "result": session.result,
+    }
+
+async def save_leads(rows: list[dict], background_tasks: BackgroundTasks, on_chunk=None) -> tuple:
+    """
+    Tags possible duplicates, inserts the rows and schedules enrichment for
+    the ones that were new. Returns (new_records, skipped, possible_duplicates).
+    """
+    headers = rest.auth_headers(**{
         "Content-Type": "application/json",
         "Prefer": "return=representation"
-    }
+    })
 
-    new_leads = []
-    skipped = 0
+    if DEDUP_ENABLED:
+        try:
+            await tag_duplicates(rows)
+        except Exception as e:
+            logger.warning("Skipped duplicate check: %s", e)
+    new_leads, skipped = await insert_leads_batched(rest.get_client(), rest.rest_url("leads"), headers, rows, on_chunk=on_chunk)
+    # Tagged rows the email constraint turned away aren't counted.
+    possible_duplicates = sum(1 for lead in new_leads if "possible_duplicate_of" in (lead.get("meta_data") or {}))
+
+    if new_leads:
+        await stats_cache.invalidate("stats")
+        lead_cache.write(new_leads, inserted=True)
+        pipeline_snapshot.upsert(new_leads)
+        broker.publish("lead.created", {
+            "leads": [{key: lead.get(key) for key in ("id", "name", "status", "created_at")} for lead in new_leads],
+            "pipeline_version": pipeline_snapshot.token,
+        })
+        broker.stats_changed()
+        await schedule_enrichment(new_leads, background_tasks)
+    return len(new_leads), skipped, possible_duplicates
 
-    with httpx.Client(timeout=30.0) as client:
-        for lead in request.leads:
+MAX_NDJSON_LINE = int(os.environ.get("MAX_NDJSON_LINE", str(1 << 20)))
+MAX_REPORTED_ERRORS = 20
+
+async def iter_ndjson_lines(http_request: Request):
+    """Yields (line_number, line) from a streamed NDJSON body without buffering more than one line."""
+    buffer, number = b"", 0
+    async for data in http_request.stream():
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            number += 1
+            yield number, line
+        if len(buffer) > MAX_NDJSON_LINE:
+            raise ValueError(f"Line {number + 1} is longer than {MAX_NDJSON_LINE} bytes")
+    if buffer:
+        yield number + 1, buffer
+
+@app.post("/sync/stream")
+async def sync_leads_stream(http_request: Request, background_tasks: BackgroundTasks):
+    """
+    Same as /sync, for bodies too large to hold in memory: one LeadCreate
+    JSON object per line (application/x-ndjson).
+
+    Lines are validated as they arrive and inserted SYNC_BATCH_SIZE at a
+    time, with one chunk being saved while the next is read, so memory is
+    bounded by the chunk size. Invalid lines are counted and skipped.
+    """
+    new_records = skipped = possible_duplicates = invalid = 0
+    errors, leads, saving = [], [], None
+
+    async def finish_saving():
+        nonlocal new_records, skipped, possible_duplicates, saving
+        if saving is not None:
+            saved, ignored, tagged = await saving
+            new_records, skipped, possible_duplicates = new_records + saved, skipped + ignored, possible_duplicates + tagged
+            saving = None
+
+    try:
+        async for number, line in iter_ndjson_lines(http_request):
+            if not line.strip():
+                continue
             try:
-                print(f"📥 [Sync] Processing: {lead.name} (ID: {lead.id})")
-                lead_dump = lead.model_dump(mode='json', exclude_none=True)
-                
-      
-                valid_statuses = ['New', 'Contacted', 'Qualified', 'Lost', 'Meeting', 'Won']
-                original_status = lead_dump.get("status", "New")
-                if original_status not in valid_statuses:
-                    lead_dump["status"] = "New"
-                
-                meta = lead_dump.get("meta_data", {})
-                meta["original_status"] = original_status
-                for field in ["location", "intent", "social_media"]:
-                    if value := lead_dump.pop(field, None):
-                        meta[field] = value
-                
-                lead_dump["meta_data"] = meta
-                
-                print(f"   📡 Sending to PostgREST...")
-                response = client.post(REST_URL, headers=headers, json=lead_dump)
-                print(f"   📡 Result: {response.status_code}")
-                
-                if response.status_code in [201, 200]:
-                    data = response.json()
-                    if data:
-                        saved_lead = {"id": data[0]["id"], "name": data[0]["name"]}
-                        new_leads.append(saved_lead)
-                        print(f"Saved Successfully: {lead.name}")
-                    else:
-                        print(f"Success but No Data Returned for {lead.name}")
-                elif response.status_code == 409:
-                    print(f"Duplicate Conflict (409): {lead.name}. Details: {response.text}")
-                    skipped += 1
-                else:
-                    print(f"DB REJECTED ({response.status_code}): {response.text}")
-                    skipped += 1
-                    
-            except Exception as e:
-                print(f"Fatal Exception for {lead.name}: {str(e)}")
-                skipped += 1
+                leads.append(LeadCreate.model_validate_json(line))
+            except ValidationError as e:
+                invalid += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({"line": number, "errors": e.errors(include_url=False, include_input=False)})
+                continue
+            if len(leads) >= SYNC_BATCH_SIZE:
+                await finish_saving()
+                saving = asyncio.ensure_future(save_leads(lead_rows(leads), background_tasks))
+                leads = []
+        await finish_saving()
+        if leads:
+            saving = asyncio.ensure_future(save_leads(lead_rows(leads), background_tasks))
+            await finish_saving()
+    except Exception as e:
+        # Chunks saved before the failure stay saved, the one in flight
+        # included (it may already be committed); report what got in.
+        try:
+            await finish_saving()
+        except Exception as saving_error:
+            logger.warning("Stream chunk failed after the stream did: %s", saving_error)
+        return {"error": str(e), "new_records": new_records, "ignored_duplicates": skipped,
+                "possible_duplicates": possible_duplicates, "invalid_records": invalid}
 
-    if new_leads:
-        background_tasks.add_task(process_leads_background, new_leads)
-            
     return {
-        "status": "success", 
-        "new_records": len(new_leads), 
-        "ignored_duplicates": skipped
+        "status": "success",
+        "new_records": new_records,
+        "ignored_duplicates": skipped,
+        "possible_duplicates": possible_duplicates,
+        "invalid_records": invalid,
+        "errors": errors,
+    }
+
+async def fetch_stats() -> dict:
+    """Computes dashboard metrics from one grouped count (see lead_status_counts in schema.sql)."""
+    response = await rest.get_client().post(
+        rest.rest_url("rpc/lead_status_counts"), headers=rest.auth_headers(), json={}, timeout=20.0
+    )
+    if response.status_code != 200:
+        raise Exception(response.text)
+    counts = {row["status"]: row["total"] for row in response.json()}
+
+    total_leads = sum(counts.values())
+    hot_leads = counts.get("Qualified", 0) + counts.get("Won", 0)
+    meetings = counts.get("Meeting", 0)
+    return {
+        "total_leads": total_leads,
+        "hot_leads": hot_leads,
+        "meetings_scheduled": meetings,
+        "conversion_rate": f"{(hot_leads / total_leads * 100):.1f}%" if total_leads > 0 else "0%"
     }
 
+broker.stats_loader = lambda: stats_cache.get_or_load("stats", fetch_stats)
+
+@app.get("/events")
+async def events(http_request: Request, types: Optional[str] = None, last_event_id: Optional[str] = None):
+    """
+    Server-sent events: lead.created, lead.status_changed, stats.changed and
+    resync (see events.py). `types` limits the stream to a comma-separated
+    list; Last-Event-ID (header or query) replays what a reconnecting client missed.
+    """
+    last_event_id = http_request.headers.get("Last-Event-ID") or last_event_id
+    wanted = ({t.strip() for t in types.split(",") if t.strip()} | {"resync"}) if types else None
+    subscriber = broker.subscribe(wanted, last_event_id)
+    return StreamingResponse(
+        broker.stream(subscriber), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/events/info")
+def events_info():
+    """
+    Connected event subscribers and their backlog, for capacity checks.
+    """
+    return broker.info()
+
+@app.get("/queue/metrics")
+async def queue_metrics():
+    """
+    Enrichment queue depth and lag, for scaling workers independently, and
+    this process's per-stage pipeline throughput.
+    """
+    queue = get_queue()
+    if queue is None:
+        return {"backend": "inline", "pipeline": enrichment_pipeline.stats()}
+    try:
+        return {**await asyncio.to_thread(queue.stats), "pipeline": enrichment_pipeline.stats()}
+    except Exception as e:
+        return {"error": str(e)}
+
 @app.get("/stats")
-def get_stats():
-    """
-    Returns total leads and key metrics using direct REST calls.
-    """
-    SUPABASE_URL = os.environ.get("SUPABASE_URL")
-    SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
-    headers = {"apikey": SUPABASE_KEY, "Authorization": f"Bearer {SUPABASE_KEY}"}
-    
-    try:
-        with httpx.Client(timeout=20.0) as client:
-            
-            total_res = client.get(f"{SUPABASE_URL}/rest/v1/leads?select=id", headers={**headers, "Prefer": "count=exact"})
-            total_leads = int(total_res.headers.get("Content-Range", "0/0").split("/")[1]) if total_res.status_code == 200 else 0
-          
-            hot_res = client.get(f"{SUPABASE_URL}/rest/v1/leads?status=in.(Qualified,Won)&select=id", headers={**headers, "Prefer": "count=exact"})
-            hot_leads = int(hot_res.headers.get("Content-Range", "0/0").split("/")[1]) if hot_res.status_code == 200 else 0
-            
-            meet_res = client.get(f"{SUPABASE_URL}/rest/v1/leads?status=eq.Meeting&select=id", headers={**headers, "Prefer": "count=exact"})
-            meetings = int(meet_res.headers.get("Content-Range", "0/0").split("/")[1]) if meet_res.status_code == 200 else 0
-            
-            return {
-                "total_leads": total_leads,
-                "hot_leads": hot_leads,
-                "meetings_scheduled": meetings,
-                "conversion_rate": f"{(hot_leads / total_leads * 100):.1f}%" if total_leads > 0 else "0%"
+async def get_stats():
+    """
+    Returns total leads and key metrics, cached for STATS_CACHE_TTL seconds.
+    """
+    try:
+        # Picks up writes made outside this process, which invalidate the cached stats.
+        await lead_cache.ensure_fresh()
+        return await stats_cache.get_or_load("stats", fetch_stats)
+    except Exception as e:
+        return {"error": str(e)}
+
+LEADS_PAGE_SIZE = int(os.environ.get("LEADS_PAGE_SIZE", "100"))
+PIPELINE_PAGE_SIZE = int(os.environ.get("PIPELINE_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = 1000
+
+def column_condition(column: str) -> str:
+    """PostgREST condition selecting the leads of one Kanban column."""
+    if column == "Other":
+        return f"or(status.is.null,status.not.in.({','.join(PIPELINE_COLUMNS)}))"
+    return f"status.eq.{column}"
+
+async def fetch_leads_page(limit: int, cursor: Optional[str] = None, fields: Optional[str] = None, conditions=()):
+    """Fetches one keyset page of leads, newest first. Returns (leads, next_cursor)."""
+    params = page_params(limit, cursor, conditions, ist_select(select_fields(fields)))
+    response = await rest.get_client().get(rest.rest_url("leads"), params=params, headers=rest.auth_headers())
+    if response.status_code != 200:
+        raise Exception(response.text)
+    return split_page(fastjson.loads(response.content), limit)
+
+async def cached_leads_page(limit: int, cursor: Optional[str] = None, fields: Optional[str] = None, conditions=()):
+    """
+    fetch_leads_page through the lead cache. Full rows are cached, so
+    `fields` is applied here, and timestamps are left for localize(in_sql=False).
+    """
+    select = select_fields(fields)
+    if not LEAD_CACHE_ENABLED:
+        return await fetch_leads_page(limit, cursor, fields, conditions)
+    leads, next_cursor = await lead_cache.page(
+        tuple(conditions), limit, cursor, lambda: load_leads_page(limit, cursor, conditions),
+    )
+    if select != LEAD_SELECT:
+        kept = select.split(",")
+        leads = [{c: lead.get(c) for c in kept} for lead in leads]
+    return leads, next_cursor
+
+async def load_leads_page(limit: int, cursor: Optional[str], conditions) -> tuple:
+    """One page of full rows, as the lead cache stores them."""
+    params = page_params(limit, cursor, conditions)
+    response = await rest.get_client().get(rest.rest_url("leads"), params=params, headers=rest.auth_headers())
+    if response.status_code != 200:
+        raise Exception(response.text)
+    return split_page(fastjson.loads(response.content), limit)
+
+@app.get("/pipeline", response_class=JSONBytesResponse)
+async def get_pipeline(
+    status: Optional[str] = None,
+    per_status: int = Query(PIPELINE_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    """
+    Returns leads grouped by their status, `per_status` per column. Cards
+    carry the board's fields (pipeline.PIPELINE_FIELDS); `fields` picks among them.
+
+    Pass `status` (and the column's cursor) to load one column on its own.
+    Cursors for the next page of each column are in the X-Next-Cursors header.
+    With the snapshot on, the board version for /pipeline/delta is in X-Pipeline-Version.
+    """
+    try:
+        if status and status not in PIPELINE_COLUMNS + ["Other"]:
+            raise ValueError(f"Unknown status: {status}")
+        columns = [status] if status else PIPELINE_COLUMNS + ["Other"]
+        select = select_fields(fields, allowed=PIPELINE_FIELDS) if fields else PIPELINE_SELECT
+        headers = {}
+        from_snapshot = False
+        if SNAPSHOT_ENABLED:
+            await lead_cache.ensure_fresh()
+            from_snapshot = await pipeline_snapshot.ensure_fresh()
+        if from_snapshot:
+            pages = [pipeline_snapshot.page(column, per_status, cursor if status else None) for column in columns]
+            if select != PIPELINE_SELECT:
+                columns_kept = select.split(",")
+                pages = [([{c: lead.get(c) for c in columns_kept} for lead in leads], next_cursor) for leads, next_cursor in pages]
+            headers["X-Pipeline-Version"] = pipeline_snapshot.token
+        else:
+            pages = await asyncio.gather(*(
+                cached_leads_page(per_status, cursor if status else None, select, [column_condition(column)])
+                for column in columns
+            ))
+
+        pipeline, cursors = {}, {}
+        for column, (leads, next_cursor) in zip(columns, pages):
+            # "Other" only shows up when something falls outside the known columns.
+            if column == "Other" and not leads and not status:
+                continue
+            localize(leads, IST_IN_SQL and not from_snapshot and not LEAD_CACHE_ENABLED)
+            if column == "Meeting":
+                for lead in leads:
+                    lead["meeting_link"] = pipeline_snapshot.meeting_link(lead)
+            pipeline[column] = leads
+            if next_cursor:
+                cursors[column] = next_cursor
+
+        headers["X-Next-Cursors"] = json.dumps(cursors)
+        return JSONBytesResponse(pipeline, headers=headers)
+    except Exception as e:
+        return {"error": str(e)}
+
+@app.get("/pipeline/delta", response_class=JSONBytesResponse)
+async def get_pipeline_delta(since: str):
+    """
+    Leads that changed column since board version `since` (from X-Pipeline-Version
+    or a previous delta), as {id, from, to, lead}. `to` is null for deleted leads.
+    reset=true means the version is too old or from another process: refetch /pipeline.
+    """
+    try:
+        if not SNAPSHOT_ENABLED:
+            raise ValueError("Pipeline deltas need PIPELINE_SNAPSHOT=1")
+        await lead_cache.ensure_fresh()
+        if not await pipeline_snapshot.ensure_fresh():
+            raise ValueError("Pipeline deltas are off while the table has more than PIPELINE_SNAPSHOT_MAX_LEADS leads")
+        moved = pipeline_snapshot.delta(since)
+        if moved is None:
+            return {"version": pipeline_snapshot.token, "reset": True, "moved": []}
+        leads = [change["lead"] for change in moved if change["lead"]]
+        localize(leads, in_sql=False)
+        for change in moved:
+            if change["to"] == "Meeting":
+                change["lead"]["meeting_link"] = pipeline_snapshot.meeting_link(change["lead"])
+        return JSONBytesResponse({"version": pipeline_snapshot.token, "reset": False, "moved": moved})
+    except Exception as e:
+        return {"error": str(e)}
+
+@app.get("/leads", response_class=JSONBytesResponse)
+async def get_leads(
+    limit: int = Query(LEADS_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    interactions: bool = False,
+):
+    """
+    Returns a clean, sorted page of leads in IST.
+    The cursor for the next page is in the X-Next-Cursor header.
+    With interactions=true each lead carries an `interaction_summary`
+    (total, last_type, last_date, last_summary), fetched for the whole page at once.
+    """
+    try:
+        leads, next_cursor = await cached_leads_page(limit, cursor, fields)
+        localize(leads, IST_IN_SQL and not LEAD_CACHE_ENABLED)
+        if interactions:
+            summaries = await timelines.fetch_summaries([lead["id"] for lead in leads])
+            empty = {"total": 0, "last_type": None, "last_date": None, "last_summary": None}
+            for lead in leads:
+                lead["interaction_summary"] = summaries.get(lead["id"], empty)
+            localize([lead["interaction_summary"] for lead in leads], in_sql=False, fields=("last_date",))
+        return JSONBytesResponse(leads, headers={"X-Next-Cursor": next_cursor} if next_cursor else None)
+    except Exception as e:
+        return {"error": str(e)}
+
+@app.post("/leads/status")
+async def update_lead_status(request: StatusUpdateRequest):
+    """
+    Moves many leads to one status in a single database call. Only moves
+    the state machine allows are made (see GET /leads/status/transitions),
+    and each moved lead gets a "Status changed" interaction in the same call.
+    Leads already in that status are `unchanged`; the rest are `rejected`
+    with their current status, or `not_found`.
+    """
+    try:
+        lead_ids = [str(lead_id) for lead_id in request.lead_ids]
+        result = await transitions.transition(lead_ids, request.status, request.note)
+        await transitions.publish(result["applied"], request.status)
+        return {"updated": len(result["moved"]), **result}
+    except Exception as e:
+        return {"error": str(e)}
+
+@app.get("/leads/status/transitions")
+def status_transitions():
+    """
+    Which status each status can move to.
+    """
+    return {status.value: sorted(target.value for target in targets) for status, targets in transitions.TRANSITIONS.items()}
+
+@app.post("/interactions/timelines", response_class=JSONBytesResponse)
+async def interaction_timelines(request: TimelineRequest):
+    """
+    Interaction histories for many leads in one call, newest first, `limit`
+    per lead. Each timeline has its own next_cursor; send it back in
+    `cursors` (keyed by lead id) to load more of that lead's history.
+    """
+    try:
+        lead_ids = [str(lead_id) for lead_id in request.lead_ids]
+        cursors = {key.lower(): cursor for key, cursor in request.cursors.items()}
+        found = await timelines.fetch_timelines(lead_ids, request.limit, cursors)
+        localize([item for items, _ in found.values() for item in items], in_sql=False, fields=INTERACTION_IST_FIELDS)
+        return JSONBytesResponse({
+            "timelines": {
+                lead_id: {"interactions": items, "next_cursor": next_cursor}
+                for lead_id, (items, next_cursor) in found.items()
             }
+        })
     except Exception as e:
         return {"error": str(e)}
 
-@app.get("/pipeline")
-def get_pipeline():
-    """
-    Returns leads grouped by their status.
-    """
-    SUPABASE_URL = os.environ.get("SUPABASE_URL")
-    SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
-    URL = f"{SUPABASE_URL}/rest/v1/leads?select=*&order=created_at.desc"
-    headers = {"apikey": SUPABASE_KEY, "Authorization": f"Bearer {SUPABASE_KEY}"}
-    
-    try:
-        with httpx.Client(timeout=30.0) as client:
-            response = client.get(URL, headers=headers)
-            if response.status_code != 200:
-                raise Exception(response.text)
-            leads = response.json()
-        
-      
-        pipeline = {
-            "New": [],
-            "Contacted": [],
-            "Qualified": [],
-            "Meeting": [],
-            "Won": [],
-            "Lost": []
-        }
-        
-        from utils import generate_meeting_link
-        
-        for lead in leads:
-           
-            lead["captured_at"] = to_ist(lead.get("captured_at"))
-            lead["created_at"] = to_ist(lead.get("created_at"))
-            
-            status = lead.get("status", "New")
-            if status in pipeline:
-               
-                if status == "Meeting":
-                    lead["meeting_link"] = generate_meeting_link(lead.get("name", "Lead"))
-                    
-                pipeline[status].append(lead)
-            else:
-                
-                if "Other" not in pipeline:
-                     pipeline["Other"] = []
-                pipeline["Other"].append(lead)
-                
-        return pipeline
+def upload_status(upload: storage.Upload) -> dict:
+    return {
+        "upload_id": upload.id,
+        "interaction_id": upload.interaction_id,
+        "offset": upload.offset,
+        "size": upload.size,
+        "part_size": storage.get_storage().part_size,
+        "complete": upload.complete,
+        "recording_url": upload.url,
+    }
+
+@app.post("/interactions/{interaction_id}/recording", status_code=201)
+async def create_recording_upload(interaction_id: uuid.UUID, request: RecordingUploadCreate, response: Response):
+    """
+    Opens a resumable upload for an interaction's audio note. Send the file
+    with PATCH /uploads/{upload_id}; recording_url is set when it completes.
+    """
+    try:
+        if request.size > UPLOAD_MAX_BYTES:
+            response.status_code = 413
+            return {"error": f"Recordings are limited to {UPLOAD_MAX_BYTES} bytes"}
+        found = await rest.get_client().get(
+            rest.rest_url("interactions"),
+            params={"id": f"eq.{interaction_id}", "select": "id,lead_id"}, headers=rest.auth_headers(),
+        )
+        if found.status_code != 200:
+            raise Exception(found.text)
+        if not found.json():
+            response.status_code = 404
+            return {"error": f"Interaction {interaction_id} not found"}
+        extension = mimetypes.guess_extension(request.content_type) or os.path.splitext(request.filename or "")[1]
+        extension = extension if extension[1:].isalnum() and len(extension) <= 10 else ""
+        upload = await storage.create_upload(found.json()[0], request.size, request.content_type, extension)
+        return upload_status(upload)
     except Exception as e:
         return {"error": str(e)}
-@app.get("/leads")
-def get_leads():
+
+@app.patch("/uploads/{upload_id}")
+async def append_upload(upload_id: str, http_request: Request, response: Response):
     """
-    Returns a clean, sorted list of all leads in IST.
+    Appends the request body to an upload, starting at the Upload-Offset
+    header, which must equal the upload's current offset. The body is
+    streamed to storage part by part. The new offset is returned (and in the
+    Upload-Offset header); if a request breaks off, GET the upload and
+    resume from its offset.
     """
-    SUPABASE_URL = os.environ.get("SUPABASE_URL")
-    SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
-    URL = f"{SUPABASE_URL}/rest/v1/leads?select=*&order=created_at.desc"
-    headers = {"apikey": SUPABASE_KEY, "Authorization": f"Bearer {SUPABASE_KEY}"}
-    
+    offset = http_request.headers.get("Upload-Offset", "")
+    if not offset.isdigit():
+        response.status_code = 400
+        return {"error": "Upload-Offset header is required"}
     try:
-        with httpx.Client(timeout=30.0) as client:
-            response = client.get(URL, headers=headers)
-            if response.status_code == 200:
-                leads = response.json()
-                for lead in leads:
-                    lead["captured_at"] = to_ist(lead.get("captured_at"))
-                    lead["created_at"] = to_ist(lead.get("created_at"))
-                return leads
-            return {"error": response.text}
+        upload = await storage.receive(upload_id, int(offset), http_request.stream())
+    except LookupError as e:
+        response.status_code = 404
+        return {"error": str(e)}
+    except UploadOffsetMismatch as e:
+        response.status_code = 409
+        response.headers["Upload-Offset"] = str(e.offset)
+        return {"error": str(e), "offset": e.offset}
+    except UploadBusy as e:
+        response.status_code = 409
+        return {"error": str(e)}
     except Exception as e:
         return {"error": str(e)}
+    response.headers["Upload-Offset"] = str(upload.offset)
+    return upload_status(upload)
+
+@app.get("/uploads/{upload_id}")
+async def get_upload(upload_id: str, response: Response):
+    """
+    Where an upload stands: the committed offset to resume from, and the
+    recording_url once complete.
+    """
+    upload = await asyncio.to_thread(storage.get_upload_store().get, upload_id)
+    if upload is None:
+        response.status_code = 404
+        return {"error": f"Unknown upload {upload_id}"}
+    response.headers["Upload-Offset"] = str(upload.offset)
+    return upload_status(upload)
+
+SEARCH_PAGE_SIZE = int(os.environ.get("SEARCH_PAGE_SIZE", "20"))
+
+@app.get("/leads/search", response_class=JSONBytesResponse)
+async def search_leads(
+    q: str = Query(..., min_length=MIN_QUERY_LENGTH, max_length=200),
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    """
+    Finds leads by name, company, phone or notes (prefix, full-text and
+    fuzzy matches), best first, each with a 0-100 `score`.
+    The cursor for the next page is in the X-Next-Cursor header.
+    """
+    try:
+        select = select_fields(fields)
+        fetched = ",".join(dict.fromkeys([*select.split(","), *SEARCH_FIELDS]))
+        candidates = await search.fetch_candidates(q, ist_select(fetched))
+        with span("search.rank"):
+            leads, next_cursor = search.paginate(search.rank(q, candidates), limit, cursor)
+        localize(leads)
+        if select != LEAD_SELECT:
+            kept = [*select.split(","), "score"]
+            leads = [{c: lead.get(c) for c in kept} for lead in leads]
+        return JSONBytesResponse(leads, headers={"X-Next-Cursor": next_cursor} if next_cursor else None)
+    except Exception as e:
+        return {"error": str(e)}
+
+EXPORT_PAGE_SIZE = int(os.environ.get("EXPORT_PAGE_SIZE", "1000"))
+
+async def iter_lead_pages(page_size: int, fields: Optional[str] = None):
+    """
+    Yields every lead page by page. The next page is requested while the
+    caller is still consuming the current one.
+    """
+    next_page = asyncio.ensure_future(fetch_leads_page(page_size, None, fields))
+    try:
+        while next_page is not None:
+            leads, cursor = await next_page
+            next_page = asyncio.ensure_future(fetch_leads_page(page_size, cursor, fields)) if cursor else None
+            yield leads
+    finally:
+        if next_page is not None:
+            next_page.cancel()
+
+def csv_line(values: list) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+@app.get("/leads/export")
+async def export_leads(format: str = "ndjson", fields: Optional[str] = None):
+    """
+    Streams every lead as NDJSON or CSV with timestamps in IST.
+    Memory use is bounded by EXPORT_PAGE_SIZE, not by the size of the table.
+    """
+    try:
+        if format not in ("ndjson", "csv"):
+            raise ValueError("format must be ndjson or csv")
+        columns = select_fields(fields).split(",")
+    except Exception as e:
+        return {"error": str(e)}
+
+    async def rows():
+        if format == "csv":
+            yield csv_line(columns)
+        try:
+            async for leads in iter_lead_pages(EXPORT_PAGE_SIZE, fields):
+                localize(leads)
+                if format == "csv":
+                    yield "".join(
+                        csv_line([json.dumps(v) if isinstance(v, (dict, list)) else v for v in (lead.get(c) for c in columns)])
+                        for lead in leads
+                    )
+                else:
+                    yield b"".join(fastjson.dumps(lead) + b"\n" for lead in leads)
+        except Exception as e:
+            # Headers are already sent, so the best we can do is stop the stream early.
+            logger.warning("Export aborted: %s", e)
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"leads.{'csv' if format == 'csv' else 'ndjson'}"
+    return StreamingResponse(rows(), media_type=media_type, headers={"Content-Disposition": f"attachment; filename={filename}"})
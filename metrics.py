@@ -0,0 +1,173 @@
+"""
+In-process latency histograms and counters, exposed in Prometheus text format at /metrics.
+
+    http_request_duration_seconds{method,endpoint,status}   every API request (endpoint is the route template)
+    upstream_request_duration_seconds{method,target,status} every upstream call made through rest.py (target: see upstream_target)
+    span_duration_seconds{span}                             hot-path sections wrapped in span()
+    cache_requests_total{cache,result}                      lead cache lookups (hit/miss), see lead_cache.py
+
+Each process keeps its own numbers; scrape every worker to get totals.
+No client library is needed; the exposition format is produced here.
+"""
+import bisect
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+import httpx
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...], buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[tuple, List[float]] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, seconds: float, *labels: str):
+        series = self._series.get(labels)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(labels, [0] * (len(self.buckets) + 2))
+        # Counts are stored per bucket (not cumulative) so an observation touches two slots.
+        series[bisect.bisect_left(self.buckets, seconds)] += 1
+        series[-1] += seconds
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            base = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labels))
+            sep = "," if base else ""
+            total = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                total += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{le}"}} {total}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {total}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...]):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            base = ",".join(f'{name}="{_escape(label)}"' for name, label in zip(self.labelnames, labels))
+            lines.append(f"{self.name}{{{base}}} {value:g}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY: List = []
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "API request latency, until the last body byte is sent.",
+    ("method", "endpoint", "status"),
+)
+UPSTREAM_SECONDS = Histogram(
+    "upstream_request_duration_seconds", "PostgREST and storage call latency, until response headers arrive.",
+    ("method", "target", "status"),
+)
+SPAN_SECONDS = Histogram("span_duration_seconds", "Time spent in instrumented hot-path sections.", ("span",))
+CACHE_REQUESTS = Counter("cache_requests_total", "Cache lookups by outcome.", ("cache", "result"))
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+@contextmanager
+def span(name: str):
+    """Times the enclosed block into span_duration_seconds{span=name}."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        SPAN_SECONDS.observe(time.perf_counter() - started, name)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording http_request_duration_seconds."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The route template, not the raw path, keeps label cardinality bounded.
+            route = scope.get("route")
+            endpoint = getattr(route, "path", "unmatched")
+            REQUEST_SECONDS.observe(time.perf_counter() - started, scope["method"], endpoint, str(status))
+
+
+_REST_TARGET = re.compile(r"/rest/v1/((?:rpc/)?[A-Za-z_][A-Za-z0-9_]*)(?:/|$)")
+_STORAGE_TARGET = re.compile(r"/storage/v1/(upload/resumable|object)(?:/|$)")
+
+
+def upstream_target(path: str) -> str:
+    """
+    The label for an upstream URL path: the table or rpc/<function> for
+    PostgREST, a fixed storage template, else "other". Object names and
+    upload ids never reach a label, so cardinality stays bounded.
+    """
+    match = _REST_TARGET.search(path)
+    if match:
+        return match.group(1)
+    match = _STORAGE_TARGET.search(path)
+    if match:
+        return f"storage/v1/{match.group(1)}"
+    return "other"
+
+
+class TimedTransport(httpx.AsyncHTTPTransport):
+    """httpx transport recording upstream_request_duration_seconds for every request."""
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = await super().handle_async_request(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            UPSTREAM_SECONDS.observe(time.perf_counter() - started, request.method, upstream_target(request.url.path), status)
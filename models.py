@@ -1,11 +1,82 @@
-from pydantic import BaseModel, Field, EmailStr
-from typing import Optional, List, Dict, Any
+from pydantic import AfterValidator, BaseModel, Field, TypeAdapter, WithJsonSchema, model_serializer
+from pydantic.networks import validate_email
+from typing import Annotated, Optional, List, Dict, Any
 from datetime import datetime
+from enum import Enum
+from functools import lru_cache
+import os
+import re
 import uuid
 
+from email_validator import EmailNotValidError
+
+try:
+    # Internals of email-validator 2.x; without them every address takes the full validator.
+    from email_validator.rfc_constants import CASE_INSENSITIVE_MAILBOX_NAMES, DOT_ATOM_TEXT, EMAIL_MAX_LENGTH
+    from email_validator.syntax import validate_email_domain_name
+except ImportError:
+    validate_email_domain_name = None
+
+EMAIL_DOMAIN_CACHE_SIZE = int(os.environ.get("EMAIL_DOMAIN_CACHE_SIZE", "16384"))
+TIMELINE_MAX_LEADS = int(os.environ.get("TIMELINE_MAX_LEADS", "200"))
+STATUS_UPDATE_MAX_LEADS = int(os.environ.get("STATUS_UPDATE_MAX_LEADS", "10000"))
+
+
+class LeadStatus(str, Enum):
+    NEW = "New"
+    CONTACTED = "Contacted"
+    QUALIFIED = "Qualified"
+    LOST = "Lost"
+    MEETING = "Meeting"
+    MET = "Met"
+    WON = "Won"
+
+    @classmethod
+    def coerce(cls, value: Optional[str]) -> "LeadStatus":
+        """The status a lead is stored with: unknown values become New."""
+        return cls._value2member_map_.get(value, cls.NEW)
+
+
+_LOCAL_PART = re.compile(DOT_ATOM_TEXT) if validate_email_domain_name else None
+
+
+@lru_cache(maxsize=EMAIL_DOMAIN_CACHE_SIZE)
+def _email_domain(domain: str) -> Optional[tuple]:
+    """(domain, ascii_domain) as email-validator normalises them, or None if invalid."""
+    try:
+        info = validate_email_domain_name(domain)
+    except EmailNotValidError:
+        return None
+    return info["domain"], info["ascii_domain"]
+
+
+def normalize_email(value: str) -> str:
+    """
+    Same result as pydantic's EmailStr, with the domain check cached. A
+    sync batch mostly repeats a handful of domains, and the IDNA work on
+    them is most of what email-validator spends. Anything outside plain
+    ASCII `local@domain`, and every invalid address, goes through the full
+    validator so the error messages are unchanged.
+    """
+    if _LOCAL_PART is None:
+        return validate_email(value)[1]
+    local, at, domain = value.rpartition("@")
+    if at and value.isascii() and len(local) <= 64 and _LOCAL_PART.fullmatch(local) \
+            and local.lower() not in CASE_INSENSITIVE_MAILBOX_NAMES:
+        parts = _email_domain(domain)
+        if parts is not None:
+            normalized = f"{local}@{parts[0]}"
+            if max(len(value), len(normalized.encode()), len(local) + 1 + len(parts[1])) <= EMAIL_MAX_LENGTH:
+                return normalized
+    return validate_email(value)[1]
+
+
+Email = Annotated[str, AfterValidator(normalize_email), WithJsonSchema({"type": "string", "format": "email"})]
+
+
 class LeadBase(BaseModel):
     name: str
-    email: Optional[EmailStr] = None
+    email: Optional[Email] = None
     phone: Optional[str] = None
     company: Optional[str] = None
     role: Optional[str] = None
@@ -20,6 +91,25 @@ class LeadBase(BaseModel):
 class LeadCreate(LeadBase):
     id: Optional[uuid.UUID] = None 
 
+    @model_serializer(mode="wrap")
+    def _as_row(self, handler) -> Dict[str, Any]:
+        """
+        Dumps as a row for the leads table: the status is coerced to a
+        LeadStatus (the value sent is kept as meta_data.original_status),
+        and location, intent and social_media move into meta_data.
+        """
+        row = handler(self)
+        meta = row.get("meta_data", {})
+        original_status = row.get("status", "New")
+        if "status" in row:
+            row["status"] = LeadStatus.coerce(original_status).value
+        meta["original_status"] = original_status
+        for field in ("location", "intent", "social_media"):
+            if value := row.pop(field, None):
+                meta[field] = value
+        row["meta_data"] = meta
+        return row
+
 class Lead(LeadBase):
     id: Optional[uuid.UUID] = None  
     created_at: Optional[datetime] = None
@@ -45,5 +135,32 @@ class Interaction(InteractionBase):
     class Config:
         from_attributes = True
 
+class TimelineRequest(BaseModel):
+    lead_ids: List[uuid.UUID] = Field(min_length=1, max_length=TIMELINE_MAX_LEADS)
+    limit: int = Field(20, ge=1, le=100)
+    # lead id -> next_cursor from a previous response, to page that lead further.
+    cursors: Dict[str, str] = Field(default_factory=dict)
+
+class StatusUpdateRequest(BaseModel):
+    lead_ids: List[uuid.UUID] = Field(min_length=1, max_length=STATUS_UPDATE_MAX_LEADS)
+    status: LeadStatus
+    # Added to each lead's "Status changed" interaction.
+    note: Optional[str] = None
+
+class RecordingUploadCreate(BaseModel):
+    size: int = Field(gt=0, description="Length of the whole file in bytes.")
+    content_type: str = "audio/mpeg"
+    filename: Optional[str] = None
+
 class SyncRequest(BaseModel):
     leads: List[LeadCreate]
+
+
+# Validation stays with SyncRequest (the whole /sync body in one call) and
+# per line in /sync/stream, where each bad line is reported and skipped.
+LEAD_ROWS = TypeAdapter(List[LeadCreate])
+
+
+def lead_rows(leads: List[LeadCreate]) -> List[dict]:
+    """Validated leads as leads-table rows, dumped in one pass over the list."""
+    return LEAD_ROWS.dump_python(leads, mode="json", exclude_none=True)
@@ -0,0 +1,91 @@
+"""
+Keyset (cursor) pagination helpers for PostgREST queries.
+
+Pages are ordered newest first on (created_at, id) and a cursor is the
+opaque, base64-encoded key of the last row of the previous page, so each
+page is an index range scan instead of an ever-growing OFFSET.
+"""
+import base64
+import json
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+LEAD_COLUMNS = (
+    "id", "name", "email", "phone", "company", "role", "notes", "status",
+    "captured_at", "created_at", "updated_at", "social_media_json", "meta_data",
+)
+# Leads are read with this list, never select=*, so the generated index
+# columns (phone_key, name_block, search_text, search_document) stay in the
+# database and every row has the same shape, whether read or just inserted.
+LEAD_SELECT = ",".join(LEAD_COLUMNS)
+LEAD_KEYS = ("created_at", "id")
+
+
+def encode_cursor(row: dict, keys: Sequence[str] = LEAD_KEYS) -> str:
+    raw = json.dumps([row[key] for key in keys], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, keys: Sequence[str] = LEAD_KEYS) -> List[str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def keyset_condition(cursor: str, keys: Sequence[str] = LEAD_KEYS) -> str:
+    """
+    PostgREST logic expression for rows strictly after the cursor in
+    descending key order, e.g. (a, b) < (x, y) becomes
+    or(a.lt.x,and(a.eq.x,b.lt.y)).
+    """
+    values = decode_cursor(cursor, keys)
+    quoted = [f'"{value}"' for value in values]
+    branches = []
+    for i, key in enumerate(keys):
+        equal = [f"{keys[j]}.eq.{quoted[j]}" for j in range(i)]
+        term = f"{key}.lt.{quoted[i]}"
+        branches.append(f"and({','.join(equal + [term])})" if equal else term)
+    return f"or({','.join(branches)})"
+
+
+def select_fields(fields: Optional[str], keys: Sequence[str] = LEAD_KEYS, allowed: Iterable[str] = LEAD_COLUMNS) -> str:
+    """Validates a `fields=` projection; the key columns are always included."""
+    if not fields:
+        return LEAD_SELECT
+    allowed = set(allowed)
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return ",".join(dict.fromkeys([*requested, *keys]))
+
+
+def page_params(limit: int, cursor: Optional[str] = None, conditions: Iterable[str] = (),
+                select: str = LEAD_SELECT, keys: Sequence[str] = LEAD_KEYS) -> dict:
+    """
+    Query parameters for one page. One extra row is requested so we know
+    whether another page exists without a separate count.
+    """
+    conditions = list(conditions)
+    if cursor:
+        conditions.append(keyset_condition(cursor, keys))
+    params = {
+        "select": select,
+        "order": ",".join(f"{key}.desc" for key in keys),
+        "limit": limit + 1,
+    }
+    if conditions:
+        params["and"] = f"({','.join(conditions)})"
+    return params
+
+
+def split_page(rows: List[dict], limit: int, keys: Sequence[str] = LEAD_KEYS) -> Tuple[List[dict], Optional[str]]:
+    """Trims the look-ahead row and returns (rows, next_cursor)."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1], keys)
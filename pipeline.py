@@ -0,0 +1,268 @@
+"""
+In-memory Kanban snapshot behind /pipeline and /pipeline/delta.
+
+The board is loaded from PostgREST once, then kept current in place: /sync
+adds the leads it inserts and the background scorer moves the ones it
+qualifies. Every column change bumps the snapshot version and is logged,
+so a client polling /pipeline/delta?since=<version> receives only the
+leads that moved.
+
+Each process holds its own snapshot of PIPELINE_FIELDS, the columns a
+card shows. Writes made elsewhere (another web worker, worker.py, the
+dashboard) are picked up by a full reload every PIPELINE_SNAPSHOT_TTL
+seconds (default 60), which is diffed against the snapshot so they also
+show up as moves. Only the first load is awaited by a request; later
+reloads run in the background while the current snapshot keeps serving.
+Versions look like "<epoch>-<n>". A version from another process or an
+older load is answered with reset=true, and the client refetches /pipeline.
+
+A table with more than PIPELINE_SNAPSHOT_MAX_LEADS leads is not held in
+memory: the snapshot empties itself and /pipeline reads columns page by
+page instead. Every reload first asks for the single row past the limit,
+so an oversized table costs one small request per TTL, not a full read.
+
+    PIPELINE_SNAPSHOT             "1" (default) to serve /pipeline from the snapshot
+    PIPELINE_SNAPSHOT_MAX_LEADS   most leads held per process (default 50000)
+    PIPELINE_DELTA_LOG            column changes kept for deltas (default 10000)
+"""
+import asyncio
+import bisect
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import fastjson
+import rest
+from pagination import LEAD_KEYS, decode_cursor, encode_cursor, page_params, split_page
+
+PIPELINE_COLUMNS = ["New", "Contacted", "Qualified", "Meeting", "Met", "Won", "Lost"]
+PIPELINE_FIELDS = ("id", "name", "email", "phone", "company", "role", "status", "captured_at", "created_at", "updated_at")
+PIPELINE_SELECT = ",".join(PIPELINE_FIELDS)
+SNAPSHOT_ENABLED = os.environ.get("PIPELINE_SNAPSHOT", "1") == "1"
+SNAPSHOT_TTL = float(os.environ.get("PIPELINE_SNAPSHOT_TTL", "60"))
+SNAPSHOT_MAX_LEADS = int(os.environ.get("PIPELINE_SNAPSHOT_MAX_LEADS", "50000"))
+DELTA_LOG_SIZE = int(os.environ.get("PIPELINE_DELTA_LOG", "10000"))
+LOAD_PAGE_SIZE = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def column_of(lead: dict) -> str:
+    status = lead.get("status")
+    return status if status in PIPELINE_COLUMNS else "Other"
+
+
+def _key(lead: dict) -> Tuple[str, str]:
+    return lead["created_at"], lead["id"]
+
+
+class PipelineSnapshot:
+    def __init__(self, ttl: float = SNAPSHOT_TTL, log_size: int = DELTA_LOG_SIZE, max_leads: int = SNAPSHOT_MAX_LEADS):
+        self.ttl = ttl
+        self.max_leads = max_leads
+        # Set when the table outgrew max_leads at the last load.
+        self.oversized = False
+        self.leads: Dict[str, dict] = {}
+        self.columns: Dict[str, Dict[str, dict]] = {}
+        self.meeting_links: Dict[str, str] = {}
+        self.epoch = ""
+        self.version = 0
+        # (version, lead_id, from_column, to_column); to_column None means removed.
+        self.log: deque = deque(maxlen=log_size)
+        self.loaded_at = 0.0
+        # When each lead was last written locally, so a reload that started
+        # before the write doesn't report it as removed.
+        self._touched: Dict[str, float] = {}
+        self._order: Dict[str, Optional[List[Tuple[str, str]]]] = {}
+        self._lock = asyncio.Lock()
+        self._reloading: Optional[asyncio.Task] = None
+
+    @property
+    def token(self) -> str:
+        return f"{self.epoch}-{self.version}"
+
+    async def ensure_fresh(self) -> bool:
+        """
+        Whether the snapshot can serve. Loads it if it never has been;
+        otherwise starts a background reload once it is older than the TTL.
+        """
+        if not self.epoch and not self.oversized:
+            async with self._lock:
+                if not self.epoch and not self.oversized:
+                    await self._reload()
+        elif time.monotonic() - self.loaded_at >= self.ttl and (self._reloading is None or self._reloading.done()):
+            self._reloading = asyncio.create_task(self._reload_in_background())
+        return bool(self.epoch)
+
+    async def _reload_in_background(self):
+        try:
+            async with self._lock:
+                await self._reload()
+        except Exception as e:
+            logger.warning("Pipeline snapshot reload failed: %s", e)
+
+    async def _reload(self):
+        started = time.monotonic()
+        leads = await self._fetch_all() if await self._fits() else None
+        self.loaded_at = started
+        if leads is None:
+            if not self.oversized:
+                logger.warning("More than %d leads; serving /pipeline without the snapshot", self.max_leads)
+            self.oversized = True
+            self.clear()
+            return
+        self.oversized = False
+        self._apply(leads, full=True, started=started)
+
+    async def _fits(self) -> bool:
+        """Whether the table has at most max_leads rows, without reading them."""
+        response = await rest.get_client().get(
+            rest.rest_url("leads"), params={"select": "id", "limit": "1", "offset": str(self.max_leads)},
+            headers=rest.auth_headers(),
+        )
+        if response.status_code != 200:
+            raise Exception(response.text)
+        return not fastjson.loads(response.content)
+
+    async def _fetch_all(self) -> Optional[List[dict]]:
+        """Every lead's PIPELINE_FIELDS, or None once there are more than max_leads."""
+        rows, cursor = [], None
+        while True:
+            response = await rest.get_client().get(
+                rest.rest_url("leads"), params=page_params(LOAD_PAGE_SIZE, cursor, select=PIPELINE_SELECT),
+                headers=rest.auth_headers(),
+            )
+            if response.status_code != 200:
+                raise Exception(response.text)
+            page, cursor = split_page(fastjson.loads(response.content), LOAD_PAGE_SIZE)
+            rows.extend(page)
+            if len(rows) > self.max_leads:
+                return None
+            if not cursor:
+                return rows
+
+    def clear(self):
+        """Drops the snapshot; unless it's oversized, the next ensure_fresh() loads it again."""
+        self.epoch = ""
+        self.leads.clear()
+        self.columns.clear()
+        self.meeting_links.clear()
+        self._touched.clear()
+        self._order.clear()
+
+    def _apply(self, leads: List[dict], full: bool = False, started: float = 0.0):
+        """Upserts leads (all of them, when full) and logs the ones that changed column."""
+        if full and not self.epoch:
+            # First load: nothing to diff against, so nothing to log.
+            self.epoch = uuid.uuid4().hex[:8]
+            for lead in leads:
+                self._put(lead)
+            return
+
+        moved = []
+        for lead in leads:
+            previous = self.leads.get(lead["id"])
+            before = column_of(previous) if previous else None
+            self._put(lead)
+            if before != column_of(lead):
+                moved.append((lead["id"], before, column_of(lead)))
+        if full:
+            seen = {lead["id"] for lead in leads}
+            gone = [lead_id for lead_id in self.leads if lead_id not in seen and self._touched.get(lead_id, 0.0) < started]
+            for lead_id in gone:
+                moved.append((lead_id, self._remove(lead_id), None))
+        if moved:
+            self.version += 1
+            self.log.extend((self.version, *move) for move in moved)
+
+    def _put(self, lead: dict):
+        previous = self.leads.get(lead["id"])
+        if previous is not None:
+            self.columns[column_of(previous)].pop(lead["id"], None)
+            self._order[column_of(previous)] = None
+        fields = {key: value for key, value in lead.items() if key in PIPELINE_FIELDS}
+        merged = {**previous, **fields} if previous else fields
+        self.leads[lead["id"]] = merged
+        self.columns.setdefault(column_of(merged), {})[lead["id"]] = merged
+        self._order[column_of(merged)] = None
+
+    def _remove(self, lead_id: str) -> str:
+        lead = self.leads.pop(lead_id)
+        column = column_of(lead)
+        self.columns[column].pop(lead_id, None)
+        self._order[column] = None
+        self.meeting_links.pop(lead_id, None)
+        self._touched.pop(lead_id, None)
+        return column
+
+    def expire(self):
+        """Makes the next ensure_fresh() reload, for when too much changed elsewhere to apply piecemeal."""
+        self.loaded_at = 0.0
+
+    def upsert(self, leads: List[dict]):
+        """Adds or updates leads written by this process (e.g. rows returned by an insert)."""
+        if self.epoch:
+            self._write([lead for lead in leads if "created_at" in lead or lead.get("id") in self.leads])
+
+    def set_status(self, lead_ids: List[str], status: str):
+        if self.epoch:
+            self._write([{"id": lead_id, "status": status} for lead_id in lead_ids if lead_id in self.leads])
+
+    def _write(self, leads: List[dict]):
+        now = time.monotonic()
+        for lead in leads:
+            self._touched[lead["id"]] = now
+        self._apply(leads)
+
+    def page(self, column: str, limit: int, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """Newest-first page of one column, with the same cursors as the database path."""
+        order = self._order.get(column)
+        if order is None:
+            order = self._order[column] = sorted(_key(lead) for lead in self.columns.get(column, {}).values())
+        end = bisect.bisect_left(order, tuple(decode_cursor(cursor))) if cursor else len(order)
+        keys = order[max(0, end - limit):end][::-1]
+        rows = [dict(self.leads[lead_id]) for _, lead_id in keys]
+        next_cursor = encode_cursor(rows[-1], LEAD_KEYS) if rows and end - limit > 0 else None
+        return rows, next_cursor
+
+    def delta(self, since: str) -> Optional[List[dict]]:
+        """
+        Leads whose column changed after version `since`, each with the column
+        it left, or None if the log no longer reaches back that far.
+        """
+        epoch, _, number = since.partition("-")
+        if epoch != self.epoch or not number.isdigit() or int(number) > self.version:
+            return None
+        since_version = int(number)
+        if since_version < self.version and (not self.log or self.log[0][0] > since_version + 1):
+            return None
+
+        changes: Dict[str, dict] = {}
+        for version, lead_id, before, after in self.log:
+            if version <= since_version:
+                continue
+            change = changes.setdefault(lead_id, {"id": lead_id, "from": before})
+            change["to"] = after
+        moved = []
+        for change in changes.values():
+            if change["from"] == change["to"]:
+                continue
+            lead = self.leads.get(change["id"])
+            change["lead"] = dict(lead) if lead else None
+            moved.append(change)
+        return moved
+
+    def meeting_link(self, lead: dict) -> str:
+        """Meeting room for a lead, generated once and reused on every poll."""
+        from utils import generate_meeting_link
+
+        link = self.meeting_links.get(lead["id"])
+        if link is None:
+            link = self.meeting_links[lead["id"]] = generate_meeting_link(lead.get("name") or "Lead", lead["id"])
+        return link
+
+
+pipeline_snapshot = PipelineSnapshot()
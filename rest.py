@@ -0,0 +1,94 @@
+"""
+Shared async HTTP client for all Supabase REST traffic.
+
+One pooled httpx.AsyncClient is opened in the FastAPI lifespan and reused
+by every handler and background task, so connections (and their TLS
+sessions) are kept alive instead of being rebuilt per request. Every call
+is timed into upstream_request_duration_seconds (see metrics.py).
+
+Pool tuning via environment:
+    HTTP2                       "1" (default) to negotiate HTTP/2 over TLS
+    HTTP_MAX_CONNECTIONS        total connections in the pool (default 100)
+    HTTP_MAX_KEEPALIVE          idle connections kept open (default 20)
+    HTTP_KEEPALIVE_EXPIRY       seconds an idle connection lives (default 30)
+"""
+import asyncio
+import os
+from typing import Optional
+
+import httpx
+
+from metrics import TimedTransport
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def rest_url(path: str) -> str:
+    """Builds a PostgREST URL, e.g. rest_url("leads")."""
+    return f"{os.environ.get('SUPABASE_URL')}/rest/v1/{path}"
+
+
+def auth_headers(**extra: str) -> dict:
+    """Supabase auth headers, merged with any extra headers given."""
+    key = os.environ.get("SUPABASE_KEY")
+    return {"apikey": key, "Authorization": f"Bearer {key}", **extra}
+
+
+def create_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=int(os.environ.get("HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.environ.get("HTTP_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "30")),
+    )
+    # The transport owns the pool, so limits and HTTP/2 are configured on it.
+    transport = TimedTransport(http2=os.environ.get("HTTP2", "1") == "1", limits=limits)
+    return httpx.AsyncClient(transport=transport, timeout=httpx.Timeout(30.0, connect=10.0))
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Returns the shared client. Scripts that run outside the app lifespan
+    (seed_db.py, the benchmarks) get one created on first use.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_client()
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+# Failures that mean the request never left this process.
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+async def request_with_retry(method: str, url: str, attempts: int = 3, backoff: float = 0.5,
+                             idempotent: Optional[bool] = None, **kwargs) -> httpx.Response:
+    """
+    Sends a request on the shared client, retrying transport errors and
+    retryable statuses with exponential backoff. Returns the last response,
+    or raises the last transport error.
+
+    A POST may have been applied upstream even when its response is an
+    error or never arrives, so it is only retried when it was never sent,
+    unless the caller passes idempotent=True (an upsert, an insert with
+    fixed ids that ignores duplicates, an RPC safe to repeat).
+    """
+    if idempotent is None:
+        idempotent = method.upper() != "POST"
+    for attempt in range(attempts):
+        last = attempt == attempts - 1
+        try:
+            response = await get_client().request(method, url, **kwargs)
+            if response.status_code not in RETRY_STATUSES or last or not idempotent:
+                return response
+        except httpx.TransportError as e:
+            if last or not (idempotent or isinstance(e, UNSENT_ERRORS)):
+                raise
+        await asyncio.sleep(backoff * 2 ** attempt)
@@ -36,6 +36,34 @@ create index leads_status_idx on public.leads(status);
 create index leads_phone_idx on public.leads(phone);
 create index interactions_lead_id_idx on public.interactions(lead_id);
 
+-- IST-formatted timestamps as PostgREST computed columns (select=*,created_at_ist),
+-- used when the API runs with IST_IN_SQL=1.
+create or replace function public.created_at_ist(public.leads)
+returns text
+language sql stable
+as $$
+  select to_char($1.created_at at time zone 'Asia/Kolkata', 'YYYY-MM-DD HH24:MI:SS "IST"');
+$$;
+
+create or replace function public.captured_at_ist(public.leads)
+returns text
+language sql stable
+as $$
+  select to_char($1.captured_at at time zone 'Asia/Kolkata', 'YYYY-MM-DD HH24:MI:SS "IST"');
+$$;
+
+-- Keyset pagination for /leads and per-column pages for /pipeline.
+create index leads_created_at_id_idx on public.leads(created_at desc, id desc);
+create index leads_status_created_at_id_idx on public.leads(status, created_at desc, id desc);
+
+-- One grouped count for the /stats dashboard instead of a count per metric.
+create or replace function public.lead_status_counts()
+returns table (status text, total bigint)
+language sql stable
+as $$
+  select status, count(*) from public.leads group by status;
+$$;
+
 alter table public.leads enable row level security;
 alter table public.interactions enable row level security;
 
@@ -51,3 +79,219 @@ create policy "Enable access for service role" on public.interactions
     to service_role
     using (true)
     with check (true);
+
+
+-- Blocking keys for fuzzy duplicate detection (dedup.py). Keep these
+-- expressions in step with phone_key() / name_block() there.
+alter table public.leads add column if not exists phone_key text generated always as (
+  case when length(regexp_replace(phone, '[^0-9]', '', 'g')) >= 7
+       then right(regexp_replace(phone, '[^0-9]', '', 'g'), 10) end
+) stored;
+
+alter table public.leads add column if not exists name_block text generated always as (
+  case when email like '%@%' and left(regexp_replace(lower(name), '[^a-z0-9]', '', 'g'), 4) <> ''
+       then lower(split_part(email, '@', 2)) || ':' || left(regexp_replace(lower(name), '[^a-z0-9]', '', 'g'), 4) end
+) stored;
+
+create index if not exists leads_phone_key_idx on public.leads(phone_key, created_at);
+create index if not exists leads_name_block_idx on public.leads(name_block, created_at);
+
+-- Oldest leads sharing a blocking key, capped per key so the cost stays
+-- bounded however large a block grows. duplicate_of is the lead a
+-- candidate is already tagged a duplicate of.
+drop function if exists public.dedup_candidates(text[], text[], int);
+create or replace function public.dedup_candidates(phone_keys text[], name_blocks text[], block_limit int default 50)
+returns table (id uuid, name text, email text, phone text, duplicate_of text)
+language sql stable
+as $$
+  select c.id, c.name, c.email, c.phone, c.duplicate_of
+  from unnest(phone_keys) as k(key)
+  cross join lateral (
+    select l.id, l.name, l.email, l.phone, l.meta_data->>'possible_duplicate_of' as duplicate_of from public.leads l
+    where l.phone_key = k.key order by l.created_at limit block_limit
+  ) c
+  union
+  select c.id, c.name, c.email, c.phone, c.duplicate_of
+  from unnest(name_blocks) as k(key)
+  cross join lateral (
+    select l.id, l.name, l.email, l.phone, l.meta_data->>'possible_duplicate_of' as duplicate_of from public.leads l
+    where l.name_block = k.key order by l.created_at limit block_limit
+  ) c;
+$$;
+
+-- Lead search (search.py). search_leads() unions three lookups, each capped
+-- at max_candidates rows and each served by an index, so a query costs the
+-- same however large the table grows; the API re-ranks what it returns.
+create extension if not exists pg_trgm;
+
+alter table public.leads add column if not exists search_text text generated always as (
+  lower(coalesce(name, '') || ' ' || coalesce(company, ''))
+) stored;
+
+alter table public.leads add column if not exists search_document tsvector generated always as (
+  setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+  setweight(to_tsvector('simple', coalesce(company, '')), 'B') ||
+  setweight(to_tsvector('simple', coalesce(notes, '')), 'C')
+) stored;
+
+create index if not exists leads_search_text_trgm_idx on public.leads using gist (search_text gist_trgm_ops);
+create index if not exists leads_search_document_idx on public.leads using gin (search_document);
+create index if not exists leads_phone_key_trgm_idx on public.leads using gin (phone_key gin_trgm_ops);
+
+create or replace function public.search_leads(query text, max_candidates int default 100)
+returns setof public.leads
+language sql stable
+as $$
+  with q as (
+    select
+      lower(trim(query)) as text,
+      regexp_replace(query, '[^0-9]', '', 'g') as digits,
+      -- "raj sha" -> 'raj:* & sha:*', so every word matches as a prefix.
+      nullif(array_to_string(array(
+        select regexp_replace(word, '[^[:alnum:]]', '', 'g') || ':*'
+        from regexp_split_to_table(lower(query), '\s+') as word
+        where regexp_replace(word, '[^[:alnum:]]', '', 'g') <> ''
+      ), ' & '), '') as prefixes
+  )
+  select l.* from public.leads l
+  where l.id in (
+    (select p.id from public.leads p, q
+     where length(q.digits) >= 4 and p.phone_key like '%' || q.digits || '%'
+     limit max_candidates)
+    union
+    (select t.id from public.leads t, q
+     where q.prefixes is not null and t.search_document @@ to_tsquery('simple', q.prefixes)
+     -- Unordered on purpose: ranking every match would grow with the table.
+     -- The best name/company matches also come through the KNN branch below.
+     limit max_candidates)
+    union
+    (select f.id from public.leads f, q
+     order by q.text <<-> f.search_text
+     limit max_candidates)
+  );
+$$;
+
+-- Interaction timelines (timelines.py). Every interaction has a date, so
+-- (date, id) is a total order that keyset cursors can rely on.
+update public.interactions set date = coalesce(created_at, now()) where date is null;
+alter table public.interactions alter column date set not null;
+
+create index if not exists interactions_lead_id_date_idx on public.interactions(lead_id, date desc, id desc);
+-- The composite index covers every lookup the single-column one served.
+drop index if exists public.interactions_lead_id_idx;
+
+-- The newest interactions of each lead, per_lead at most, older than that
+-- lead's cursor if it has one. cursors maps lead id -> [date, id].
+create or replace function public.interaction_timelines(lead_ids uuid[], per_lead int default 20, cursors jsonb default '{}')
+returns setof public.interactions
+language sql stable
+as $$
+  select i.*
+  from unnest(lead_ids) as l(lead_id)
+  cross join lateral (
+    select x.* from public.interactions x
+    where x.lead_id = l.lead_id
+      and (cursors -> (l.lead_id::text) is null
+           or (x.date, x.id) < ((cursors -> (l.lead_id::text) ->> 0)::timestamptz,
+                                (cursors -> (l.lead_id::text) ->> 1)::uuid))
+    order by x.date desc, x.id desc
+    limit per_lead
+  ) i;
+$$;
+
+-- Interaction count and latest interaction per lead, for /leads?interactions=true.
+create or replace function public.interaction_summaries(lead_ids uuid[])
+returns table (lead_id uuid, total bigint, last_type text, last_date timestamptz, last_summary text)
+language sql stable
+as $$
+  select l.lead_id, c.total, last.type, last.date, last.summary
+  from unnest(lead_ids) as l(lead_id)
+  cross join lateral (select count(*) as total from public.interactions x where x.lead_id = l.lead_id) c
+  left join lateral (
+    select x.type, x.date, x.summary from public.interactions x
+    where x.lead_id = l.lead_id
+    order by x.date desc, x.id desc
+    limit 1
+  ) last on true;
+$$;
+
+-- Lead cache (lead_cache.py). updated_at moves on every write, so the API can
+-- find what changed behind its back with one index range scan on updated_at.
+update public.leads set updated_at = coalesce(created_at, now()) where updated_at is null;
+alter table public.leads alter column updated_at set not null;
+
+create or replace function public.touch_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+  -- clock_timestamp(), not now(): a long transaction shouldn't stamp rows with its start time.
+  new.updated_at := clock_timestamp();
+  return new;
+end;
+$$;
+
+drop trigger if exists leads_touch_updated_at on public.leads;
+create trigger leads_touch_updated_at
+before update on public.leads
+for each row execute function public.touch_updated_at();
+
+create index if not exists leads_updated_at_id_idx on public.leads(updated_at desc, id desc);
+
+-- Bulk status changes (transitions.py). Moves the listed leads whose status
+-- (null counts as New) is in allowed_from, logs a Note interaction for each
+-- one moved, and reports every lead that exists: moved, unchanged (already
+-- there) or rejected, with the status it had. One statement, so the
+-- check, the update and the interactions commit together.
+create or replace function public.transition_leads(
+  lead_ids uuid[], to_status text, allowed_from text[], note text default null, log boolean default true
+)
+returns table (id uuid, from_status text, outcome text)
+language sql volatile
+as $$
+  with current_status as (
+    select l.id, coalesce(l.status, 'New') as status
+    from public.leads l
+    where l.id = any(lead_ids)
+    for update
+  ),
+  moved as (
+    update public.leads l set status = to_status
+    from current_status c
+    where l.id = c.id and c.status <> to_status and c.status = any(allowed_from)
+    returning l.id, c.status as from_status
+  ),
+  logged as (
+    insert into public.interactions (lead_id, type, summary)
+    select m.id, 'Note',
+           format('Status changed from %s to %s', m.from_status, to_status) || coalesce(': ' || note, '')
+    from moved m
+    where log
+  )
+  select c.id, c.status,
+         case when c.status = to_status then 'unchanged'
+              when m.id is not null then 'moved'
+              else 'rejected' end
+  from current_status c
+  left join moved m on m.id = c.id;
+$$;
+
+-- Enrichment write-back (enrichment.py). Merges each patch's top-level keys
+-- into the lead's current meta_data, and patch.enrichment into its
+-- enrichment, so keys and providers written elsewhere survive. An update
+-- only: a lead deleted meanwhile is skipped, never recreated. Returns the
+-- merged meta_data of every lead updated.
+create or replace function public.merge_lead_meta_data(patches jsonb)
+returns table (id uuid, meta_data jsonb)
+language sql volatile
+as $$
+  update public.leads l
+  set meta_data = coalesce(l.meta_data, '{}') || p.meta_data
+                  || case when p.meta_data ? 'enrichment'
+                          then jsonb_build_object('enrichment',
+                                 coalesce(l.meta_data -> 'enrichment', '{}') || (p.meta_data -> 'enrichment'))
+                          else '{}' end
+  from jsonb_to_recordset(patches) as p(id uuid, meta_data jsonb)
+  where l.id = p.id
+  returning l.id, l.meta_data;
+$$;
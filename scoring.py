@@ -0,0 +1,372 @@
+"""
+Configurable, batch-oriented lead scoring.
+
+Rules live in a JSON file (SCORING_RULES_PATH, default scoring_rules.json
+next to this module) and are compiled once:
+
+    present   field is non-empty                    {"field": "email"}
+    keywords  any keyword occurs in the field       {"field": "notes", "keywords": [...]}
+    pattern   regex matches the field               {"field": "role", "pattern": "founder|ceo"}
+    equals    field equals one of the values        {"field": "meta_data.location", "values": [...]}
+
+Matching ignores case, and fields may be dotted paths into meta_data. A
+rule adds its weight at most once per lead.
+
+Every keyword and pattern rule on a field is compiled into one
+FieldMatcher, which walks that field's values once per batch, each value
+on its own so no match can run into the next lead. Keywords are matched
+through the words of a value: a keyword without spaces occurs in a value
+exactly when it occurs inside one of its words, and a two-word keyword
+when it straddles two neighbouring words. What each distinct word (and
+word pair) matches is worked out once and remembered, so a value costs a
+dictionary lookup per word however many keyword rules there are. Keywords
+that don't split cleanly on single spaces fall back to a trie-shaped
+regex. A field with only a few keywords (the shipped rules) uses plain
+substring checks instead, and patterns for a field are one alternation
+with a named group per rule, run once per distinct value.
+
+Matched rules are tracked as a bitmask per lead. Scores are summed per
+weight with popcounts, and each result's per-rule breakdown is only
+built when read.
+"""
+import json
+import os
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from functools import cached_property, reduce
+from itertools import accumulate, repeat
+from operator import add, and_, methodcaller, mul, or_
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+RESULT_CACHE_SIZE = 4096
+# Distinct words (and word pairs) whose matches each FieldMatcher remembers.
+WORD_CACHE_SIZE = 65536
+# Up to this many keywords per field, substring checks beat the word index.
+FAST_PATH_KEYWORDS = 16
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scoring_rules.json")
+
+
+@dataclass(frozen=True)
+class ScoreResult:
+    """Score plus the weight each matching rule contributed. Shared between leads; don't mutate."""
+    score: int
+    mask: int = 0
+    # (name, weight) of rule i at index i; decodes mask.
+    rules: Sequence[Tuple[str, int]] = field(default=(), repr=False, compare=False)
+
+    @cached_property
+    def contributions(self) -> Dict[str, int]:
+        contributions = {}
+        bits = self.mask
+        while bits:
+            low = bits & -bits
+            name, weight = self.rules[low.bit_length() - 1]
+            contributions[name] = weight
+            bits ^= low
+        return contributions
+
+
+def _getter(path: str) -> Callable[[dict], object]:
+    if "." not in path:
+        return methodcaller("get", path)
+    parts = path.split(".")
+    if len(parts) == 2:
+        outer, inner = parts
+
+        def get_nested(lead: dict):
+            value = lead.get(outer)
+            return value.get(inner) if isinstance(value, dict) else None
+        return get_nested
+
+    def get(lead: dict):
+        value = lead
+        for part in parts:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(part)
+        return value
+    return get
+
+
+def _texts(values: List[object]) -> List[str]:
+    # Each field is matched as a single line.
+    return [str(value).lower().replace("\n", " ") if value else "" for value in values]
+
+
+def _trie_pattern(words: List[str]) -> str:
+    """
+    Regex for a set of literal words, shaped as a prefix trie
+    (e.g. "in(?:vest(?:ment)?|come)"). Python's re tries alternatives one by
+    one, so a flat alternation of hundreds of keywords costs hundreds of
+    attempts per character; the trie shares the work between prefixes.
+    """
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node: dict) -> str:
+        ends = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Greedy optional: the longest keyword wins at a given offset.
+        return f"(?:{body})?" if ends else body
+
+    return build(trie)
+
+
+# int.bit_count() is Python 3.10+.
+_popcount = getattr(int, "bit_count", None) or (lambda n: bin(n).count("1"))
+
+
+class _Memo(dict):
+    """Remembers compute(key) for each key looked up."""
+
+    def __init__(self, compute: Callable):
+        super().__init__()
+        self.compute = compute
+
+    def __missing__(self, key):
+        value = self[key] = self.compute(key)
+        return value
+
+
+class FieldMatcher:
+    """Every keyword and pattern rule on one field. match() returns the rules each value hits, as masks."""
+
+    def __init__(self, keywords: Dict[str, int], patterns: List[Tuple[int, str]]):
+        self.substrings: Optional[Dict[str, int]] = None
+        self.words: Optional[_Memo] = None
+        self.paired = False
+        self.fallback = None
+        if len(keywords) <= FAST_PATH_KEYWORDS:
+            self.substrings = dict(keywords)
+        else:
+            self._index_keywords(keywords)
+        self.patterns = None
+        if patterns:
+            # One search tells whether any pattern matches and names the first
+            # that does; only values that hit are tried against the others.
+            combined = re.compile("|".join(f"(?P<r{bit.bit_length() - 1}>{pattern})" for bit, pattern in patterns), re.IGNORECASE)
+            groups = {f"r{bit.bit_length() - 1}": bit for bit, _ in patterns}
+            each = [(bit, re.compile(pattern, re.IGNORECASE)) for bit, pattern in patterns]
+            self.patterns = combined.search, groups, each
+
+    def _index_keywords(self, keywords: Dict[str, int]):
+        single: Dict[str, int] = defaultdict(int)
+        # first word -> [(second word, rules)]
+        heads: Dict[str, List[Tuple[str, int]]] = defaultdict(list)
+        odd: Dict[str, int] = {}
+        for keyword, bits in keywords.items():
+            pieces = keyword.split(" ")
+            if "\n" in keyword:
+                # Values never contain one (see _texts); _match_words uses it as a separator.
+                odd[keyword] = bits
+            elif len(pieces) == 1:
+                single[keyword] |= bits
+            elif len(pieces) == 2 and all(pieces):
+                heads[pieces[0]].append((pieces[1], bits))
+            else:
+                # Leading, trailing or repeated spaces, or three words or more.
+                odd[keyword] = bits
+
+        lengths = sorted({len(keyword) for keyword in single})
+
+        def word_rules(word: str) -> int:
+            bits = 0
+            for length in lengths:
+                if length > len(word):
+                    break
+                for start in range(len(word) - length + 1):
+                    bits |= single.get(word[start:start + length], 0)
+            return bits
+
+        head_lengths = sorted({len(head) for head in heads})
+
+        def pair_rules(pair: Tuple[str, Optional[str]]) -> int:
+            # Keywords inside the first word, and those whose first word ends
+            # it while their second word starts the next one.
+            first, second = pair
+            bits = word_rules(first)
+            if second is not None:
+                for length in head_lengths:
+                    if length > len(first):
+                        break
+                    for tail, rules in heads.get(first[len(first) - length:], ()):
+                        if second.startswith(tail):
+                            bits |= rules
+            return bits
+
+        # Keyed by (word, next word) when there are two-word keywords, else by word.
+        self.paired = bool(heads)
+        self.words = _Memo(pair_rules if heads else word_rules)
+        if odd:
+            # The lookahead reports the longest keyword starting at every offset,
+            # so overlapping keywords are all seen. Every shorter keyword inside
+            # that match is credited through the closure.
+            regex = re.compile(f"(?=({_trie_pattern(list(odd))}))")
+            closure = {keyword: reduce(or_, (rules for other, rules in odd.items() if other in keyword), 0) for keyword in odd}
+            self.fallback = regex.findall, closure.__getitem__
+
+    def match(self, texts: List[str]) -> List[int]:
+        found = [0] * len(texts)
+        if self.substrings is not None:
+            for keyword, bits in self.substrings.items():
+                for n in [n for n, text in enumerate(texts) if keyword in text]:
+                    found[n] |= bits
+        if self.words is not None:
+            found = self._match_words(texts)
+        if self.fallback is not None:
+            findall, lookup = self.fallback
+            found = [bits | reduce(or_, map(lookup, findall(text)), 0) for bits, text in zip(found, texts)]
+        if self.patterns is not None:
+            # Once per distinct value: roles and companies repeat.
+            distinct = dict.fromkeys(texts)
+            distinct.update(zip(distinct, map(self._pattern_rules, distinct)))
+            found = list(map(or_, found, map(distinct.__getitem__, texts)))
+        return found
+
+    def _pattern_rules(self, text: str) -> int:
+        search, groups, each = self.patterns
+        hit = search(text) if text else None
+        if hit is None:
+            return 0
+        bits = groups.get(hit.lastgroup, 0)
+        for bit, regex in each:
+            if not bits & bit and regex.search(text):
+                bits |= bit
+        return bits
+
+    def _match_words(self, texts: List[str]) -> List[int]:
+        """
+        Splits the whole batch into words in one go, with a "\\n" word
+        between values, and looks each word (with the word after it, for
+        two-word keywords) up in the memo. Each value's run of results is
+        then ORed together.
+        """
+        if len(self.words) > WORD_CACHE_SIZE:
+            self.words.clear()
+        words = " \n ".join(texts).split(" ")
+        if self.paired:
+            following = words[1:]
+            following.append(None)
+            bits = list(map(self.words.__getitem__, zip(words, following)))
+        else:
+            bits = list(map(self.words.__getitem__, words))
+        # Value i's words run from ends[i - 1] to ends[i], less the separator.
+        ends = list(accumulate(map(add, map(str.count, texts, repeat(" ")), repeat(2))))
+        starts = [0] + ends[:-1]
+        return list(map(reduce, repeat(or_), map(bits.__getitem__, map(slice, starts, ends))))
+        return found
+
+
+class ScoringEngine:
+    def __init__(self, rules: List[dict], qualify_score: int = 40):
+        self.rules = rules
+        self.qualify_score = qualify_score
+        self.weights = [int(rule["weight"]) for rule in rules]
+        self.names = [rule["name"] for rule in rules]
+        self.table = tuple(zip(self.names, self.weights))
+        # weight -> mask of the rules with that weight; a score is a few popcounts.
+        by_weight: Dict[int, int] = defaultdict(int)
+        for i, weight in enumerate(self.weights):
+            by_weight[weight] |= 1 << i
+        self.weight_masks = [(weight, mask) for weight, mask in by_weight.items() if weight]
+
+        self.present: List[tuple] = []
+        self.equals: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        patterns: Dict[str, List[tuple]] = defaultdict(list)
+        keywords: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+        # Rule sets are bitmasks: bit i is rule i.
+        for i, rule in enumerate(rules):
+            kind, path = rule["type"], rule["field"]
+            if kind == "present":
+                self.present.append((1 << i, path))
+            elif kind == "keywords":
+                for keyword in rule["keywords"]:
+                    keywords[path][keyword.lower()] |= 1 << i
+            elif kind == "pattern":
+                patterns[path].append((1 << i, rule["pattern"]))
+            elif kind == "equals":
+                for value in rule["values"]:
+                    self.equals[path][str(value).lower()] |= 1 << i
+            else:
+                raise ValueError(f"Unknown rule type {kind!r} in rule {rule['name']!r}")
+
+        self.getters = {path: _getter(path) for path in {rule["field"] for rule in rules}}
+        self.matchers = {path: FieldMatcher(keywords.get(path, {}), patterns.get(path, [])) for path in {*keywords, *patterns}}
+        self._results: Dict[int, ScoreResult] = {}
+
+    @classmethod
+    def from_file(cls, path: Optional[str] = None) -> "ScoringEngine":
+        with open(path or os.environ.get("SCORING_RULES_PATH", DEFAULT_RULES_PATH)) as f:
+            config = json.load(f)
+        return cls(config["rules"], config.get("qualify_score", 40))
+
+    def _results_for(self, masks: List[int]) -> Dict[int, ScoreResult]:
+        """Results for masks not in the cache, scored per weight with popcounts over all of them at once."""
+        masks = list(dict.fromkeys(masks))
+        scores = [0] * len(masks)
+        for weight, rules in self.weight_masks:
+            hits = map(_popcount, map(and_, masks, repeat(rules)))
+            scores = list(map(add, scores, map(mul, hits, repeat(weight))))
+        built = dict(zip(masks, map(ScoreResult, scores, masks, repeat(self.table))))
+        if len(self._results) + len(built) > RESULT_CACHE_SIZE:
+            self._results.clear()
+        if len(built) <= RESULT_CACHE_SIZE:
+            self._results.update(built)
+        return built
+
+    def score_batch(self, leads: List[dict]) -> List[ScoreResult]:
+        # Field by field over the whole batch, each step one comprehension.
+        values_by_path: Dict[str, list] = {}
+        texts_by_path: Dict[str, List[str]] = {}
+
+        def values(path: str) -> list:
+            if path not in values_by_path:
+                values_by_path[path] = list(map(self.getters[path], leads))
+            return values_by_path[path]
+
+        def texts(path: str) -> List[str]:
+            if path not in texts_by_path:
+                texts_by_path[path] = _texts(values(path))
+            return texts_by_path[path]
+
+        masks = [0] * len(leads)
+        for bit, path in self.present:
+            masks = [mask | bit if value else mask for mask, value in zip(masks, values(path))]
+
+        for path, table in self.equals.items():
+            get = table.get
+            masks = [mask | get(text, 0) for mask, text in zip(masks, texts(path))]
+
+        for path, matcher in self.matchers.items():
+            masks = list(map(or_, masks, matcher.match(texts(path))))
+
+        # Leads sharing a rule combination share its result.
+        results = list(map(self._results.get, masks))
+        missing = [mask for mask, result in zip(masks, results) if result is None]
+        if missing:
+            built = self._results_for(missing)
+            results = [result or built[mask] for mask, result in zip(masks, results)]
+        return results
+
+    def score(self, lead: dict) -> ScoreResult:
+        return self.score_batch([lead])[0]
+
+
+_engine: Optional[ScoringEngine] = None
+
+
+def get_engine() -> ScoringEngine:
+    """The engine for the configured rule file, compiled on first use."""
+    global _engine
+    if _engine is None:
+        _engine = ScoringEngine.from_file()
+    return _engine
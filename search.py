@@ -0,0 +1,101 @@
+"""
+Lead search for GET /leads/search.
+
+Postgres finds the candidates and rapidfuzz orders them. The search_leads
+RPC in schema.sql unions three index-backed lookups, each capped at
+SEARCH_CANDIDATES rows:
+
+    phone       digits of the query inside phone_key      (trigram GIN)
+    full text   words and word prefixes of the query      (tsvector GIN)
+    fuzzy       nearest search_text by word similarity    (trigram GiST, KNN)
+
+so the work per query is bounded by the cap rather than by the size of the
+table. The candidates are then scored here against name, company, phone
+and notes, and anything under SEARCH_MIN_SCORE is dropped. Results are the
+best matches among the candidates, paged with a (score, id) cursor.
+"""
+import os
+import re
+from typing import List, Optional, Tuple
+
+from rapidfuzz import fuzz
+from rapidfuzz.utils import default_process
+
+import rest
+from pagination import decode_cursor, encode_cursor
+
+SEARCH_CANDIDATES = int(os.environ.get("SEARCH_CANDIDATES", "100"))
+SEARCH_MIN_SCORE = float(os.environ.get("SEARCH_MIN_SCORE", "60"))
+SEARCH_KEYS = ("score", "id")
+# Columns score_lead() reads; always fetched, whatever the caller selects.
+SEARCH_FIELDS = ("id", "name", "company", "phone", "notes")
+MIN_QUERY_LENGTH = 2
+# Phone numbers are matched on digits once there are enough of them to be specific.
+MIN_PHONE_DIGITS = 4
+# A match on the name counts for more than one on the company or buried in notes.
+FIELD_WEIGHTS = (("name", 1.0), ("company", 0.9), ("notes", 0.8))
+PREFIX_BONUS = 10
+
+_NON_DIGIT = re.compile(r"[^0-9]")
+
+
+def score_lead(query: str, lead: dict) -> float:
+    """0-100 relevance of a lead to an already processed (lowercased, trimmed) query."""
+    best = 0.0
+    digits = _NON_DIGIT.sub("", query)
+    if len(digits) >= MIN_PHONE_DIGITS and digits in _NON_DIGIT.sub("", lead.get("phone") or ""):
+        best = 100.0
+    for field, weight in FIELD_WEIGHTS:
+        value = default_process(lead.get(field) or "")
+        if not value:
+            continue
+        if field == "notes":
+            # Notes are long; only how well the query fits somewhere in them matters.
+            score = fuzz.partial_ratio(query, value)
+        elif value == query:
+            score = 100.0
+        else:
+            score = fuzz.WRatio(query, value)
+            if value.startswith(query) or f" {query}" in value:
+                score += PREFIX_BONUS
+            # Only an exact match gets full marks, so "lead 42" ranks above "lead 427".
+            score = min(99.0, score)
+        best = max(best, score * weight)
+    return round(best, 2)
+
+
+def rank(query: str, candidates: List[dict], min_score: float = SEARCH_MIN_SCORE) -> List[dict]:
+    """Candidates scoring at least min_score, best first, each with a `score` field."""
+    processed = default_process(query)
+    ranked = []
+    for lead in candidates:
+        score = score_lead(processed, lead)
+        if score >= min_score:
+            ranked.append({**lead, "score": score})
+    # id breaks ties so the order, and with it the cursor, is stable.
+    ranked.sort(key=lambda lead: (-lead["score"], lead["id"]))
+    return ranked
+
+
+def paginate(ranked: List[dict], limit: int, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """One page of ranked results after `cursor`, and the cursor for the next page."""
+    if cursor:
+        score, lead_id = decode_cursor(cursor, SEARCH_KEYS)
+        after = (-float(score), str(lead_id))
+        ranked = [lead for lead in ranked if (-lead["score"], lead["id"]) > after]
+    page = ranked[:limit]
+    next_cursor = encode_cursor(page[-1], SEARCH_KEYS) if len(ranked) > limit else None
+    return page, next_cursor
+
+
+async def fetch_candidates(query: str, select: str, max_candidates: int = SEARCH_CANDIDATES) -> List[dict]:
+    """Leads the search_leads RPC returns for a query, with the columns in `select`."""
+    response = await rest.get_client().post(
+        rest.rest_url("rpc/search_leads"),
+        params={"select": select},
+        headers=rest.auth_headers(),
+        json={"query": query, "max_candidates": max_candidates},
+    )
+    if response.status_code != 200:
+        raise Exception(response.text)
+    return response.json()
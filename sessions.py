@@ -0,0 +1,210 @@
+"""
+Idempotent, resumable /sync sessions.
+
+A client that sends an `Idempotency-Key` header opens a session under that
+key. Each lead in the batch gets a stable ID (its own `id`, or one derived
+from the key and the lead's content), and the IDs are recorded as each
+insert chunk commits. A retry under the same key then:
+
+  * gets the stored response straight back if the body is identical and
+    the first attempt finished, without touching the database;
+  * otherwise only inserts the leads not yet committed, so a timed-out
+    upload resumes where it stopped (clients may also send just the
+    remainder, see GET /sync/sessions/{key}).
+
+Sessions live in a local SQLite file (SYNC_SESSION_PATH, default
+sync_sessions.db) so they survive a restart, and expire after
+SYNC_SESSION_TTL seconds (default 86400).
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+SESSION_TTL = float(os.environ.get("SYNC_SESSION_TTL", "86400"))
+# How long a request may hold a session before a retry can take it over.
+SESSION_LEASE = float(os.environ.get("SYNC_SESSION_LEASE", "120"))
+SESSION_NAMESPACE = uuid.UUID("5b0d3c52-9a4f-4c1e-8a57-3f0f6d0b8e21")
+
+
+class SessionBusy(Exception):
+    """Another request is still working on this session."""
+
+
+@dataclass
+class SyncSession:
+    key: str
+    request_hash: Optional[str] = None
+    result: Optional[dict] = None
+    new_records: int = 0
+    ignored_duplicates: int = 0
+    possible_duplicates: int = 0
+    committed: set = field(default_factory=set)
+    expires_at: float = 0.0
+
+
+def request_hash(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+def assign_lead_ids(key: str, rows: List[dict]) -> List[str]:
+    """
+    Gives every row a stable `id` (kept if the client sent one), so the same
+    lead maps to the same ID on every retry of the session.
+    """
+    for row in rows:
+        if "id" not in row:
+            content = json.dumps(row, sort_keys=True, separators=(",", ":"))
+            row["id"] = str(uuid.uuid5(SESSION_NAMESPACE, f"{key}\n{content}"))
+    return [row["id"] for row in rows]
+
+
+class SQLiteSessionStore:
+    """Session state in a local SQLite file (WAL mode), shared by every worker on the host."""
+
+    def __init__(self, path: Optional[str] = None, ttl: float = SESSION_TTL):
+        self.path = path or os.environ.get("SYNC_SESSION_PATH", "sync_sessions.db")
+        self.ttl = ttl
+        with self._connect() as db:
+            db.execute("pragma journal_mode=wal")
+            db.execute("""
+                create table if not exists sync_sessions (
+                    key text primary key,
+                    request_hash text,
+                    result text,
+                    new_records integer not null default 0,
+                    ignored_duplicates integer not null default 0,
+                    possible_duplicates integer not null default 0,
+                    locked_until real,
+                    expires_at real not null
+                )
+            """)
+            db.execute("""
+                create table if not exists sync_session_leads (
+                    key text not null,
+                    lead_id text not null,
+                    primary key (key, lead_id)
+                ) without rowid
+            """)
+            db.execute("create index if not exists sync_sessions_expiry_idx on sync_sessions(expires_at)")
+
+    @contextmanager
+    def _connect(self):
+        # A connection per call keeps this usable from worker threads and other processes.
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def _load(self, db, key: str, with_leads: bool = True) -> Optional[SyncSession]:
+        row = db.execute(
+            """
+            select request_hash, result, new_records, ignored_duplicates, possible_duplicates, expires_at
+            from sync_sessions where key = ?
+            """,
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        session = SyncSession(
+            key=key, request_hash=row[0], result=json.loads(row[1]) if row[1] else None,
+            new_records=row[2], ignored_duplicates=row[3], possible_duplicates=row[4], expires_at=row[5],
+        )
+        if with_leads:
+            session.committed = {lead_id for (lead_id,) in db.execute(
+                "select lead_id from sync_session_leads where key = ?", (key,)
+            )}
+        return session
+
+    def _purge_expired(self, db, now: float):
+        expired = [key for (key,) in db.execute("select key from sync_sessions where expires_at < ?", (now,))]
+        if expired:
+            db.executemany("delete from sync_session_leads where key = ?", [(key,) for key in expired])
+            db.executemany("delete from sync_sessions where key = ?", [(key,) for key in expired])
+
+    def claim(self, key: str, body_hash: str) -> SyncSession:
+        """
+        Opens or resumes the session for a request. If the result is stored
+        and the body is identical, it is returned as-is (session.result) and
+        nothing is locked. Raises SessionBusy if another request holds it.
+        """
+        now = time.time()
+        with self._connect() as db:
+            db.execute("begin immediate")
+            try:
+                self._purge_expired(db, now)
+                session = self._load(db, key, with_leads=False)
+                if session is not None and session.result is not None and session.request_hash == body_hash:
+                    db.execute("commit")
+                    return session
+                locked_until = db.execute("select locked_until from sync_sessions where key = ?", (key,)).fetchone()
+                if locked_until and locked_until[0] and locked_until[0] > now:
+                    raise SessionBusy(f"Sync session {key} is still in progress")
+                db.execute(
+                    """
+                    insert into sync_sessions (key, locked_until, expires_at) values (?, ?, ?)
+                    on conflict (key) do update set locked_until = excluded.locked_until, result = null
+                    """,
+                    (key, now + SESSION_LEASE, now + self.ttl),
+                )
+                session = self._load(db, key)
+                db.execute("commit")
+            except Exception:
+                db.execute("rollback")
+                raise
+        session.result = None
+        return session
+
+    def commit(self, key: str, lead_ids: List[str], new_records: int, ignored_duplicates: int, possible_duplicates: int):
+        """Records leads whose insert chunk has committed, with that chunk's counts."""
+        with self._connect() as db:
+            db.execute("begin immediate")
+            db.executemany(
+                "insert or ignore into sync_session_leads (key, lead_id) values (?, ?)",
+                [(key, lead_id) for lead_id in lead_ids],
+            )
+            db.execute(
+                """
+                update sync_sessions set new_records = new_records + ?, ignored_duplicates = ignored_duplicates + ?,
+                                         possible_duplicates = possible_duplicates + ?, locked_until = ?
+                where key = ?
+                """,
+                (new_records, ignored_duplicates, possible_duplicates, time.time() + SESSION_LEASE, key),
+            )
+            db.execute("commit")
+
+    def finish(self, key: str, body_hash: str, result: dict):
+        """Stores the response for replay and releases the session."""
+        with self._connect() as db:
+            db.execute(
+                "update sync_sessions set request_hash = ?, result = ?, locked_until = null where key = ?",
+                (body_hash, json.dumps(result), key),
+            )
+
+    def release(self, key: str):
+        """Releases the session after a failed attempt so the client can retry at once."""
+        with self._connect() as db:
+            db.execute("update sync_sessions set locked_until = null where key = ?", (key,))
+
+    def get(self, key: str) -> Optional[SyncSession]:
+        with self._connect() as db:
+            session = self._load(db, key)
+        if session is None or session.expires_at < time.time():
+            return None
+        return session
+
+
+_store: Optional[SQLiteSessionStore] = None
+
+
+def get_session_store() -> SQLiteSessionStore:
+    global _store
+    if _store is None:
+        _store = SQLiteSessionStore()
+    return _store
@@ -0,0 +1,377 @@
+"""
+Resumable, chunked uploads of interaction recordings.
+
+A client opens an upload for an interaction, then sends the file in one or
+more PATCH requests, each starting at the offset the server reports (a
+subset of the tus protocol). Bodies are streamed through in parts of the
+backend's part_size, so a worker holds at most one part per upload in
+memory whatever the file size. If a request breaks off, GET the upload for
+the committed offset and continue from there. When the last byte arrives
+the object is finalised and the interaction's recording_url is set.
+
+Backends are chosen with STORAGE_BACKEND:
+    local               files under STORAGE_LOCAL_PATH (default storage/),
+                        for development and offline tests
+    supabase            Supabase Storage, through its resumable (tus) endpoint
+    package.module:Cls  any StorageBackend subclass, constructed without arguments
+
+Upload state lives in a local SQLite file (UPLOAD_STATE_PATH, default
+uploads.db), so an upload can resume on any worker of the host.
+"""
+import asyncio
+import base64
+import importlib
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+import rest
+
+RECORDINGS_BUCKET = os.environ.get("RECORDINGS_BUCKET", "audio-notes")
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(500 << 20)))
+# How long an unfinished upload can be resumed.
+UPLOAD_TTL = float(os.environ.get("UPLOAD_TTL", "86400"))
+# How long a PATCH may hold an upload before another request can take it over.
+UPLOAD_LEASE = float(os.environ.get("UPLOAD_LEASE", "300"))
+
+
+class UploadBusy(Exception):
+    """Another request is still writing to this upload."""
+
+
+class UploadOffsetMismatch(Exception):
+    """The client's offset is not where the upload stands."""
+
+    def __init__(self, offset: int):
+        super().__init__(f"Upload is at offset {offset}")
+        self.offset = offset
+
+
+@dataclass
+class Upload:
+    id: str
+    interaction_id: str
+    path: str
+    size: int
+    content_type: str
+    offset: int = 0
+    backend_ref: Optional[str] = None
+    url: Optional[str] = None
+    expires_at: float = 0.0
+
+    @property
+    def complete(self) -> bool:
+        return self.url is not None
+
+
+class StorageBackend:
+    """Interface every storage backend implements."""
+
+    # Bytes per write(); with `aligned`, every part but the last is exactly this long.
+    part_size = 1 << 20
+    aligned = False
+
+    async def start(self, upload: Upload) -> Optional[str]:
+        """Prepares a new upload. Returns a reference kept with the upload (e.g. a tus URL)."""
+        raise NotImplementedError
+
+    async def write(self, upload: Upload, offset: int, data: bytes):
+        """Stores data at offset. Parts arrive in order."""
+        raise NotImplementedError
+
+    async def finish(self, upload: Upload) -> str:
+        """
+        Finalises the object once every byte is written and returns its URL.
+        Called again if attaching the recording failed, so it must succeed
+        when the object is already final.
+        """
+        raise NotImplementedError
+
+
+class LocalStorage(StorageBackend):
+    """Objects as files under STORAGE_LOCAL_PATH/<bucket>/."""
+
+    def __init__(self, root: Optional[str] = None, bucket: str = RECORDINGS_BUCKET):
+        self.root = os.path.abspath(root or os.environ.get("STORAGE_LOCAL_PATH", "storage"))
+        self.bucket = bucket
+        # URL prefix the files are served under; file:// paths by default.
+        self.public_base = os.environ.get("STORAGE_PUBLIC_BASE", f"file://{self.root}")
+
+    def _partial(self, upload: Upload) -> str:
+        return os.path.join(self.root, ".uploads", upload.id)
+
+    async def start(self, upload: Upload) -> Optional[str]:
+        def create():
+            partial = self._partial(upload)
+            os.makedirs(os.path.dirname(partial), exist_ok=True)
+            open(partial, "wb").close()
+
+        await asyncio.to_thread(create)
+        return None
+
+    async def write(self, upload: Upload, offset: int, data: bytes):
+        def write():
+            with open(self._partial(upload), "r+b") as f:
+                f.seek(offset)
+                f.write(data)
+                # Don't report the offset as committed before the bytes are on disk.
+                os.fsync(f.fileno())
+
+        await asyncio.to_thread(write)
+
+    async def finish(self, upload: Upload) -> str:
+        def move():
+            target = os.path.join(self.root, self.bucket, upload.path)
+            if os.path.exists(target) and not os.path.exists(self._partial(upload)):
+                return
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(self._partial(upload), target)
+
+        await asyncio.to_thread(move)
+        return f"{self.public_base}/{self.bucket}/{upload.path}"
+
+
+class SupabaseStorage(StorageBackend):
+    """Supabase Storage through its tus endpoint, which takes parts of exactly 6 MiB."""
+
+    part_size = 6 << 20
+    aligned = True
+
+    def __init__(self, bucket: str = RECORDINGS_BUCKET):
+        self.bucket = bucket
+
+    def _base(self) -> str:
+        return f"{os.environ.get('SUPABASE_URL')}/storage/v1"
+
+    @staticmethod
+    def _metadata(**values: str) -> str:
+        return ",".join(f"{key} {base64.b64encode(value.encode()).decode()}" for key, value in values.items())
+
+    async def start(self, upload: Upload) -> Optional[str]:
+        response = await rest.get_client().post(
+            f"{self._base()}/upload/resumable",
+            headers=rest.auth_headers(**{
+                "Tus-Resumable": "1.0.0",
+                "Upload-Length": str(upload.size),
+                "Upload-Metadata": self._metadata(
+                    bucketName=self.bucket, objectName=upload.path, contentType=upload.content_type,
+                ),
+            }),
+        )
+        if response.status_code != 201:
+            raise Exception(f"{response.status_code}: {response.text}")
+        return response.headers["Location"]
+
+    async def write(self, upload: Upload, offset: int, data: bytes):
+        response = await rest.request_with_retry(
+            "PATCH", upload.backend_ref, content=data, timeout=120.0,
+            headers=rest.auth_headers(**{
+                "Tus-Resumable": "1.0.0",
+                "Upload-Offset": str(offset),
+                "Content-Type": "application/offset+octet-stream",
+            }),
+        )
+        if response.status_code != 204:
+            raise Exception(f"{response.status_code}: {response.text}")
+
+    async def finish(self, upload: Upload) -> str:
+        # tus completes the object with its last part; nothing left to do.
+        return f"{self._base()}/object/{self.bucket}/{upload.path}"
+
+
+class SQLiteUploadStore:
+    """Upload state in a local SQLite file (WAL mode), shared by every worker on the host."""
+
+    def __init__(self, path: Optional[str] = None, ttl: float = UPLOAD_TTL):
+        self.path = path or os.environ.get("UPLOAD_STATE_PATH", "uploads.db")
+        self.ttl = ttl
+        with self._connect() as db:
+            db.execute("pragma journal_mode=wal")
+            db.execute("""
+                create table if not exists uploads (
+                    id text primary key,
+                    interaction_id text not null,
+                    path text not null,
+                    size integer not null,
+                    content_type text not null,
+                    "offset" integer not null default 0,
+                    backend_ref text,
+                    url text,
+                    locked_until real,
+                    expires_at real not null
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        # A connection per call keeps this usable from worker threads and other processes.
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def create(self, upload: Upload):
+        upload.expires_at = time.time() + self.ttl
+        with self._connect() as db:
+            db.execute("delete from uploads where expires_at < ? and url is null", (time.time(),))
+            db.execute(
+                """
+                insert into uploads (id, interaction_id, path, size, content_type, backend_ref, expires_at)
+                values (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (upload.id, upload.interaction_id, upload.path, upload.size, upload.content_type,
+                 upload.backend_ref, upload.expires_at),
+            )
+
+    def get(self, upload_id: str) -> Optional[Upload]:
+        with self._connect() as db:
+            row = db.execute(
+                """
+                select id, interaction_id, path, size, content_type, "offset", backend_ref, url, expires_at
+                from uploads where id = ?
+                """,
+                (upload_id,),
+            ).fetchone()
+        if row is None or (row[7] is None and row[8] < time.time()):
+            return None
+        return Upload(*row)
+
+    def claim(self, upload_id: str) -> Optional[Upload]:
+        """Locks the upload for one writer. Raises UploadBusy if another request holds it."""
+        now = time.time()
+        with self._connect() as db:
+            db.execute("begin immediate")
+            try:
+                locked = db.execute("select locked_until from uploads where id = ?", (upload_id,)).fetchone()
+                if locked and locked[0] and locked[0] > now:
+                    raise UploadBusy(f"Upload {upload_id} is being written by another request")
+                db.execute("update uploads set locked_until = ? where id = ?", (now + UPLOAD_LEASE, upload_id))
+                db.execute("commit")
+            except Exception:
+                db.execute("rollback")
+                raise
+        return self.get(upload_id)
+
+    def advance(self, upload_id: str, offset: int):
+        """Records bytes the backend has committed and renews the lease."""
+        with self._connect() as db:
+            db.execute(
+                'update uploads set "offset" = ?, locked_until = ? where id = ?',
+                (offset, time.time() + UPLOAD_LEASE, upload_id),
+            )
+
+    def finish(self, upload_id: str, url: str):
+        with self._connect() as db:
+            db.execute("update uploads set url = ?, locked_until = null where id = ?", (url, upload_id))
+
+    def release(self, upload_id: str):
+        with self._connect() as db:
+            db.execute("update uploads set locked_until = null where id = ?", (upload_id,))
+
+
+_storage: Optional[StorageBackend] = None
+_store: Optional[SQLiteUploadStore] = None
+
+
+def get_storage() -> StorageBackend:
+    global _storage
+    if _storage is None:
+        backend = os.environ.get("STORAGE_BACKEND", "local")
+        if backend == "local":
+            _storage = LocalStorage()
+        elif backend == "supabase":
+            _storage = SupabaseStorage()
+        else:
+            module, _, name = backend.partition(":")
+            _storage = getattr(importlib.import_module(module), name)()
+    return _storage
+
+
+def get_upload_store() -> SQLiteUploadStore:
+    global _store
+    if _store is None:
+        _store = SQLiteUploadStore()
+    return _store
+
+
+async def create_upload(interaction: dict, size: int, content_type: str, extension: str = "") -> Upload:
+    """Opens an upload for an interaction's recording, stored as <lead_id>/<interaction_id>/<upload_id><ext>."""
+    upload_id = uuid.uuid4().hex
+    upload = Upload(
+        id=upload_id,
+        interaction_id=interaction["id"],
+        path=f"{interaction.get('lead_id') or 'unassigned'}/{interaction['id']}/{upload_id}{extension}",
+        size=size,
+        content_type=content_type,
+    )
+    upload.backend_ref = await get_storage().start(upload)
+    await asyncio.to_thread(get_upload_store().create, upload)
+    return upload
+
+
+async def receive(upload_id: str, offset: int, body) -> Upload:
+    """
+    Streams `body` (an async iterator of bytes) into the upload starting at
+    `offset`, committing whole parts as they fill. Finalises the object and
+    sets the interaction's recording_url once the last byte is in.
+    """
+    store, storage = get_upload_store(), get_storage()
+    upload = await asyncio.to_thread(store.claim, upload_id)
+    if upload is None:
+        raise LookupError(f"Unknown upload {upload_id}")
+    try:
+        if upload.complete or offset != upload.offset:
+            raise UploadOffsetMismatch(upload.offset)
+
+        part = bytearray()
+
+        async def flush():
+            nonlocal part
+            await storage.write(upload, upload.offset, bytes(part))
+            upload.offset += len(part)
+            part = bytearray()
+            await asyncio.to_thread(store.advance, upload.id, upload.offset)
+
+        async for data in body:
+            if upload.offset + len(part) + len(data) > upload.size:
+                raise ValueError(f"Body runs past the declared size of {upload.size} bytes")
+            part += data
+            while len(part) >= storage.part_size:
+                rest_of_part = part[storage.part_size:]
+                del part[storage.part_size:]
+                await flush()
+                part = rest_of_part
+        # Aligned backends only take a short part at the end of the file; a
+        # short part mid-file is dropped and the client resends it from the
+        # committed offset. Clients should send multiples of part_size there.
+        if part and (not storage.aligned or upload.offset + len(part) == upload.size):
+            await flush()
+
+        if upload.offset == upload.size:
+            # If attaching fails, the upload stays incomplete with every byte
+            # in; an empty PATCH at its size finishes it.
+            url = await storage.finish(upload)
+            await attach_recording(upload.interaction_id, url)
+            await asyncio.to_thread(store.finish, upload.id, url)
+            upload.url = url
+        return upload
+    finally:
+        # Any request that didn't complete the upload, failed or not, lets go of it.
+        if not upload.complete:
+            await asyncio.to_thread(store.release, upload.id)
+
+
+async def attach_recording(interaction_id: str, url: str):
+    response = await rest.request_with_retry(
+        "PATCH", rest.rest_url("interactions"),
+        params={"id": f"eq.{interaction_id}"},
+        headers=rest.auth_headers(**{"Content-Type": "application/json"}),
+        json={"recording_url": url},
+    )
+    if response.status_code >= 300:
+        raise Exception(f"{response.status_code}: {response.text}")
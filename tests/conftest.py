@@ -0,0 +1,70 @@
+"""
+Shared fixtures. Tests drive main.app in-process (httpx.ASGITransport)
+against the in-memory PostgREST stand-in served on a local port, with every
+SQLite state file in a temporary directory.
+"""
+import os
+import tempfile
+
+STATE_DIR = tempfile.mkdtemp(prefix="zenai-tests-")
+os.environ.update({
+    "SUPABASE_KEY": "test",
+    "LOG_LEVEL": "WARNING",
+    "CACHE_BACKEND": "memory",
+    "ENRICHMENT_QUEUE": "inline",
+    "ENRICHMENT_MOCK_DELAY": "0",
+    "STORAGE_BACKEND": "local",
+    "STORAGE_LOCAL_PATH": os.path.join(STATE_DIR, "storage"),
+    "UPLOAD_STATE_PATH": os.path.join(STATE_DIR, "uploads.db"),
+    "SYNC_SESSION_PATH": os.path.join(STATE_DIR, "sync_sessions.db"),
+    "JOB_QUEUE_PATH": os.path.join(STATE_DIR, "jobs.db"),
+    "CACHE_PATH": os.path.join(STATE_DIR, "cache.db"),
+})
+
+import httpx
+import pytest
+
+import rest
+from cache import stats_cache
+from fake_postgrest import FakePostgREST, serve_in_thread
+from lead_cache import lead_cache
+from main import app
+from pipeline import pipeline_snapshot
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+def upstream():
+    fake = FakePostgREST()
+    server, base_url = serve_in_thread(fake.app)
+    os.environ["SUPABASE_URL"] = base_url
+    yield fake
+    server.should_exit = True
+
+
+@pytest.fixture
+async def fake(upstream):
+    """The stand-in with empty tables, and this process's caches emptied to match."""
+    upstream.reset()
+    lead_cache.clear()
+    lead_cache.checked_at = 0.0
+    pipeline_snapshot.clear()
+    await stats_cache.invalidate()
+    yield upstream
+    # The shared client belongs to this test's event loop.
+    await rest.close_client()
+
+
+def lead(name: str, phone: str, **fields) -> dict:
+    """A lead dict with the fields a test cares about."""
+    return {"name": name, "phone": phone, **fields}
+
+
+@pytest.fixture
+async def api(fake):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://api") as client:
+        yield client
@@ -0,0 +1,61 @@
+import asyncio
+import threading
+
+import pytest
+
+from cache import SQLiteBackend, TTLCache
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def shared(tmp_path):
+    return TTLCache(ttl=60, namespace="test", backend=SQLiteBackend(str(tmp_path / "cache.db")))
+
+
+class Loader:
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        return {"total": self.calls}
+
+
+async def test_values_are_kept_until_invalidated(shared):
+    load = Loader()
+    assert await shared.get_or_load("stats", load) == {"total": 1}
+    assert await shared.get_or_load("stats", load) == {"total": 1}
+    await shared.invalidate("stats")
+    assert await shared.get_or_load("stats", load) == {"total": 2}
+
+
+async def test_blocking_backend_is_invalidated_off_the_event_loop(shared, monkeypatch):
+    threads = []
+    delete_many = shared.backend.delete_many
+
+    def record(names):
+        threads.append(threading.current_thread())
+        delete_many(names)
+
+    monkeypatch.setattr(shared.backend, "delete_many", record)
+    await shared.get_or_load("stats", Loader())
+    await shared.invalidate()
+    assert threads and threads[0] is not threading.main_thread()
+
+
+async def test_load_overtaken_by_a_write_is_not_stored(shared):
+    started, release = asyncio.Event(), asyncio.Event()
+    load = Loader()
+
+    async def slow():
+        started.set()
+        await release.wait()
+        return await load()
+
+    pending = asyncio.ensure_future(shared.get_or_load("stats", slow))
+    await started.wait()
+    await shared.invalidate("stats")
+    release.set()
+    assert await pending == {"total": 1}
+    assert await shared.get_or_load("stats", load) == {"total": 2}
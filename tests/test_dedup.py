@@ -0,0 +1,48 @@
+import uuid
+
+import pytest
+
+from conftest import lead
+from dedup import BlockingIndex, tag_duplicates
+
+pytestmark = pytest.mark.anyio
+
+
+def test_same_batch_duplicates_are_matched_without_ids():
+    rows = [lead("Rahul Sharma", "+91 98765 43210"), lead("rahul  sharma", "9876543210")]
+    index = BlockingIndex()
+    sequence = index.add_many(rows)
+    first, second = index.match(rows, before=sequence)
+    assert first is None
+    assert second is not None and second[1] >= 85
+
+
+def test_a_lead_is_not_offered_the_lead_tagged_as_its_duplicate():
+    a, b = str(uuid.uuid4()), str(uuid.uuid4())
+    index = BlockingIndex()
+    index.add(lead("Rahul Sharma", "9876543210", id=a, meta_data={"possible_duplicate_of": b}))
+    index.add(lead("Rahul Sharma", "9876543210", id=b))
+    assert index.match([lead("Rahul Sharma", "9876543210", id=b)]) == [None]
+
+
+async def test_rows_in_one_sync_point_at_the_earlier_row(fake):
+    rows = [lead("Rahul Sharma", "+91 98765 43210"), lead("Rahul Sharma", "98765-43210"), lead("Meera Nair", "9123456780")]
+    assert await tag_duplicates(rows) == 1
+    assert rows[1]["meta_data"]["possible_duplicate_of"] == rows[0]["id"]
+    assert "meta_data" not in rows[0] and "meta_data" not in rows[2]
+
+
+async def test_sync_tags_a_near_duplicate_of_an_existing_lead(api, fake):
+    await api.post("/sync", json={"leads": [lead("Rahul Sharma", "+91 98765 43210", email="rahul@example.com")]})
+    (existing,) = fake.leads
+
+    result = (await api.post("/sync", json={"leads": [lead("rahul sharma", "9876543210", email="rahul.s@example.com")]})).json()
+    assert (result["new_records"], result["possible_duplicates"]) == (1, 1)
+    (tagged,) = [row for row in fake.leads.values() if row["id"] != existing]
+    assert tagged["meta_data"]["possible_duplicate_of"] == existing
+
+
+async def test_tagged_rows_the_email_constraint_rejects_are_not_counted(api, fake):
+    await api.post("/sync", json={"leads": [lead("Rahul Sharma", "9876543210", email="rahul@example.com")]})
+    result = (await api.post("/sync", json={"leads": [lead("Rahul Sharma", "9876543210", email="rahul@example.com")]})).json()
+    assert (result["new_records"], result["ignored_duplicates"], result["possible_duplicates"]) == (0, 1, 0)
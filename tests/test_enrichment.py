@@ -0,0 +1,81 @@
+import asyncio
+import uuid
+
+import pytest
+from starlette.responses import Response
+
+from conftest import lead
+from enrichment import Batch, EnrichmentPipeline, write_meta_data
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_enrichment_tags_only_one_of_two_leads_synced_together(fake):
+    leads = [lead("Rahul Sharma", "9876543210", id=str(uuid.uuid4()), meta_data={}) for _ in range(2)]
+    fake.leads.update((row["id"], dict(row)) for row in leads)
+    await EnrichmentPipeline(providers=[])._dedupe(Batch(leads))
+    later, earlier = sorted(leads, key=lambda row: row["id"], reverse=True)
+    assert later["meta_data"]["possible_duplicate_of"] == earlier["id"]
+    assert not earlier["meta_data"]
+
+
+async def test_enrichment_leaves_the_target_of_a_sync_tag_alone(fake):
+    low, high = sorted(str(uuid.uuid4()) for _ in range(2))
+    # /sync tagged the smaller id as a duplicate of the larger one.
+    tagged = lead("Rahul Sharma", "9876543210", id=low, meta_data={"possible_duplicate_of": high})
+    target = lead("Rahul Sharma", "9876543210", id=high, meta_data={})
+    fake.leads.update((row["id"], dict(row)) for row in (tagged, target))
+    batch = Batch([tagged, target])
+    await EnrichmentPipeline(providers=[])._dedupe(batch)
+    assert not target["meta_data"]
+    assert not batch.changed
+
+
+def sync_interactions(fake) -> list:
+    return sorted(row["lead_id"] for row in fake.interactions.values() if row["type"] == "Sync")
+
+
+async def test_score_interactions_survive_a_retried_insert(fake, monkeypatch):
+    leads = [lead(f"Lead {i}", f"98765432{i:02d}", id=str(uuid.uuid4()), notes="HNI", meta_data={}) for i in range(3)]
+    fake.leads.update((row["id"], dict(row)) for row in leads)
+    insert, calls = fake._insert, []
+
+    async def gateway_timeout_after_commit(table, request):
+        response = await insert(table, request)
+        if table == "interactions":
+            calls.append(response.status_code)
+            if len(calls) == 1:
+                return Response(status_code=504)
+        return response
+
+    monkeypatch.setattr(fake, "_insert", gateway_timeout_after_commit)
+    summary = await EnrichmentPipeline(providers=[]).run([dict(row) for row in leads])
+    assert summary["failures"] == []
+    assert len(calls) == 2
+    assert sync_interactions(fake) == sorted(row["id"] for row in leads)
+
+    # A redelivered job writes the same interactions again, which adds nothing.
+    await EnrichmentPipeline(providers=[]).run([dict(row) for row in leads])
+    assert sync_interactions(fake) == sorted(row["id"] for row in leads)
+
+
+async def test_meta_data_write_keeps_changes_made_elsewhere(fake):
+    ours = lead("Rahul Sharma", "9876543210", id=str(uuid.uuid4()), meta_data={})
+    fake.leads[ours["id"]] = dict(ours, meta_data={})
+    # Renamed and annotated after the pipeline read it; another provider's data is already there.
+    fake.leads[ours["id"]].update(name="Rahul S.", meta_data={"owner": "asha", "enrichment": {"crm": {"tier": "gold"}}})
+    ours["meta_data"] = {"possible_duplicate_of": str(uuid.uuid4()), "enrichment": {"mock": {"company": "Acme"}}}
+    await write_meta_data([ours], asyncio.Lock())
+    stored = fake.leads[ours["id"]]
+    assert stored["name"] == "Rahul S."
+    assert stored["meta_data"] == {
+        "owner": "asha",
+        "possible_duplicate_of": ours["meta_data"]["possible_duplicate_of"],
+        "enrichment": {"crm": {"tier": "gold"}, "mock": {"company": "Acme"}},
+    }
+
+
+async def test_meta_data_write_skips_deleted_leads(fake):
+    gone = lead("Rahul Sharma", "9876543210", id=str(uuid.uuid4()), meta_data={"enrichment": {"mock": {}}})
+    await write_meta_data([gone], asyncio.Lock())
+    assert gone["id"] not in fake.leads
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from events import EventBroker
+
+
+def drain(subscriber) -> list:
+    """(id, type, data) of each queued event; ids are "<epoch>-<n>" and n is returned."""
+    events = []
+    while not subscriber.queue.empty():
+        fields = dict(line.split(": ", 1) for line in subscriber.queue.get_nowait().decode().strip().split("\n"))
+        epoch, _, number = fields["id"].partition("-")
+        events.append((int(number), fields["event"], json.loads(fields["data"])))
+    return events
+
+
+@pytest.fixture
+def broker():
+    broker = EventBroker(buffer=10, replay=3)
+    for n in range(5):
+        broker.publish("lead.created" if n % 2 else "stats.changed", {"n": n})
+    return broker
+
+
+def test_reconnect_replays_the_events_after_last_event_id(broker):
+    events = drain(broker.subscribe(last_event_id=f"{broker.epoch}-3"))
+    assert [(event_id, data["n"]) for event_id, _, data in events] == [(4, 3), (5, 4)]
+
+
+def test_replay_keeps_to_the_requested_types(broker):
+    events = drain(broker.subscribe({"lead.created"}, last_event_id=f"{broker.epoch}-2"))
+    assert [event_type for _, event_type, _ in events] == ["lead.created"]
+
+
+def test_client_up_to_date_gets_nothing(broker):
+    assert drain(broker.subscribe(last_event_id=f"{broker.epoch}-5")) == []
+
+
+def test_client_behind_the_replay_buffer_is_told_to_resync(broker):
+    assert drain(broker.subscribe(last_event_id=f"{broker.epoch}-1")) == [(5, "resync", {"reason": "missed events"})]
+
+
+def test_client_ahead_of_this_process_is_told_to_resync(broker):
+    assert drain(broker.subscribe(last_event_id=f"{broker.epoch}-40")) == [(5, "resync", {"reason": "unknown event id"})]
+
+
+@pytest.mark.parametrize("last_event_id", ["3", "0badcafe-3", "garbage"])
+def test_id_from_another_process_is_told_to_resync(broker, last_event_id):
+    # The server restarted, or the client was connected to another worker.
+    # Its counter has passed the client's, but those events are unrelated.
+    assert drain(broker.subscribe(last_event_id=last_event_id)) == [(5, "resync", {"reason": "unknown event id"})]
+
+
+def test_resync_carries_an_id_this_process_can_replay_from(broker):
+    drain(broker.subscribe(last_event_id="0badcafe-3"))
+    broker.publish("lead.created", {"n": 5})
+    assert drain(broker.subscribe(last_event_id=f"{broker.epoch}-5")) == [(6, "lead.created", {"n": 5})]
+
+
+def test_slow_consumer_backlog_is_replaced_by_one_resync():
+    broker = EventBroker(buffer=2)
+    subscriber = broker.subscribe()
+    for n in range(3):
+        broker.publish("lead.created", {"n": n})
+    assert drain(subscriber) == [(3, "resync", {"reason": "slow consumer"})]
+    assert subscriber.dropped == 1
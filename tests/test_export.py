@@ -0,0 +1,42 @@
+import csv
+import io
+import json
+
+import pytest
+
+import main
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_ndjson_export_streams_every_lead_across_pages(api, fake, monkeypatch):
+    monkeypatch.setattr(main, "EXPORT_PAGE_SIZE", 2)
+    fake.seed(5, interactions_per_lead=0)
+    response = await api.get("/leads/export")
+    assert response.headers["content-type"] == "application/x-ndjson"
+    leads = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(lead["id"] for lead in leads) == sorted(fake.leads)
+    assert all(lead["created_at"].endswith(" IST") for lead in leads)
+
+
+async def test_csv_export_has_a_header_and_the_requested_columns(api, fake, monkeypatch):
+    monkeypatch.setattr(main, "EXPORT_PAGE_SIZE", 2)
+    fake.seed(3, interactions_per_lead=0)
+    response = await api.get("/leads/export", params={"format": "csv", "fields": "name,meta_data"})
+    assert response.headers["content-type"].startswith("text/csv")
+    header, *rows = csv.reader(io.StringIO(response.text))
+    assert header == ["name", "meta_data", "created_at", "id"]
+    by_id = {row[3]: row for row in rows}
+    assert sorted(by_id) == sorted(fake.leads)
+    for lead_id, (name, meta_data, created_at, _) in by_id.items():
+        assert name == fake.leads[lead_id]["name"]
+        assert json.loads(meta_data) == fake.leads[lead_id]["meta_data"]
+        assert created_at.endswith(" IST")
+
+
+@pytest.mark.parametrize("params, error", [
+    ({"format": "xml"}, "format must be ndjson or csv"),
+    ({"fields": "password"}, "Unknown fields: password"),
+])
+async def test_bad_export_parameters_are_reported(api, fake, params, error):
+    assert (await api.get("/leads/export", params=params)).json() == {"error": error}
@@ -0,0 +1,77 @@
+import pytest
+
+import jobs
+from jobs import SQLiteJobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteJobQueue(str(tmp_path / "jobs.db"))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """jobs.time.time(), moved by hand."""
+    class Clock:
+        now = 1_000_000.0
+
+        def time(self):
+            return self.now
+
+    clock = Clock()
+    monkeypatch.setattr(jobs.time, "time", clock.time)
+    return clock
+
+
+def test_a_leased_job_is_hidden_from_other_workers(queue, clock):
+    queue.enqueue(["a", "b", "c"])
+    first = queue.lease(2, visibility_timeout=60)
+    assert [job.payload for job in first] == ["a", "b"]
+    assert [job.attempts for job in first] == [1, 1]
+    assert [job.payload for job in queue.lease(10, visibility_timeout=60)] == ["c"]
+    assert queue.lease(10, visibility_timeout=60) == []
+
+
+def test_acked_jobs_are_gone(queue, clock):
+    queue.enqueue(["a"])
+    (job,) = queue.lease(1, visibility_timeout=60)
+    queue.ack([job.id])
+    clock.now += 120
+    assert queue.lease(1, visibility_timeout=60) == []
+
+
+def test_a_job_is_redelivered_after_its_visibility_timeout(queue, clock):
+    queue.enqueue(["a"])
+    (job,) = queue.lease(1, visibility_timeout=60)
+    clock.now += 59
+    assert queue.lease(1, visibility_timeout=60) == []
+    clock.now += 2
+    (again,) = queue.lease(1, visibility_timeout=60)
+    assert (again.id, again.attempts) == (job.id, 2)
+
+
+def test_failed_jobs_retry_after_the_delay_then_go_dead(queue, clock, monkeypatch):
+    monkeypatch.setattr(jobs, "MAX_ATTEMPTS", 2)
+    queue.enqueue(["a"])
+    (job,) = queue.lease(1, visibility_timeout=60)
+    queue.fail([job.id], "boom", retry_delay=30)
+    assert queue.lease(1, visibility_timeout=60) == []
+    clock.now += 31
+    (job,) = queue.lease(1, visibility_timeout=60)
+    queue.fail([job.id], "boom again", retry_delay=30)
+    clock.now += 31
+    assert queue.lease(1, visibility_timeout=60) == []
+    assert queue.stats()["dead"] == 1
+
+
+def test_stats_report_depth_in_flight_delayed_dead_and_lag(queue, clock, monkeypatch):
+    queue.enqueue(["leased", "failing", "dying"])
+    _, failing, dying = queue.lease(3, visibility_timeout=60)
+    queue.fail([failing.id], "boom", retry_delay=30)
+    monkeypatch.setattr(jobs, "MAX_ATTEMPTS", 1)
+    queue.fail([dying.id], "boom")
+    clock.now += 10
+    queue.enqueue(["ready"])
+    assert queue.stats() == {
+        "backend": "sqlite", "depth": 1, "in_flight": 1, "delayed": 1, "dead": 1, "lag_seconds": 10.0,
+    }
@@ -0,0 +1,111 @@
+import uuid
+
+import pytest
+
+from lead_cache import LeadCache
+
+pytestmark = pytest.mark.anyio
+
+
+def add_lead(fake, n: int, status: str = "New", updated_at: str = "") -> dict:
+    created = f"2026-01-01T00:00:{n:02d}+00:00"
+    row = {"id": str(uuid.uuid4()), "name": f"Lead {n}", "status": status,
+           "created_at": created, "updated_at": updated_at or created}
+    fake.leads[row["id"]] = row
+    return dict(row)
+
+
+class Loader:
+    """Serves a fixed page and counts how often it is asked."""
+
+    def __init__(self, rows: list, next_cursor=None):
+        self.rows, self.next_cursor, self.calls = rows, next_cursor, 0
+
+    async def __call__(self):
+        self.calls += 1
+        return [dict(row) for row in self.rows], self.next_cursor
+
+
+@pytest.fixture
+def cache():
+    # check_interval=0: every read runs the updated_at check.
+    return LeadCache(ttl=60, check_interval=0, overlap=5, refresh_limit=3)
+
+
+async def test_pages_are_served_from_the_cache(fake, cache):
+    rows = [add_lead(fake, 2), add_lead(fake, 1)]
+    load = Loader(rows)
+    for _ in range(2):
+        page, _ = await cache.page((), 10, None, load)
+        assert [row["id"] for row in page] == [row["id"] for row in rows]
+    assert load.calls == 1
+
+
+async def test_an_insert_is_merged_into_first_pages(fake, cache):
+    older = add_lead(fake, 1)
+    load = Loader([older])
+    await cache.page((), 1, None, load)
+    newer = add_lead(fake, 2)
+    cache.write([newer], inserted=True)
+    page, next_cursor = await cache.page((), 1, None, load)
+    assert [row["id"] for row in page] == [newer["id"]]
+    assert next_cursor is not None
+    assert load.calls == 1
+
+
+async def test_a_status_change_drops_the_status_pages(fake, cache):
+    lead = add_lead(fake, 1)
+    everything, new_column = Loader([lead]), Loader([lead])
+    await cache.page((), 10, None, everything)
+    await cache.page(("status.eq.New",), 10, None, new_column)
+    cache.set_status([lead["id"]], "Contacted")
+    (row,), _ = await cache.page((), 10, None, everything)
+    assert row["status"] == "Contacted"
+    assert everything.calls == 1
+    await cache.page(("status.eq.New",), 10, None, new_column)
+    assert new_column.calls == 2
+
+
+async def test_a_load_overtaken_by_a_write_is_not_stored(fake, cache):
+    lead = add_lead(fake, 1)
+
+    async def load_then_write():
+        cache.set_status([lead["id"]], "Lost")
+        return [dict(lead)], None
+
+    await cache.page((), 10, None, load_then_write)
+    assert not cache.pages
+
+
+async def test_writes_made_elsewhere_are_found_by_updated_at(fake, cache):
+    lead = add_lead(fake, 1, updated_at="2026-01-01T00:01:00+00:00")
+    load = Loader([lead])
+    await cache.page((), 10, None, load)
+    assert cache.high_water == "2026-01-01T00:01:00+00:00"
+
+    # Another worker renames the lead; the next read sees it without reloading the page.
+    fake.leads[lead["id"]].update(name="Renamed", updated_at="2026-01-01T00:02:00+00:00")
+    (row,), _ = await cache.page((), 10, None, load)
+    assert row["name"] == "Renamed"
+    assert cache.high_water == "2026-01-01T00:02:00+00:00"
+    assert load.calls == 1
+
+
+async def test_rows_reread_inside_the_overlap_are_not_applied_twice(fake, cache):
+    lead = add_lead(fake, 1, updated_at="2026-01-01T00:01:00+00:00")
+    await cache.ensure_fresh()
+    fake.leads[lead["id"]].update(name="Renamed", updated_at="2026-01-01T00:01:02+00:00")
+    await cache.ensure_fresh()
+    await cache.ensure_fresh()
+    assert cache.refreshed == 1
+
+
+async def test_too_many_changes_elsewhere_empty_the_cache(fake, cache):
+    lead = add_lead(fake, 1)
+    load = Loader([lead])
+    await cache.page((), 10, None, load)
+    for n in range(2, 6):
+        add_lead(fake, n, updated_at=f"2026-01-01T00:10:{n:02d}+00:00")
+    await cache.page((), 10, None, load)
+    assert load.calls == 2
+    assert cache.refreshed == 0
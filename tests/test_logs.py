@@ -0,0 +1,34 @@
+import logging
+
+import pytest
+
+import logs
+
+
+@pytest.fixture
+def never_sampled(monkeypatch):
+    monkeypatch.setattr(logs, "LOG_SAMPLE_RATE", 0.0)
+
+
+@pytest.mark.parametrize("level", [logging.WARNING, logging.ERROR])
+def test_warnings_and_errors_are_always_logged(never_sampled, caplog, level):
+    with caplog.at_level(logging.DEBUG, logger="tests.logs"):
+        logs.log_sampled(logging.getLogger("tests.logs"), level, "insert rejected: %s", "409")
+    assert [record.getMessage() for record in caplog.records] == ["insert rejected: 409"]
+
+
+@pytest.mark.parametrize("level", [logging.DEBUG, logging.INFO])
+def test_debug_and_info_are_sampled(never_sampled, caplog, level):
+    with caplog.at_level(logging.DEBUG, logger="tests.logs"):
+        logs.log_sampled(logging.getLogger("tests.logs"), level, "duplicate conflict")
+    assert not caplog.records
+
+
+def test_disabled_levels_skip_formatting(caplog):
+    class Unformattable:
+        def __str__(self):
+            raise AssertionError("formatted a message that was never logged")
+
+    with caplog.at_level(logging.ERROR, logger="tests.logs"):
+        logs.log_sampled(logging.getLogger("tests.logs"), logging.WARNING, "%s", Unformattable())
+    assert not caplog.records
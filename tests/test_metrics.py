@@ -0,0 +1,18 @@
+import pytest
+
+from metrics import upstream_target
+
+
+@pytest.mark.parametrize("path, target", [
+    ("/rest/v1/leads", "leads"),
+    ("/rest/v1/leads/123", "leads"),
+    ("/rest/v1/rpc/lead_status_counts", "rpc/lead_status_counts"),
+    ("/storage/v1/upload/resumable", "storage/v1/upload/resumable"),
+    ("/storage/v1/upload/resumable/dXBsb2FkLWlk", "storage/v1/upload/resumable"),
+    ("/storage/v1/object/recordings/2024/02/call.mp3", "storage/v1/object"),
+    ("/auth/v1/token", "other"),
+    ("/rest/v1/", "other"),
+    ("/rest/v1/leads%3Bdrop", "other"),
+])
+def test_upstream_targets_are_bounded_templates(path, target):
+    assert upstream_target(path) == target
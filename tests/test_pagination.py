@@ -0,0 +1,60 @@
+import pytest
+
+from pagination import decode_cursor, encode_cursor, keyset_condition
+
+pytestmark = pytest.mark.anyio
+
+
+def test_cursor_round_trip():
+    row = {"created_at": "2026-01-02T03:04:05.000000+00:00", "id": "b7d0c1a2-0000-4000-8000-000000000001"}
+    assert decode_cursor(encode_cursor(row)) == [row["created_at"], row["id"]]
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", encode_cursor({"created_at": "x"}, keys=("created_at",))])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor)
+
+
+def test_keyset_condition_breaks_ties_on_id():
+    cursor = encode_cursor({"created_at": "2026-01-02", "id": "abc"})
+    assert keyset_condition(cursor) == 'or(created_at.lt."2026-01-02",and(created_at.eq."2026-01-02",id.lt."abc"))'
+
+
+async def walk(api, limit: int, **params) -> list:
+    pages, cursor = [], None
+    while True:
+        response = await api.get("/leads", params={"limit": limit, **params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200, response.text
+        pages.append(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return pages
+
+
+async def test_leads_pages_cover_every_lead_once_newest_first(api, fake):
+    fake.seed(25, interactions_per_lead=0)
+    pages = await walk(api, 10)
+    assert [len(page) for page in pages] == [10, 10, 5]
+    expected = sorted(fake.leads.values(), key=lambda lead: (lead["created_at"], lead["id"]), reverse=True)
+    assert [lead["id"] for page in pages for lead in page] == [lead["id"] for lead in expected]
+
+
+async def test_leads_created_together_are_split_by_id(api, fake):
+    fake.seed(12, interactions_per_lead=0)
+    for lead in fake.leads.values():
+        lead["created_at"] = "2026-01-01T00:00:00.000000+00:00"
+    pages = await walk(api, 5)
+    ids = [lead["id"] for page in pages for lead in page]
+    assert ids == sorted(fake.leads, reverse=True)
+
+
+async def test_fields_projects_the_page(api, fake):
+    fake.seed(3, interactions_per_lead=0)
+    leads = (await api.get("/leads", params={"fields": "name"})).json()
+    assert len(leads) == 3
+    assert all("name" in lead and "id" in lead and "email" not in lead for lead in leads)
+
+
+async def test_bad_cursor_is_reported(api, fake):
+    assert (await api.get("/leads", params={"cursor": "garbage"})).json() == {"error": "Invalid cursor"}
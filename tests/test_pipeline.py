@@ -0,0 +1,38 @@
+import uuid
+
+import pytest
+
+from pipeline import PipelineSnapshot
+
+pytestmark = pytest.mark.anyio
+
+
+def add_leads(fake, count: int) -> list:
+    ids = [str(uuid.uuid4()) for _ in range(count)]
+    for n, lead_id in enumerate(ids):
+        created = f"2026-01-01T00:00:{n:02d}+00:00"
+        fake.leads[lead_id] = {"id": lead_id, "name": f"Lead {n}", "status": "New", "created_at": created, "updated_at": created}
+    return ids
+
+
+async def test_an_oversized_table_is_not_read_on_reload(fake, monkeypatch):
+    ids = add_leads(fake, 3)
+    snapshot = PipelineSnapshot(ttl=0, max_leads=2)
+    fetch_all, full_reads = snapshot._fetch_all, []
+
+    async def counted():
+        full_reads.append(1)
+        return await fetch_all()
+
+    monkeypatch.setattr(snapshot, "_fetch_all", counted)
+    assert not await snapshot.ensure_fresh()
+    assert snapshot.oversized
+    await snapshot._reload()
+    assert full_reads == []
+
+    # Once the table fits again, the next reload loads it.
+    del fake.leads[ids[0]]
+    await snapshot._reload()
+    assert full_reads == [1]
+    assert not snapshot.oversized
+    assert set(snapshot.leads) == set(ids[1:])
@@ -0,0 +1,56 @@
+import scoring
+from scoring import ScoringEngine
+
+RULES = [
+    {"name": "has_email", "type": "present", "field": "email", "weight": 10},
+    {"name": "intent", "type": "keywords", "field": "notes", "keywords": ["hni", "portfolio", "immediate"], "weight": 30},
+    {"name": "sip_plan", "type": "pattern", "field": "notes", "pattern": r"sip\s+\w+", "weight": 5},
+    {"name": "finance_role", "type": "pattern", "field": "role", "pattern": r"\bfinance\b|cfo", "weight": 15},
+    {"name": "cxo", "type": "pattern", "field": "role", "pattern": r"^c[efo]o\b", "weight": 20},
+    {"name": "metro", "type": "equals", "field": "meta_data.location", "values": ["Mumbai", "Delhi"], "weight": 5},
+]
+
+LEADS = [
+    {"email": "a@example.com", "notes": "HNI, wants a portfolio review", "role": "CFO", "meta_data": {"location": "mumbai"}},
+    {"notes": "started a monthly sip", "role": "Head of Finance"},
+    {"notes": "plan later", "role": "engineer", "meta_data": {"location": "Pune"}},
+    {"notes": "sip   100k immediate", "role": None},
+    {},
+]
+
+
+def test_rules_add_their_weight_once_per_lead():
+    results = ScoringEngine(RULES).score_batch(LEADS)
+    assert [result.score for result in results] == [10 + 30 + 15 + 20 + 5, 15, 0, 30 + 5, 0]
+    assert results[0].contributions == {"has_email": 10, "intent": 30, "finance_role": 15, "cxo": 20, "metro": 5}
+
+
+def test_patterns_do_not_match_across_leads():
+    # "sip" ends one lead's notes and "plan" starts the next one's.
+    results = ScoringEngine(RULES).score_batch(LEADS[1:3])
+    assert "sip_plan" not in results[0].contributions
+    assert "sip_plan" not in results[1].contributions
+
+
+def test_keyword_fast_path_agrees_with_the_word_index(monkeypatch):
+    fast = ScoringEngine(RULES).score_batch(LEADS)
+    monkeypatch.setattr(scoring, "FAST_PATH_KEYWORDS", 0)
+    combined = ScoringEngine(RULES).score_batch(LEADS)
+    assert [result.contributions for result in combined] == [result.contributions for result in fast]
+
+
+def test_word_index_matches_keywords_anywhere_in_the_text(monkeypatch):
+    monkeypatch.setattr(scoring, "FAST_PATH_KEYWORDS", 0)
+    keywords = ["fund", "nd eq", "mutual fund", "tax  saver", " gold", "new york city", "sip"]
+    rules = [{"name": keyword, "type": "keywords", "field": "notes", "keywords": [keyword], "weight": 1} for keyword in keywords]
+    notes = ["Mutual funds", "refund equity", "tax  saver bonds", "tax saver", "buys gold", "gold",
+             "moved to new york city", "new york", "  mutual  fund ", "gossip\nplan", "", None]
+    results = ScoringEngine(rules).score_batch([{"notes": note} for note in notes])
+    for note, result in zip(notes, results):
+        text = (note or "").lower().replace("\n", " ")
+        assert set(result.contributions) == {keyword for keyword in keywords if keyword in text}, note
+
+
+def test_score_of_one_lead_matches_the_batch():
+    engine = ScoringEngine(RULES)
+    assert [engine.score(lead) for lead in LEADS] == engine.score_batch(LEADS)
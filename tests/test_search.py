@@ -0,0 +1,46 @@
+import pytest
+
+from search import SEARCH_MIN_SCORE
+
+pytestmark = pytest.mark.anyio
+
+
+def add(fake, name: str, **fields):
+    row = fake._defaults("leads", "2026-01-01T00:00:00.000000+00:00")
+    row.update(name=name, **fields)
+    fake.leads[row["id"]] = row
+
+
+async def test_candidates_under_the_min_score_are_dropped(api, fake):
+    fake.seed(20, interactions_per_lead=0)
+    add(fake, "Priya Menon")
+    add(fake, "Vikram Iyer", company="Priya Traders")
+    # The stand-in's fuzzy lookup hands back every lead as a candidate.
+    assert len(fake.rpc_search_leads("priya")) == 22
+    results = (await api.get("/leads/search", params={"q": "priya", "limit": 50})).json()
+    assert sorted(lead["name"] for lead in results) == ["Priya Menon", "Vikram Iyer"]
+    assert all(lead["score"] >= SEARCH_MIN_SCORE for lead in results)
+    assert results[0]["name"] == "Priya Menon"
+
+
+async def test_search_pages_cover_every_match_once_best_first(api, fake):
+    fake.seed(12, interactions_per_lead=0)
+    everything = (await api.get("/leads/search", params={"q": "seed lead", "limit": 50})).json()
+    assert len(everything) == 12
+    pages, cursor = [], None
+    while True:
+        response = await api.get("/leads/search", params={"q": "seed lead", "limit": 5, **({"cursor": cursor} if cursor else {})})
+        pages.append(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert [len(page) for page in pages] == [5, 5, 2]
+    assert [lead["id"] for page in pages for lead in page] == [lead["id"] for lead in everything]
+    scores = [lead["score"] for lead in everything]
+    assert scores == sorted(scores, reverse=True)
+
+
+async def test_fields_projects_search_results(api, fake):
+    add(fake, "Priya Menon", email="priya@example.com")
+    [result] = (await api.get("/leads/search", params={"q": "priya", "fields": "name"})).json()
+    assert set(result) == {"name", "created_at", "id", "score"}
@@ -0,0 +1,104 @@
+import uuid
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+import main
+import rest
+from models import SyncRequest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def declared():
+    """/sync as FastAPI validates a declared body, the errors clients were written against."""
+    baseline = FastAPI()
+
+    @baseline.post("/sync")
+    def sync(request: SyncRequest):
+        return {}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=baseline), base_url="http://baseline") as client:
+        yield client
+
+
+@pytest.mark.parametrize("body", [
+    b'{"leads": [{"name": "Rahul", "email": "not an email"}]}',
+    b'{"leads": [{"phone": "9876543210"}, {"name": "Priya", "status": 3}]}',
+    b'{"leads": "none"}',
+    b'{"leads": [{"name": "Rahul",}]}',
+    b'{"leads": [',
+    b'',
+])
+async def test_sync_validation_errors_match_a_declared_body(api, declared, body):
+    headers = {"Content-Type": "application/json"}
+    response = await api.post("/sync", content=body, headers=headers)
+    expected = await declared.post("/sync", content=body, headers=headers)
+    assert response.status_code == expected.status_code == 422
+    assert response.json() == expected.json()
+
+
+@pytest.fixture
+def inserts(fake, monkeypatch) -> list:
+    """(params, row count, status) of every leads insert the stand-in receives."""
+    insert, calls = fake._insert, []
+
+    async def recorded(table, request):
+        response = await insert(table, request)
+        if table == "leads":
+            body = await request.json()
+            calls.append((dict(request.query_params), len(body) if isinstance(body, list) else 1, response.status_code))
+        return response
+
+    monkeypatch.setattr(fake, "_insert", recorded)
+    return calls
+
+
+async def test_sync_inserts_the_batch_in_one_request_ignoring_duplicate_emails(api, fake, inserts):
+    await api.post("/sync", json={"leads": [{"name": "Asha Rao", "email": "asha@example.com"}]})
+    inserts.clear()
+    leads = [
+        {"name": "Asha R.", "email": "asha@example.com"},
+        {"name": "Vikram Iyer", "email": "vikram@example.com"},
+        {"name": "Vikram I.", "email": "vikram@example.com"},
+        {"name": "Meera Nair"},
+    ]
+    result = (await api.post("/sync", json={"leads": leads})).json()
+    assert (result["new_records"], result["ignored_duplicates"]) == (2, 2)
+    [(params, rows, status)] = inserts
+    assert (params["on_conflict"], rows, status) == ("email", 4, 201)
+    assert sorted(lead["name"] for lead in fake.leads.values()) == ["Asha Rao", "Meera Nair", "Vikram Iyer"]
+
+
+async def test_sync_falls_back_to_row_by_row_when_the_batch_is_rejected(api, fake, inserts):
+    taken = str(uuid.uuid4())
+    fake.leads[taken] = {"id": taken, "name": "Already Here"}
+    leads = [
+        {"name": "Asha Rao", "email": "asha@example.com"},
+        {"id": taken, "name": "Clashing Id"},
+        {"name": "Vikram Iyer"},
+    ]
+    result = (await api.post("/sync", json={"leads": leads})).json()
+    assert (result["new_records"], result["ignored_duplicates"]) == (2, 1)
+    assert [(rows, status) for _, rows, status in inserts] == [(3, 409), (1, 201), (1, 409), (1, 201)]
+    assert fake.leads[taken]["name"] == "Already Here"
+    assert sorted(lead["name"] for lead in fake.leads.values()) == ["Already Here", "Asha Rao", "Vikram Iyer"]
+
+
+async def test_chunks_report_exactly_what_they_committed(fake):
+    taken = str(uuid.uuid4())
+    fake.leads[taken] = {"id": taken, "name": "Already Here"}
+    rows = [{"id": str(uuid.uuid4()), "name": f"Lead {i}", "email": f"lead{i % 3}@example.com"} for i in range(4)]
+    rows.append({"id": taken, "name": "Clashing Id"})
+    chunks = []
+
+    async def on_chunk(committed_ids, saved, skipped):
+        chunks.append((committed_ids, len(saved), skipped))
+
+    headers = rest.auth_headers(**{"Content-Type": "application/json", "Prefer": "return=representation"})
+    saved, skipped = await main.insert_leads_batched(rest.get_client(), rest.rest_url("leads"), headers, rows, 2, on_chunk)
+    assert (len(saved), skipped) == (3, 2)
+    # Bulk chunks commit every row sent, duplicates included; a row-by-row chunk only what it inserted.
+    assert chunks == [([rows[0]["id"], rows[1]["id"]], 2, 0), ([rows[2]["id"], rows[3]["id"]], 1, 1), ([], 0, 1)]
@@ -0,0 +1,70 @@
+import uuid
+
+import pytest
+
+import main
+from sessions import get_session_store, request_hash
+
+pytestmark = pytest.mark.anyio
+
+LEADS = [{"name": f"Session Lead {i}", "email": f"session{i}@example.com", "phone": f"90000000{i:02d}"} for i in range(5)]
+
+
+def sync(api, key: str, leads: list):
+    return api.post("/sync", json={"leads": leads}, headers={"Idempotency-Key": key})
+
+
+async def test_identical_retry_is_replayed_without_touching_the_database(api, fake):
+    key = str(uuid.uuid4())
+    first = await sync(api, key, LEADS)
+    assert first.json()["new_records"] == 5
+    before = fake.requests
+
+    again = await sync(api, key, LEADS)
+    assert again.headers["Idempotent-Replayed"] == "true"
+    assert again.json() == first.json()
+    assert fake.requests == before
+    assert len(fake.leads) == 5
+
+
+async def test_interrupted_sync_resumes_with_only_the_uncommitted_leads(api, fake, monkeypatch):
+    key = str(uuid.uuid4())
+    insert = main.insert_leads_batched
+
+    async def dropped_after_first_chunk(client, url, headers, rows, batch_size=2, on_chunk=None):
+        async def commit_then_fail(*args):
+            await on_chunk(*args)
+            raise ConnectionError("connection reset")
+        return await insert(client, url, headers, rows, 2, commit_then_fail)
+
+    monkeypatch.setattr(main, "insert_leads_batched", dropped_after_first_chunk)
+    with pytest.raises(ConnectionError):
+        await sync(api, key, LEADS)
+    assert len(fake.leads) == 2
+    monkeypatch.undo()
+
+    session = (await api.get(f"/sync/sessions/{key}")).json()
+    assert (session["complete"], len(session["committed_lead_ids"])) == (False, 2)
+
+    result = (await sync(api, key, LEADS)).json()
+    assert (result["new_records"], result["already_committed"]) == (5, 2)
+    assert sorted(lead["email"] for lead in fake.leads.values()) == sorted(lead["email"] for lead in LEADS)
+    assert (await api.get(f"/sync/sessions/{key}")).json()["complete"] is True
+
+
+async def test_client_may_resend_only_the_remainder(api, fake):
+    key = str(uuid.uuid4())
+    await sync(api, key, LEADS[:3])
+    result = (await sync(api, key, LEADS[3:])).json()
+    # Counts cover the whole session.
+    assert (result["new_records"], result["already_committed"]) == (5, 0)
+    assert len(fake.leads) == 5
+
+
+async def test_session_held_by_another_request_is_busy(api, fake):
+    key = str(uuid.uuid4())
+    get_session_store().claim(key, request_hash(b"other attempt"))
+    response = await sync(api, key, LEADS)
+    assert response.status_code == 409
+    assert "still in progress" in response.json()["error"]
+    assert not fake.leads
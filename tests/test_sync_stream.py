@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+import main
+
+pytestmark = pytest.mark.anyio
+
+
+def ndjson(*items) -> bytes:
+    return b"\n".join(item if isinstance(item, bytes) else json.dumps(item).encode() for item in items) + b"\n"
+
+
+async def test_invalid_lines_are_skipped_and_reported_by_line_number(api, fake):
+    body = ndjson(
+        {"name": "Asha Rao", "email": "asha@example.com"},
+        b"{not json",
+        {"email": "nameless@example.com"},
+        b"",
+        {"name": "Vikram Iyer", "email": "vikram@example.com"},
+    )
+    result = (await api.post("/sync/stream", content=body, headers={"Content-Type": "application/x-ndjson"})).json()
+    assert result["status"] == "success"
+    assert (result["new_records"], result["invalid_records"]) == (2, 2)
+    assert [error["line"] for error in result["errors"]] == [2, 3]
+    assert result["errors"][1]["errors"][0]["loc"] == ["name"]
+    assert sorted(lead["name"] for lead in fake.leads.values()) == ["Asha Rao", "Vikram Iyer"]
+
+
+async def test_reported_errors_are_capped(api, fake):
+    body = ndjson(*[b"[]"] * (main.MAX_REPORTED_ERRORS + 5), {"name": "Asha Rao"})
+    result = (await api.post("/sync/stream", content=body)).json()
+    assert result["invalid_records"] == main.MAX_REPORTED_ERRORS + 5
+    assert len(result["errors"]) == main.MAX_REPORTED_ERRORS
+    assert result["new_records"] == 1
+
+
+async def test_saves_in_chunks_and_counts_email_duplicates(api, fake, monkeypatch):
+    monkeypatch.setattr(main, "SYNC_BATCH_SIZE", 3)
+    leads = [{"name": f"Lead {i}", "email": f"lead{i % 5}@example.com"} for i in range(8)]
+    result = (await api.post("/sync/stream", content=ndjson(*leads))).json()
+    assert (result["new_records"], result["ignored_duplicates"], result["invalid_records"]) == (5, 3, 0)
+    assert len(fake.leads) == 5
+
+
+async def test_overlong_line_stops_the_stream_and_keeps_what_was_saved(api, fake, monkeypatch):
+    monkeypatch.setattr(main, "MAX_NDJSON_LINE", 64)
+    monkeypatch.setattr(main, "SYNC_BATCH_SIZE", 1)
+
+    async def body():
+        yield ndjson({"name": "Asha Rao"})
+        yield b'{"name": "' + b"x" * 200
+
+    result = (await api.post("/sync/stream", content=body())).json()
+    assert result["error"] == "Line 2 is longer than 64 bytes"
+    assert result["new_records"] == 1
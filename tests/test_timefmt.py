@@ -0,0 +1,22 @@
+import pytest
+
+from timefmt import _convert, to_ist_many
+
+
+@pytest.mark.parametrize("utc, ist", [
+    ("2024-02-14T12:00:00.123456+00:00", "2024-02-14 17:30:00 IST"),
+    ("2024-02-14T12:00:00+00:00", "2024-02-14 17:30:00 IST"),
+    ("2024-02-14T12:00:00Z", "2024-02-14 17:30:00 IST"),
+    ("2024-02-14T20:45:00.5Z", "2024-02-15 02:15:00 IST"),
+    # No seconds: must not take the fast path's fixed-width cut.
+    ("2024-02-14T12:00+00:00", "2024-02-14 17:30:00 IST"),
+    ("2024-02-14T12:00:00+05:30", "2024-02-14 12:00:00 IST"),
+    ("2024-02-14T12:00:00", "2024-02-14 17:30:00 IST"),
+    ("not a date", "not a date"),
+])
+def test_convert(utc, ist):
+    assert _convert(utc) == ist
+
+
+def test_to_ist_many_passes_empty_values_through():
+    assert to_ist_many([None, "", "2024-02-14T12:00:00Z"]) == [None, "", "2024-02-14 17:30:00 IST"]
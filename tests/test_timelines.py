@@ -0,0 +1,47 @@
+import uuid
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+def add_interactions(fake, lead_id: str, count: int):
+    for i in range(count):
+        row = fake._defaults("interactions", f"2026-01-01T00:00:{i:02d}.000000+00:00")
+        row.update(lead_id=lead_id, type="Note", summary=f"{lead_id[:4]} #{i}")
+        fake.interactions[row["id"]] = row
+
+
+async def test_timelines_are_grouped_per_lead_newest_first(api, fake):
+    fake.seed(3, interactions_per_lead=0)
+    busy, quiet, silent = sorted(fake.leads)
+    add_interactions(fake, busy, 5)
+    add_interactions(fake, quiet, 2)
+    response = await api.post("/interactions/timelines", json={"lead_ids": [busy, quiet, silent], "limit": 3})
+    timelines = response.json()["timelines"]
+    assert list(timelines) == [busy, quiet, silent]
+    assert [item["summary"] for item in timelines[busy]["interactions"]] == [f"{busy[:4]} #{i}" for i in (4, 3, 2)]
+    assert all(item["lead_id"] == busy for item in timelines[busy]["interactions"])
+    assert timelines[busy]["next_cursor"]
+    assert [item["summary"] for item in timelines[quiet]["interactions"]] == [f"{quiet[:4]} #{i}" for i in (1, 0)]
+    assert timelines[quiet]["next_cursor"] is None
+    assert timelines[silent] == {"interactions": [], "next_cursor": None}
+
+
+async def test_each_lead_pages_on_its_own_cursor(api, fake):
+    fake.seed(2, interactions_per_lead=0)
+    first, second = sorted(fake.leads)
+    add_interactions(fake, first, 5)
+    add_interactions(fake, second, 5)
+    page = (await api.post("/interactions/timelines", json={"lead_ids": [first, second], "limit": 2})).json()["timelines"]
+    cursors = {first: page[first]["next_cursor"]}
+    more = (await api.post("/interactions/timelines",
+                           json={"lead_ids": [first, second], "limit": 2, "cursors": cursors})).json()["timelines"]
+    assert [item["summary"] for item in more[first]["interactions"]] == [f"{first[:4]} #{i}" for i in (2, 1)]
+    assert more[second] == page[second]
+
+
+async def test_unknown_leads_get_an_empty_timeline(api, fake):
+    lead_id = str(uuid.uuid4())
+    timelines = (await api.post("/interactions/timelines", json={"lead_ids": [lead_id]})).json()["timelines"]
+    assert timelines == {lead_id: {"interactions": [], "next_cursor": None}}
@@ -0,0 +1,99 @@
+import uuid
+
+import pytest
+
+import transitions
+from models import LeadStatus
+from transitions import TRANSITIONS, can_transition, sources
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("current", list(LeadStatus))
+@pytest.mark.parametrize("target", list(LeadStatus))
+def test_can_transition_follows_the_table(current, target):
+    assert can_transition(current.value, target) == (target in TRANSITIONS[current])
+
+
+def test_a_lead_without_a_status_moves_like_new():
+    assert can_transition(None, LeadStatus.CONTACTED)
+    assert not can_transition(None, LeadStatus.WON)
+
+
+def test_won_is_final():
+    assert not any(LeadStatus.WON.value in sources(target) for target in LeadStatus)
+
+
+def test_sources_lists_every_status_that_may_move_to_the_target():
+    assert sources(LeadStatus.WON) == ["Met"]
+    assert sources(LeadStatus.NEW) == ["Lost"]
+
+
+def add_lead(fake, status) -> str:
+    lead_id = str(uuid.uuid4())
+    fake.leads[lead_id] = {"id": lead_id, "name": f"{status} lead", "status": status,
+                           "created_at": "2026-01-01T00:00:00+00:00", "updated_at": "2026-01-01T00:00:00+00:00"}
+    return lead_id
+
+
+async def test_bulk_status_update_reports_every_lead(api, fake):
+    new, contacted, won = add_lead(fake, "New"), add_lead(fake, "Contacted"), add_lead(fake, "Won")
+    missing = str(uuid.uuid4())
+    result = (await api.post("/leads/status", json={
+        "lead_ids": [new, contacted, won, missing], "status": "Contacted", "note": "called back",
+    })).json()
+
+    assert result["updated"] == 1
+    assert result["moved"] == [{"id": new, "from": "New"}]
+    assert result["unchanged"] == [contacted]
+    assert result["rejected"] == [{"id": won, "status": "Won"}]
+    assert result["not_found"] == [missing]
+    assert [fake.leads[lead_id]["status"] for lead_id in (new, contacted, won)] == ["Contacted", "Contacted", "Won"]
+    (note,) = fake.interactions.values()
+    assert (note["lead_id"], note["summary"]) == (new, "Status changed from New to Contacted: called back")
+
+
+async def test_unknown_status_is_a_validation_error(api, fake):
+    response = await api.post("/leads/status", json={"lead_ids": [str(uuid.uuid4())], "status": "Maybe"})
+    assert response.status_code == 422
+
+
+async def test_a_move_whose_response_was_lost_is_still_published(api, fake, monkeypatch):
+    lead_id = add_lead(fake, "New")
+    assert [lead["status"] for lead in (await api.get("/leads")).json()] == ["New"]
+
+    commit, calls = fake.rpc_transition_leads, []
+
+    def response_lost(**args):
+        calls.append(args)
+        result = commit(**args)
+        if len(calls) == 1:
+            raise ConnectionResetError("response lost after commit")
+        return result
+
+    monkeypatch.setattr(fake, "rpc_transition_leads", response_lost)
+    published = []
+    publish = transitions.publish
+
+    async def record(lead_ids, target):
+        published.append((lead_ids, target))
+        await publish(lead_ids, target)
+
+    monkeypatch.setattr(transitions, "publish", record)
+
+    result = (await api.post("/leads/status", json={"lead_ids": [lead_id], "status": "Contacted"})).json()
+    assert len(calls) == 2
+    assert (result["moved"], result["unchanged"], result["applied"]) == ([], [lead_id], [lead_id])
+    assert published == [([lead_id], LeadStatus.CONTACTED)]
+    # The cached page picked the move up without waiting for its TTL.
+    assert [lead["status"] for lead in (await api.get("/leads")).json()] == ["Contacted"]
+
+
+async def test_enrichment_leaves_a_lead_synced_as_meeting_in_meeting(api, fake):
+    response = await api.post("/sync", json={"leads": [
+        {"name": "Meeting Lead", "phone": "9876500001", "status": "Meeting", "notes": "HNI portfolio"},
+        {"name": "New Lead", "phone": "9876500002", "status": "New", "notes": "HNI portfolio"},
+    ]})
+    assert response.status_code == 200
+    statuses = {row["name"]: row["status"] for row in fake.leads.values()}
+    assert statuses == {"Meeting Lead": "Meeting", "New Lead": "Qualified"}
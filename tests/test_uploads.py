@@ -0,0 +1,95 @@
+import uuid
+
+import pytest
+
+import storage
+
+pytestmark = pytest.mark.anyio
+
+RECORDING = b"0123456789"
+
+
+@pytest.fixture
+def interaction(fake, monkeypatch):
+    monkeypatch.setattr(storage.get_storage(), "part_size", 4)
+    lead_id, interaction_id = str(uuid.uuid4()), str(uuid.uuid4())
+    fake.leads[lead_id] = {"id": lead_id, "name": "Recorded lead", "status": "New"}
+    fake.interactions[interaction_id] = {"id": interaction_id, "lead_id": lead_id, "type": "Call", "recording_url": None}
+    return fake.interactions[interaction_id]
+
+
+async def open_upload(api, interaction) -> str:
+    response = await api.post(f"/interactions/{interaction['id']}/recording",
+                              json={"size": len(RECORDING), "content_type": "audio/mpeg"})
+    assert response.status_code == 201, response.text
+    return response.json()["upload_id"]
+
+
+def append(api, upload_id: str, offset: int, body):
+    return api.patch(f"/uploads/{upload_id}", content=body, headers={"Upload-Offset": str(offset)})
+
+
+def saved_file(url: str) -> bytes:
+    with open(url.removeprefix("file://"), "rb") as f:
+        return f.read()
+
+
+async def test_upload_in_two_requests_sets_the_recording_url(api, interaction):
+    upload_id = await open_upload(api, interaction)
+    first = await append(api, upload_id, 0, RECORDING[:6])
+    assert (first.json()["offset"], first.json()["complete"]) == (6, False)
+    assert first.headers["Upload-Offset"] == "6"
+
+    done = (await append(api, upload_id, 6, RECORDING[6:])).json()
+    assert done["complete"] and done["offset"] == len(RECORDING)
+    assert interaction["recording_url"] == done["recording_url"]
+    assert saved_file(done["recording_url"]) == RECORDING
+
+
+async def test_wrong_offset_is_refused_with_the_current_one(api, interaction):
+    upload_id = await open_upload(api, interaction)
+    await append(api, upload_id, 0, RECORDING[:4])
+    response = await append(api, upload_id, 2, RECORDING[2:])
+    assert response.status_code == 409
+    assert response.headers["Upload-Offset"] == "4"
+
+
+async def test_broken_off_request_resumes_from_the_committed_offset(api, interaction):
+    upload_id = await open_upload(api, interaction)
+
+    async def dropped():
+        yield RECORDING[:6]
+        raise ConnectionResetError("client went away")
+
+    assert (await append(api, upload_id, 0, dropped())).json() == {"error": "client went away"}
+    # Only whole parts were committed, and the lease was let go.
+    status = (await api.get(f"/uploads/{upload_id}")).json()
+    assert (status["offset"], status["complete"]) == (4, False)
+
+    done = (await append(api, upload_id, 4, RECORDING[4:])).json()
+    assert done["complete"]
+    assert saved_file(done["recording_url"]) == RECORDING
+
+
+async def test_failed_attach_is_finished_by_an_empty_request(api, interaction, monkeypatch):
+    upload_id = await open_upload(api, interaction)
+    attach = storage.attach_recording
+
+    async def unreachable(interaction_id, url):
+        raise ConnectionError("database unreachable")
+
+    monkeypatch.setattr(storage, "attach_recording", unreachable)
+    failed = (await append(api, upload_id, 0, RECORDING)).json()
+    assert failed == {"error": "database unreachable"}
+    status = (await api.get(f"/uploads/{upload_id}")).json()
+    assert (status["offset"], status["complete"]) == (len(RECORDING), False)
+
+    monkeypatch.setattr(storage, "attach_recording", attach)
+    done = (await append(api, upload_id, len(RECORDING), b"")).json()
+    assert done["complete"]
+    assert interaction["recording_url"] == done["recording_url"]
+    assert saved_file(done["recording_url"]) == RECORDING
+
+
+async def test_unknown_upload_is_404(api, fake):
+    assert (await append(api, "missing", 0, b"x")).status_code == 404
@@ -0,0 +1,18 @@
+import pytest
+from pydantic.networks import validate_email
+
+import models
+from models import normalize_email
+
+ADDRESSES = ["Rahul.Sharma@Example.COM", "priya+sip@gmail.com", "Postmaster@example.com", "anand@bücher.de"]
+
+
+@pytest.mark.parametrize("address", ADDRESSES)
+def test_fast_path_matches_the_full_validator(address):
+    assert normalize_email(address) == validate_email(address)[1]
+
+
+@pytest.mark.parametrize("address", ADDRESSES)
+def test_without_email_validator_internals_every_address_takes_the_full_validator(address, monkeypatch):
+    monkeypatch.setattr(models, "_LOCAL_PART", None)
+    assert normalize_email(address) == validate_email(address)[1]
@@ -0,0 +1,51 @@
+import argparse
+import uuid
+
+import pytest
+
+import worker
+from cache import scoring_claims
+from jobs import SQLiteJobQueue
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteJobQueue(str(tmp_path / "jobs.db"))
+
+
+def options(**overrides) -> argparse.Namespace:
+    return argparse.Namespace(**{"batch_size": 10, "visibility_timeout": 60.0, "retry_delay": 0.0, **overrides})
+
+
+def add_lead(fake) -> str:
+    lead_id = str(uuid.uuid4())
+    fake.leads[lead_id] = {"id": lead_id, "name": "Queued Lead", "phone": "9876500003", "status": "New", "meta_data": {}}
+    return lead_id
+
+
+async def test_a_lead_another_worker_is_scoring_is_put_back_not_acked(fake, queue):
+    lead_id = add_lead(fake)
+    await scoring_claims.acquire([lead_id])
+    try:
+        queue.enqueue([lead_id])
+        assert await worker.process_batch(queue, options()) == 1
+        (job,) = queue.lease(10, 60.0)
+        assert job.payload == lead_id
+        # Putting it back didn't use up an attempt.
+        assert job.attempts == 1
+    finally:
+        await scoring_claims.release([lead_id])
+
+
+async def test_a_lead_already_scored_elsewhere_is_acked(fake, queue):
+    lead_id = add_lead(fake)
+    await scoring_claims.complete([lead_id])
+    try:
+        queue.enqueue([lead_id])
+        assert await worker.process_batch(queue, options()) == 1
+        assert queue.stats()["depth"] == 0
+        assert queue.lease(10, 60.0) == []
+    finally:
+        await scoring_claims.release([lead_id])
@@ -0,0 +1,51 @@
+"""
+UTC -> IST timestamp formatting for API responses.
+
+India has had a fixed +05:30 offset with no DST since 1945, so instead of
+a tz database lookup per value we shift by a constant offset. Results are
+memoised because a page of leads usually shares timestamps (a bulk sync
+stamps every row with the same now()).
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Iterable, List, Optional
+
+IST = timezone(timedelta(hours=5, minutes=30), "IST")
+IST_SHIFT = timedelta(hours=5, minutes=30)
+IST_CACHE_SIZE = int(os.environ.get("IST_CACHE_SIZE", "65536"))
+
+
+def _convert(utc_str: str) -> str:
+    # Fast path for what PostgREST sends: 2024-02-14T12:00:00.123+00:00.
+    # Shift the naive wall time; isoformat() beats strftime() by a wide margin.
+    # Seconds must be present: "2024-02-14T12:00+00:00" would cut to "...12:00+00".
+    if len(utc_str) > 19 and utc_str[19] in ".+Z" and (utc_str.endswith("+00:00") or utc_str.endswith("Z")):
+        try:
+            return (datetime.fromisoformat(utc_str[:19]) + IST_SHIFT).isoformat(" ") + " IST"
+        except ValueError:
+            pass
+    try:
+        dt = datetime.fromisoformat(utc_str.replace("Z", "+00:00"))
+    except (TypeError, ValueError):
+        return utc_str
+    if dt.tzinfo is None:
+        # timestamptz values always carry an offset; read a bare one as UTC, not server local time.
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(IST).replace(tzinfo=None, microsecond=0).isoformat(" ") + " IST"
+
+
+@lru_cache(maxsize=IST_CACHE_SIZE)
+def to_ist(utc_str: Optional[str]) -> Optional[str]:
+    """Converts a UTC ISO string to an IST string. Unparseable values are returned unchanged."""
+    if not utc_str or not isinstance(utc_str, str):
+        return utc_str
+    return _convert(utc_str)
+
+
+def to_ist_many(values: Iterable[Optional[str]]) -> List[Optional[str]]:
+    """
+    Converts a whole column at once. map() over the C-level lru_cache keeps
+    the per-value overhead to a dict lookup for repeated timestamps.
+    """
+    return list(map(to_ist, values))
@@ -0,0 +1,53 @@
+"""
+Interaction timelines for many leads in one round trip.
+
+The interaction_timelines RPC in schema.sql walks the (lead_id, date, id)
+index once per requested lead and returns each lead's newest interactions,
+so N histories cost one request, not N. Each lead pages on its own with a
+(date, id) cursor, newest first.
+
+interaction_summaries is the light version embedded in /leads: how many
+interactions a lead has and what the latest one was.
+"""
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import rest
+from pagination import decode_cursor, split_page
+
+TIMELINE_PAGE_SIZE = 20
+INTERACTION_KEYS = ("date", "id")
+
+
+async def fetch_timelines(lead_ids: List[str], limit: int = TIMELINE_PAGE_SIZE,
+                          cursors: Optional[Dict[str, str]] = None) -> Dict[str, Tuple[List[dict], Optional[str]]]:
+    """
+    {lead_id: (interactions, next_cursor)} for every requested lead, newest
+    first. `cursors` continues individual leads from a previous page.
+    """
+    decoded = {lead_id: decode_cursor(cursor, INTERACTION_KEYS) for lead_id, cursor in (cursors or {}).items()}
+    response = await rest.get_client().post(
+        rest.rest_url("rpc/interaction_timelines"),
+        headers=rest.auth_headers(),
+        # One extra row per lead tells us whether that lead has another page.
+        json={"lead_ids": lead_ids, "per_lead": limit + 1, "cursors": decoded},
+    )
+    if response.status_code != 200:
+        raise Exception(response.text)
+
+    grouped: Dict[str, List[dict]] = defaultdict(list)
+    for interaction in response.json():
+        grouped[interaction["lead_id"]].append(interaction)
+    return {lead_id: split_page(grouped.get(lead_id, []), limit, INTERACTION_KEYS) for lead_id in lead_ids}
+
+
+async def fetch_summaries(lead_ids: List[str]) -> Dict[str, dict]:
+    """{lead_id: {total, last_type, last_date, last_summary}}; leads without interactions have total 0."""
+    if not lead_ids:
+        return {}
+    response = await rest.get_client().post(
+        rest.rest_url("rpc/interaction_summaries"), headers=rest.auth_headers(), json={"lead_ids": lead_ids},
+    )
+    if response.status_code != 200:
+        raise Exception(response.text)
+    return {row.pop("lead_id"): row for row in response.json()}
@@ -0,0 +1,111 @@
+"""
+Lead status state machine, and bulk status changes through one RPC.
+
+Every status change (POST /leads/status, and the scorer qualifying leads)
+is checked against TRANSITIONS:
+
+    New        -> Contacted, Qualified, Meeting, Lost
+    Contacted  -> Qualified, Meeting, Lost
+    Qualified  -> Contacted, Meeting, Lost
+    Meeting    -> Met, Qualified, Lost       (Qualified: rescheduled or no-show)
+    Met        -> Won, Meeting, Lost         (Meeting: a follow-up)
+    Won        -> (final)
+    Lost       -> New, Contacted             (reopened)
+
+A lead without a status counts as New. Sync sets a new lead's starting
+status; the machine governs what happens to it afterwards.
+
+The transition_leads RPC in schema.sql moves any number of leads to one
+status in a single statement. It updates only the leads whose current
+status is one of `allowed_from`, so the check and the write can't race.
+For each lead it moves, it writes a Note interaction. It reports every
+requested lead as moved, unchanged or rejected with its current status;
+ids it doesn't return don't exist. The RPC is retried like any idempotent
+request, so a lead reported unchanged may have been moved by an attempt
+whose response was lost; callers publish every lead now in the target
+status (`applied`), not only the ones this response says it moved.
+"""
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+import rest
+from cache import stats_cache
+from events import broker
+from lead_cache import lead_cache
+from models import LeadStatus
+from pipeline import pipeline_snapshot
+
+S = LeadStatus
+TRANSITIONS: Dict[LeadStatus, FrozenSet[LeadStatus]] = {
+    S.NEW: frozenset({S.CONTACTED, S.QUALIFIED, S.MEETING, S.LOST}),
+    S.CONTACTED: frozenset({S.QUALIFIED, S.MEETING, S.LOST}),
+    S.QUALIFIED: frozenset({S.CONTACTED, S.MEETING, S.LOST}),
+    S.MEETING: frozenset({S.MET, S.QUALIFIED, S.LOST}),
+    S.MET: frozenset({S.WON, S.MEETING, S.LOST}),
+    S.WON: frozenset(),
+    S.LOST: frozenset({S.NEW, S.CONTACTED}),
+}
+
+
+def can_transition(current: Optional[str], target: LeadStatus) -> bool:
+    return target in TRANSITIONS[LeadStatus.coerce(current)]
+
+
+def sources(target: LeadStatus) -> List[str]:
+    """Statuses a lead may move to `target` from."""
+    return sorted(status.value for status, targets in TRANSITIONS.items() if target in targets)
+
+
+async def transition(lead_ids: List[str], target: LeadStatus, note: Optional[str] = None, log: bool = True,
+                     allowed_from: Optional[Iterable[LeadStatus]] = None) -> dict:
+    """
+    Moves leads to `target` where the state machine allows it, in one
+    request. With `log`, each moved lead gets a Note interaction
+    ("Status changed from X to Y", plus `note`). `allowed_from` narrows
+    the statuses a lead may move from to those the caller names (still
+    within the state machine); leads in any other status are rejected.
+
+    Returns {"moved": [{"id", "from"}], "unchanged": [ids],
+    "rejected": [{"id", "status"}], "not_found": [ids], "applied": [ids]},
+    where `applied` is every lead now in `target` (moved or unchanged).
+    """
+    allowed = sources(target)
+    if allowed_from is not None:
+        narrowed = {status.value for status in allowed_from}
+        allowed = [status for status in allowed if status in narrowed]
+    response = await rest.request_with_retry(
+        "POST", rest.rest_url("rpc/transition_leads"), idempotent=True,
+        headers=rest.auth_headers(**{"Content-Type": "application/json"}),
+        json={
+            "lead_ids": lead_ids, "to_status": target.value, "allowed_from": allowed,
+            "note": note, "log": log,
+        },
+    )
+    if response.status_code != 200:
+        raise Exception(f"{response.status_code}: {response.text}")
+
+    result = {"moved": [], "unchanged": [], "rejected": [], "not_found": []}
+    found = set()
+    for row in response.json():
+        found.add(row["id"])
+        if row["outcome"] == "moved":
+            result["moved"].append({"id": row["id"], "from": row["from_status"]})
+        elif row["outcome"] == "unchanged":
+            result["unchanged"].append(row["id"])
+        else:
+            result["rejected"].append({"id": row["id"], "status": row["from_status"]})
+    result["not_found"] = [lead_id for lead_id in dict.fromkeys(lead_ids) if lead_id not in found]
+    result["applied"] = [change["id"] for change in result["moved"]] + result["unchanged"]
+    return result
+
+
+async def publish(lead_ids: List[str], target: LeadStatus):
+    """Brings this process's caches, and the dashboard, up to date with leads now in `target`."""
+    if not lead_ids:
+        return
+    pipeline_snapshot.set_status(lead_ids, target.value)
+    lead_cache.set_status(lead_ids, target.value)
+    await stats_cache.invalidate("stats")
+    broker.publish("lead.status_changed", {
+        "ids": lead_ids, "status": target.value, "pipeline_version": pipeline_snapshot.token,
+    })
+    broker.stats_changed()
@@ -1,8 +1,5 @@
-from rapidfuzz import fuzz
-from typing import List, Dict
-from database import supabase
+from typing import Optional
 import uuid
-import urllib.parse
 
 def normalize_phone(phone: str) -> str:
     """
@@ -13,68 +10,51 @@ def normalize_phone(phone: str) -> str:
         return ""
     return "".join(filter(str.isdigit, phone))
 
-def generate_meeting_link(lead_name: str) -> str:
-    """Generates a unique, branded meeting room."""
+def generate_meeting_link(lead_name: str, lead_id: Optional[str] = None) -> str:
+    """Generates a branded meeting room. With a lead_id the room is stable for that lead."""
     clean_name = "".join(filter(str.isalnum, lead_name))
-    return f"https://meet.jit.si/FinSync_{clean_name}_{str(uuid.uuid4())[:6]}"
+    suffix = uuid.uuid5(uuid.NAMESPACE_URL, f"finsync-meeting:{lead_id}") if lead_id else uuid.uuid4()
+    return f"https://meet.jit.si/FinSync_{clean_name}_{str(suffix)[:6]}"
 
 def calculate_lead_score(lead: dict) -> int:
-    """Ranks leads based on contact info and context clues."""
-    score = 0
-    if lead.get("email"): score += 10
-    if lead.get("phone"): score += 10
-    
-   
-    notes = (lead.get("notes") or "").lower()
-    high_intent = ["hni", "investment", "portfolio", "jito", "immediate"]
-    if any(word in notes for word in high_intent):
-        score += 30
-    return score
+    """Ranks leads based on contact info and context clues (see scoring_rules.json)."""
+    return get_engine().score(lead).score
 
-import httpx
-import os
+from scoring import get_engine
+from cache import scoring_claims
 
-def process_leads_background(new_leads: list[dict]):
-    """
-    Handles enrichment and scoring in a background threadpool.
+# Lead fields the pipeline reads; /sync and the worker fetch exactly these.
+SCORING_FIELDS = "id,name,email,phone,company,role,notes,status,meta_data"
+
+async def process_leads_background(new_leads: list[dict]) -> dict:
     """
-    SUPABASE_URL = os.environ.get("SUPABASE_URL")
-    SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
-    headers = {
-        "apikey": SUPABASE_KEY,
-        "Authorization": f"Bearer {SUPABASE_KEY}",
-        "Content-Type": "application/json"
-    }
+    Runs a batch of freshly synced leads through the enrichment pipeline
+    (see enrichment.py): dedupe, providers, scoring, then bulk writes.
 
-    with httpx.Client(timeout=30.0) as client:
-        for lead in new_leads:
-            try:
-                
-                score = calculate_lead_score(lead)
-                lead_name = lead.get("name") or "Unknown"
-                print(f"[Background] Scoring {lead_name}: {score}")
-                
-                
-                if score >= 40:
-                    client.patch(
-                        f"{SUPABASE_URL}/rest/v1/leads?id=eq.{lead['id']}",
-                        headers=headers,
-                        json={"status": "Qualified"}
-                    )
-                
-                
-                client.post(
-                    f"{SUPABASE_URL}/rest/v1/interactions",
-                    headers=headers,
-                    json={
-                        "lead_id": lead["id"],
-                        "type": "Sync",
-                        "summary": f"Lead initially captured with score: {score}"
-                    }
-                )
-                
-                print(f"[Background] Success for {lead_name}")
-                
-            except Exception as e:
-                print(f"[Background] Error processing {lead.get('name') or 'unknown'}: {e}")
+    Batches that still fail after retries are reported (with their lead
+    IDs) in the returned summary instead of being dropped, along with the
+    per-stage throughput.
+
+    Leads already claimed by another worker (see cache.LeadClaims) are
+    skipped and counted as `claimed_elsewhere`, so each lead is enriched once.
+    Those whose claim is still running, rather than done, are listed in
+    `running_elsewhere`; their work may yet fail and need another go.
+    """
+    # enrichment imports dedup, which imports normalize_phone from here.
+    from enrichment import enrichment_pipeline
 
+    claimed = await scoring_claims.acquire([lead["id"] for lead in new_leads])
+    elsewhere = [lead["id"] for lead in new_leads if lead["id"] not in claimed]
+    running = await scoring_claims.running(elsewhere)
+    new_leads = [lead for lead in new_leads if lead["id"] in claimed]
+    try:
+        summary = await enrichment_pipeline.run(new_leads)
+    except BaseException:
+        await scoring_claims.release(list(claimed))
+        raise
+    failed = {lead_id for failure in summary["failures"] for lead_id in failure["lead_ids"]}
+    await scoring_claims.release([lead_id for lead_id in claimed if lead_id in failed])
+    await scoring_claims.complete([lead_id for lead_id in claimed if lead_id not in failed])
+    summary["claimed_elsewhere"] = len(elsewhere)
+    summary["running_elsewhere"] = sorted(running)
+    return summary
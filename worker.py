@@ -0,0 +1,105 @@
+"""
+Enrichment worker: drains the job queue filled by /sync.
+
+    ENRICHMENT_QUEUE=sqlite python worker.py --concurrency 4 --batch-size 100
+
+Each of the --concurrency loops leases a batch of lead IDs, reads those
+leads in one request and runs them through process_leads_background.
+Jobs whose leads fail are retried after --retry-delay seconds. Jobs whose
+worker dies reappear once --visibility-timeout expires; it defaults to a
+minute past SCORING_CLAIM_LEASE, so by then the dead worker's claims have
+lapsed. Jobs whose lead another worker is still scoring are put back for
+--retry-delay seconds without using up an attempt.
+"""
+import argparse
+import asyncio
+import logging
+import signal
+
+from dotenv import load_dotenv
+
+import rest
+from cache import scoring_claims
+from jobs import JobQueue, get_queue
+from logs import configure as configure_logging
+from utils import SCORING_FIELDS, process_leads_background
+
+load_dotenv()
+logger = logging.getLogger("worker")
+
+
+async def fetch_leads(lead_ids: list) -> list[dict]:
+    response = await rest.request_with_retry(
+        "GET", rest.rest_url("leads"), headers=rest.auth_headers(),
+        params={"id": f"in.({','.join(lead_ids)})", "select": SCORING_FIELDS},
+    )
+    if response.status_code != 200:
+        raise Exception(f"{response.status_code}: {response.text}")
+    return response.json()
+
+
+async def process_batch(queue: JobQueue, args) -> int:
+    jobs = await asyncio.to_thread(queue.lease, args.batch_size, args.visibility_timeout)
+    if not jobs:
+        return 0
+    try:
+        leads = await fetch_leads([job.payload for job in jobs])
+        summary = await process_leads_background(leads)
+    except Exception as e:
+        logger.warning("Batch of %d failed: %s", len(jobs), e)
+        await asyncio.to_thread(queue.fail, [job.id for job in jobs], str(e), args.retry_delay)
+        return len(jobs)
+
+    failed_ids = {lead_id for failure in summary["failures"] for lead_id in failure["lead_ids"]}
+    running_ids = set(summary["running_elsewhere"])
+    failed = [job.id for job in jobs if job.payload in failed_ids]
+    # The other worker may still fail these, so they come back later rather than being acked.
+    running = [job.id for job in jobs if job.payload in running_ids]
+    # Leads deleted since they were queued have nothing left to enrich, so they are acked too.
+    done = [job.id for job in jobs if job.payload not in failed_ids and job.payload not in running_ids]
+    if failed:
+        await asyncio.to_thread(queue.fail, failed, "; ".join(f["error"] for f in summary["failures"]), args.retry_delay)
+    if running:
+        await asyncio.to_thread(queue.delay, running, args.retry_delay)
+    await asyncio.to_thread(queue.ack, done)
+    return len(jobs)
+
+
+async def run(args):
+    queue = get_queue()
+    if queue is None:
+        raise SystemExit("ENRICHMENT_QUEUE is 'inline'; set it to 'sqlite' (or a JobQueue class) to run a worker.")
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    async def drain():
+        while not stopping.is_set():
+            if not await process_batch(queue, args):
+                try:
+                    await asyncio.wait_for(stopping.wait(), args.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    logger.info("Started with concurrency=%d batch_size=%d", args.concurrency, args.batch_size)
+    try:
+        await asyncio.gather(*(drain() for _ in range(args.concurrency)))
+    finally:
+        await rest.close_client()
+    logger.info("Stopped. Queue: %s", await asyncio.to_thread(queue.stats))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--visibility-timeout", type=float, default=scoring_claims.lease + 60)
+    parser.add_argument("--retry-delay", type=float, default=30.0)
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    args = parser.parse_args()
+    if args.visibility_timeout <= scoring_claims.lease:
+        parser.error(f"--visibility-timeout must be longer than SCORING_CLAIM_LEASE ({scoring_claims.lease:g}s)")
+    configure_logging()
+    asyncio.run(run(args))